@@ -35,6 +35,11 @@ if [[ "$1" = 'run_server' ]]; then
         sed -i '/servers:/!b;n;c- url: http://'${SWAGGER_HOST}'/' /code/swagger_server/swagger/swagger.yaml
     fi
 
+    # metrics of all uwsgi workers are kept in files here, start from scratch
+    export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/uis_metrics}
+    rm -rf ${PROMETHEUS_MULTIPROC_DIR}
+    mkdir -p ${PROMETHEUS_MULTIPROC_DIR}
+
     # run the server
     uwsgi --virtualenv ./venv --ini docker_uwsgi.ini
 else
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+"""
+Compare building 10k-item responses of PeopleLong, PeopleShort, SshKeyLong,
+SshKeyBastion and Preferences with the generated models and with their
+compact variants from swagger_server.models.compact: CPU time and memory
+held by the built lists (traced with tracemalloc).
+
+Run from the server directory with the same UIS_* environment as the server:
+    python -m benchmarks.bench_models [--count N] [--repeat R]
+"""
+import argparse
+import gc
+import timeit
+import tracemalloc
+
+from swagger_server.models.compact import CompactPeopleLong, CompactPeopleShort, CompactPreferences, \
+    CompactSshKeyBastion, CompactSshKeyLong
+from swagger_server.models.people_long import PeopleLong
+from swagger_server.models.people_short import PeopleShort
+from swagger_server.models.preferences import Preferences
+from swagger_server.models.ssh_key_bastion import SshKeyBastion
+from swagger_server.models.ssh_key_long import SshKeyLong
+
+PREFERENCES = {'show_email': True, 'show_name': True}
+
+
+def people_long(model, preferences_model, count: int):
+    return [model(uuid='00000000-0000-0000-0000-000000000000', name='Person', email='person@example.org',
+                  eppn='person@example.org', oidc_claim_sub='http://cilogon.org/serverA/users/1',
+                  bastion_login='person_0000001',
+                  prefs=preferences_model(settings=PREFERENCES, permissions=PREFERENCES, interests=PREFERENCES))
+            for _ in range(count)]
+
+
+def people_short(model, count: int):
+    return [model(uuid='00000000-0000-0000-0000-000000000000', name='Person', email='person@example.org',
+                  eppn='person@example.org', oidc_claim_sub='http://cilogon.org/serverA/users/1')
+            for _ in range(count)]
+
+
+def keys(model, count: int):
+    return [model(key_uuid='00000000-0000-0000-0000-000000000000', public_key='AAAAB3NzaC1yc2E',
+                  ssh_key_type='ssh-rsa', comment='key', description='key', fingerprint='MD5:ab',
+                  fabric_key_type='sliver', created_on='2022-01-01 00:00:00+00:00',
+                  expires_on='2022-07-01 00:00:00+00:00')
+            for _ in range(count)]
+
+
+def bastion_keys(model, count: int):
+    return [model(public_openssh='ssh-rsa AAAAB3NzaC1yc2E key', login='person_0000001',
+                  gecos='Person,,,,person@example.org', status='active')
+            for _ in range(count)]
+
+
+def preferences(model, count: int):
+    return [model(settings=PREFERENCES, permissions=PREFERENCES, interests=PREFERENCES) for _ in range(count)]
+
+
+def held_memory(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    built = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+    return size
+
+
+def run(count: int, repeat: int):
+    cases = (('PeopleLong', lambda: people_long(PeopleLong, Preferences, count),
+              lambda: people_long(CompactPeopleLong, CompactPreferences, count)),
+             ('PeopleShort', lambda: people_short(PeopleShort, count),
+              lambda: people_short(CompactPeopleShort, count)),
+             ('SshKeyLong', lambda: keys(SshKeyLong, count), lambda: keys(CompactSshKeyLong, count)),
+             ('SshKeyBastion', lambda: bastion_keys(SshKeyBastion, count),
+              lambda: bastion_keys(CompactSshKeyBastion, count)),
+             ('Preferences', lambda: preferences(Preferences, count), lambda: preferences(CompactPreferences, count)))
+    for name, generated, compact in cases:
+        # both must describe the same document
+        assert [m.to_dict() for m in generated()[0:10]] == [m.to_dict() for m in compact()[0:10]]
+        generated_time = min(timeit.repeat(generated, number=1, repeat=repeat))
+        compact_time = min(timeit.repeat(compact, number=1, repeat=repeat))
+        print(f'{count} x {name}: generated {generated_time * 1000:.1f} ms {held_memory(generated) / 1024:.0f} KiB, '
+              f'compact {compact_time * 1000:.1f} ms {held_memory(compact) / 1024:.0f} KiB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark building generated and compact UIS models')
+    parser.add_argument('--count', type=int, default=10000, help='number of models in each list')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs, the fastest is reported')
+    args = parser.parse_args()
+    run(args.count, args.repeat)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+"""
+Compare serializing lists of PeopleShort, SshKeyLong and SshKeyBastion with
+the original JSONEncoder.default path and with swagger_server.encoder.JSONEncoder
+(with orjson when it is installed, and with the standard library fallback).
+
+Run from the server directory with the same UIS_* environment as the server:
+    python -m benchmarks.bench_serialization [--count N] [--repeat R]
+"""
+import argparse
+import json
+import timeit
+from unittest import mock
+
+import six
+from connexion.apps.flask_app import FlaskJSONEncoder
+
+from swagger_server import encoder
+from swagger_server.models.base_model_ import Model
+from swagger_server.models.people_short import PeopleShort
+from swagger_server.models.ssh_key_bastion import SshKeyBastion
+from swagger_server.models.ssh_key_long import SshKeyLong
+
+
+class DefaultJSONEncoder(FlaskJSONEncoder):
+    """
+    The encoder as it was: the standard library encoder calling default() per model
+    """
+    include_nulls = False
+
+    def default(self, o):
+        if isinstance(o, Model):
+            dikt = {}
+            for attr, _ in six.iteritems(o.swagger_types):
+                value = getattr(o, attr)
+                if value is None and not self.include_nulls:
+                    continue
+                attr = o.attribute_map[attr]
+                dikt[attr] = value
+            return dikt
+        return FlaskJSONEncoder.default(self, o)
+
+
+def people(count: int):
+    return [PeopleShort(uuid=f'{i:08d}-0000-0000-0000-000000000000', name=f'Person {i}',
+                        email=f'person{i}@example.org', eppn=f'person{i}@example.org',
+                        oidc_claim_sub=f'http://cilogon.org/serverA/users/{i}') for i in range(count)]
+
+
+def keys(count: int):
+    return [SshKeyLong(key_uuid=f'{i:08d}-0000-0000-0000-000000000000', public_key='AAAAB3NzaC1yc2E' + 'A' * 360,
+                       ssh_key_type='ssh-rsa', comment=f'key {i}', description=f'key number {i}',
+                       fingerprint='MD5:' + ':'.join(['ab'] * 16), fabric_key_type='sliver',
+                       created_on='2022-01-01 00:00:00+00:00', expires_on='2022-07-01 00:00:00+00:00')
+            for i in range(count)]
+
+
+def bastion_keys(count: int):
+    return [SshKeyBastion(public_openssh='ssh-rsa AAAAB3NzaC1yc2E' + 'A' * 360 + f' key{i}',
+                          login=f'person_{i:07d}', gecos=f'Person {i},,,,person{i}@example.org', status='active')
+            for i in range(count)]
+
+
+def run(count: int, repeat: int):
+    cases = (('PeopleShort', people(count)), ('SshKeyLong', keys(count)), ('SshKeyBastion', bastion_keys(count)))
+    for name, items in cases:
+        # the new encoder must produce the same document
+        assert json.loads(json.dumps(items, cls=DefaultJSONEncoder)) == json.loads(
+            json.dumps(items, cls=encoder.JSONEncoder))
+        default_time = min(timeit.repeat(lambda: json.dumps(items, cls=DefaultJSONEncoder),
+                                         number=1, repeat=repeat))
+        with mock.patch.object(encoder, 'orjson', None):
+            fallback_time = min(timeit.repeat(lambda: json.dumps(items, cls=encoder.JSONEncoder),
+                                              number=1, repeat=repeat))
+        print(f'{count} x {name}: default() {default_time * 1000:.1f} ms, '
+              f'extractors + json {fallback_time * 1000:.1f} ms', end='')
+        if encoder.orjson is not None:
+            fast_time = min(timeit.repeat(lambda: json.dumps(items, cls=encoder.JSONEncoder),
+                                          number=1, repeat=repeat))
+            print(f', extractors + orjson {fast_time * 1000:.1f} ms', end='')
+        print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark JSON serialization of UIS models')
+    parser.add_argument('--count', type=int, default=10000, help='number of models in each list')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs, the fastest is reported')
+    args = parser.parse_args()
+    run(args.count, args.repeat)
@@ -10,6 +10,14 @@ from fss_utils.jwt_validate import ValidateCode, JWTValidator
 from swagger_server.database import metadata
 from swagger_server.database import DISABLE_DATABASE, engine
 from swagger_server.database.load_data import load_people_data, load_version_data
+from swagger_server.database.migrations import run_migrations
+from swagger_server.database.request_session import init_request_sessions
+from swagger_server.instrumentation.sql import init_sql_instrumentation
+from swagger_server.instrumentation.metrics import init_metrics, instrument_comanage
+from swagger_server.instrumentation.timing import init_server_timing, timed_phase_calls, JWT_PHASE, \
+    SERVER_TIMING_OFF, SERVER_TIMING_ON, SERVER_TIMING_ADMIN
+from swagger_server.instrumentation.tracing import init_tracing, traced_calls, EXPORTER_NONE
+from swagger_server.instrumentation.profiling import init_profiling
 
 from .config import config_from_file, config_from_env
 
@@ -67,6 +75,8 @@ if not SKIP_CILOGON_VALIDATION:
                                  refresh_period=datetime.timedelta(hours=t.hour,
                                                                    minutes=t.minute,
                                                                    seconds=t.second))
+    jwt_validator.validate_jwt = timed_phase_calls(JWT_PHASE, traced_calls('validate_jwt',
+                                                                           jwt_validator.validate_jwt))
 else:
     jwt_validator = None
 
@@ -85,14 +95,14 @@ CO_NAME = app_params.get("co_name")
 # SSH Key Authenticator ID
 CO_SSH_AUTHENTICATOR_ID = app_params.get("co_ssh_authenticator_id")
 
-co_api = ComanageApi(
+co_api = instrument_comanage(ComanageApi(
     co_api_url=CO_REGISTRY_URL,
     co_api_user=COAPI_USER,
     co_api_pass=COAPI_KEY,
     co_api_org_id=COID,
     co_api_org_name=CO_NAME,
     co_ssh_key_authenticator_id=CO_SSH_AUTHENTICATOR_ID
-)
+))
 
 # get SSH key parameters
 SSH_KEY_ALGORITHM = "rsa"  # can use 'rsa' or 'ecdsa'
@@ -114,6 +124,64 @@ if app_params.get('ssh_garbage_collect_after_days', None) is not None:
     SSH_GARBAGE_COLLECT_AFTER_DAYS = int(app_params.get('ssh_garbage_collect_after_days'))
 if app_params.get('ssh_key_secret', None) is not None:
     SSH_KEY_SECRET = app_params.get('ssh_key_secret')
+# shared secret of services retrieving sliver keys of many users, /sliverkeys is disabled without it
+SLIVER_KEYS_SECRET = None
+if app_params.get('sliver_keys_secret', None) is not None:
+    SLIVER_KEYS_SECRET = app_params.get('sliver_keys_secret')
+
+# maximum number of changes returned by a single /bastionkeys/feed call
+BASTION_FEED_LIMIT = 1000
+if app_params.get('bastion_feed_limit', None) is not None:
+    BASTION_FEED_LIMIT = int(app_params.get('bastion_feed_limit'))
+log.info(f'Using a limit of {BASTION_FEED_LIMIT} changes per /bastionkeys/feed call')
+
+# longest a /bastionkeys/feed call may block waiting for changes (long poll)
+BASTION_FEED_MAX_WAIT = 30
+if app_params.get('bastion_feed_max_wait', None) is not None:
+    BASTION_FEED_MAX_WAIT = int(app_params.get('bastion_feed_max_wait'))
+
+# number of SQL statements a single request can run before a warning is logged
+QUERY_BUDGET = 25
+if app_params.get('query_budget', None) is not None:
+    QUERY_BUDGET = int(app_params.get('query_budget'))
+log.info(f'Warning about requests running more than {QUERY_BUDGET} SQL statements')
+
+# SQL statements taking longer than this many milliseconds are logged
+SLOW_QUERY_MS = 200
+if app_params.get('slow_query_ms', None) is not None:
+    SLOW_QUERY_MS = int(app_params.get('slow_query_ms'))
+
+# OIDC claim subs (comma-separated) of administrators allowed to see diagnostics
+ADMIN_OIDC_CLAIM_SUBS = set()
+if app_params.get('admin_oidc_claim_subs', None) is not None:
+    ADMIN_OIDC_CLAIM_SUBS = {sub.strip() for sub in app_params.get('admin_oidc_claim_subs').split(',')
+                             if sub.strip() != ''}
+
+# add Server-Timing header to every response ('on'), only for administrators ('admin') or not at all ('off')
+SERVER_TIMING = SERVER_TIMING_OFF
+if app_params.get('server_timing', None) == SERVER_TIMING_ON:
+    SERVER_TIMING = SERVER_TIMING_ON
+elif app_params.get('server_timing', None) == SERVER_TIMING_ADMIN:
+    SERVER_TIMING = SERVER_TIMING_ADMIN
+log.info(f'Server-Timing headers are {SERVER_TIMING}')
+
+# OpenTelemetry exporter: 'none', 'console', 'file' (UIS_OTEL_FILE), 'otlp' (OTEL_EXPORTER_OTLP_* variables)
+# or 'memory' (tests)
+OTEL_EXPORTER = EXPORTER_NONE
+if app_params.get('otel_exporter', None) is not None:
+    OTEL_EXPORTER = app_params.get('otel_exporter')
+OTEL_FILE = app_params.get('otel_file', None)
+
+# profile requests into this directory (disabled if not set)
+PROFILE_DIR = app_params.get('profile_dir', None)
+# fraction of requests profiled, others only on request by administrators
+PROFILE_SAMPLE_RATE = 0.0
+if app_params.get('profile_sample_rate', None) is not None:
+    PROFILE_SAMPLE_RATE = float(app_params.get('profile_sample_rate'))
+# number of most recent profiles kept per API operation
+PROFILE_KEEP = 20
+if app_params.get('profile_keep', None) is not None:
+    PROFILE_KEEP = int(app_params.get('profile_keep'))
 
 # for testing e.g. comanage code we don't need the database running
 if not DISABLE_DATABASE:
@@ -123,6 +191,9 @@ if not DISABLE_DATABASE:
     # create tables (should be idempotent)
     log.info("Creating database tables")
     metadata.create_all(engine)
+    # bring tables created by earlier versions up to date
+    log.info("Applying database migrations")
+    run_migrations()
 
     # load version data
     log.info("Loading version table")
@@ -135,4 +206,14 @@ load_people_data(LOAD_USER_DATA)
 # Flask initialization for uwsgi (so it can find swagger_server:app)
 app = connexion.App(__name__, specification_dir='./swagger/')
 app.app.json_encoder = encoder.JSONEncoder
+init_tracing(app.app, OTEL_EXPORTER, OTEL_FILE)
+init_sql_instrumentation(app.app, SLOW_QUERY_MS)
+init_metrics(app.app)
+# utils needs the configuration above, so it can only be imported at this point
+from swagger_server.response_code.utils import is_admin_user
+init_server_timing(app.app, SERVER_TIMING, is_admin_user)
+init_profiling(app.app, PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_KEEP, is_admin_user)
+# Flask runs after_request hooks in reverse order, so register this last for the commit to
+# run before the hooks above report SQL statements and time
+init_request_sessions(app.app, QUERY_BUDGET)
 app.add_api('swagger.yaml', arguments={'title': 'FABRIC User Information Service'}, pythonic_params=True)
@@ -6,6 +6,17 @@ from swagger_server import util
 import swagger_server.response_code.default_controller as dc
 
 
+def metrics_get():  # noqa: E501
+    """metrics (open)
+
+    Prometheus metrics of all server processes # noqa: E501
+
+
+    :rtype: str
+    """
+    return dc.metrics_get()
+
+
 def version_get():  # noqa: E501
     """version (open)
 
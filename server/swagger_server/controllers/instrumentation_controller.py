@@ -0,0 +1,45 @@
+import connexion
+import six
+
+from swagger_server.models.memory_snapshot import MemorySnapshot  # noqa: E501
+from swagger_server import util
+import swagger_server.response_code.instrumentation_controller as ic
+
+
+def instrumentation_tracemalloc_snapshot_get(limit=None, group_by=None):  # noqa: E501
+    """take a snapshot of memory allocations in the worker answering the request (open only to administrators)
+
+    Top allocation sites and their difference to the previous snapshot of the worker # noqa: E501
+
+    :param limit: number of allocation sites returned
+    :type limit: int
+    :param group_by: group allocations by line, file or traceback
+    :type group_by: str
+
+    :rtype: MemorySnapshot
+    """
+    return ic.instrumentation_tracemalloc_snapshot_get(limit, group_by)
+
+
+def instrumentation_tracemalloc_start_post(frames=None):  # noqa: E501
+    """start tracing memory allocations in the worker answering the request (open only to administrators)
+
+    Start tracemalloc in the worker # noqa: E501
+
+    :param frames: number of frames kept per allocation
+    :type frames: int
+
+    :rtype: MemorySnapshot
+    """
+    return ic.instrumentation_tracemalloc_start_post(frames)
+
+
+def instrumentation_tracemalloc_stop_post():  # noqa: E501
+    """stop tracing memory allocations in the worker answering the request (open only to administrators)
+
+    Stop tracemalloc in the worker # noqa: E501
+
+
+    :rtype: MemorySnapshot
+    """
+    return ic.instrumentation_tracemalloc_stop_post()
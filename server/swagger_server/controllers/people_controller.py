@@ -3,6 +3,7 @@ import six
 
 from swagger_server.models.people_long import PeopleLong  # noqa: E501
 from swagger_server.models.people_short import PeopleShort  # noqa: E501
+from swagger_server.models.preference_type import PreferenceType  # noqa: E501
 from swagger_server import util
 import swagger_server.response_code.people_controller as pc
 
@@ -20,28 +21,53 @@ def people_get(person_name=None):  # noqa: E501
     return pc.people_get(person_name)
 
 
-def people_uuid_get(uuid):  # noqa: E501
+def people_preferences_preftype_get(preftype, contains, offset=None, limit=None):  # noqa: E501
+    """people whose preferences of a type contain a JSON value (interests open to any active user, settings only to administrators)
+
+    Reverse lookup over preferences, e.g. who follows a project # noqa: E501
+
+    :param preftype: 
+    :type preftype: dict | bytes
+    :param contains: JSON object the preferences must contain, e.g. {&quot;projects&quot;: [&quot;&lt;project uuid&gt;&quot;]}
+    :type contains: str
+    :param offset: Number of matching people to skip
+    :type offset: int
+    :param limit: Maximum number of people to return
+    :type limit: int
+
+    :rtype: List[PeopleShort]
+    """
+    return pc.people_preferences_preftype_get(preftype, contains, offset, limit)
+
+
+def people_uuid_get(uuid, fields=None):  # noqa: E501
     """person details by UUID (open only to self)
 
     Person details by UUID # noqa: E501
 
     :param uuid: People identifier as UUID
     :type uuid: str
+    :param fields: Attributes to return (comma-separated), all of them if not given
+    :type fields: List[str]
 
     :rtype: PeopleLong
     """
-    return pc.people_uuid_get(uuid)
+    return pc.people_uuid_get(uuid, fields)
 
 
-def people_whoami_get():  # noqa: E501
+def people_whoami_get(fields=None, include=None):  # noqa: E501
     """Details about self from OIDC Claim sub provided in ID token; Creates new entry; (open only to self)
 
     Details about self based on key OIDC Claim sub contained in ID token; Creates new entry # noqa: E501
 
+    :param fields: Attributes to return (comma-separated), all of them if not given
+    :type fields: List[str]
+    :param include: Related resources to include in the response (comma-separated), preferences and/or active SSH keys
+    :type include: List[str]
 
     :rtype: List[PeopleLong]
     """
-    return pc.people_whoami_get()
+    return pc.people_whoami_get(fields, include)
 
 
 def uuid_oidc_claim_sub_get(oidc_claim_sub):  # noqa: E501
@@ -43,6 +43,23 @@ def preferences_preftype_uuid_put(uuid, preftype, preferences):  # noqa: E501
     return pc.preferences_preftype_uuid_put(uuid, preftype, preferences)
 
 
+def preferences_preftype_uuid_patch(body, uuid, preftype):  # noqa: E501
+    """merge changes into user preferences by type (open only to self)
+
+    Top-level keys of the body are added or replaced, keys set to null are removed. Returns the merged preferences # noqa: E501
+
+    :param body: 
+    :type body: Dict[str, ]
+    :param uuid: 
+    :type uuid: str
+    :param preftype: 
+    :type preftype: dict | bytes
+
+    :rtype: object
+    """
+    return pc.preferences_preftype_uuid_patch(uuid, preftype, body)
+
+
 def preferences_uuid_get(uuid):  # noqa: E501
     """get all user preferences as an object (open only to self)
 
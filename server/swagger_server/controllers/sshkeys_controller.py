@@ -2,13 +2,31 @@ import connexion
 import six
 
 from swagger_server.models.ssh_key_bastion import SshKeyBastion  # noqa: E501
+from swagger_server.models.ssh_key_bastion_feed import SshKeyBastionFeed  # noqa: E501
 from swagger_server.models.ssh_key_long import SshKeyLong  # noqa: E501
 from swagger_server.models.ssh_key_pair import SshKeyPair  # noqa: E501
 from swagger_server.models.ssh_key_type import SshKeyType  # noqa: E501
+from swagger_server.models.ssh_key_upload import SshKeyUpload  # noqa: E501
+from swagger_server.models.ssh_key_upload_result import SshKeyUploadResult  # noqa: E501
 import swagger_server.response_code.sshkey_controller as sc
 
 
-def bastionkeys_get(secret, since_date):  # noqa: E501
+def authorizedkeys_login_get(secret, login):  # noqa: E501
+    """Get authorized_keys lines of active bastion keys of a login for sshd AuthorizedKeysCommand (open to Bastion hosts)
+
+     # noqa: E501
+
+    :param secret: 
+    :type secret: str
+    :param login: 
+    :type login: str
+
+    :rtype: str
+    """
+    return sc.authorizedkeys_login_get(secret, login)
+
+
+def bastionkeys_get(secret, since_date, logins=None, shard=None, shards=None):  # noqa: E501
     """Get a list of bastion keys that were created, deactivated or expired since specified date in UTC (open to Bastion hosts)
 
      # noqa: E501
@@ -17,10 +35,75 @@ def bastionkeys_get(secret, since_date):  # noqa: E501
     :type secret: str
     :param since_date: 
     :type since_date: str
+    :param logins: Only return keys of these bastion logins
+    :type logins: List[str]
+    :param shard: Only return keys of logins in this hash partition (between 0 and shards - 1)
+    :type shard: int
+    :param shards: Number of hash partitions of logins, a power of 2
+    :type shards: int
 
     :rtype: List[SshKeyBastion]
     """
-    return sc.bastionkeys_get(secret, since_date)
+    return sc.bastionkeys_get(secret, since_date, logins, shard, shards)
+
+
+def bastionkeys_feed_get(secret, cursor=None, limit=None, wait=None, logins=None, shard=None, shards=None):  # noqa: E501
+    """Get bastion keys that were created, deactivated or expired after the provided cursor, in the order of changes (open to Bastion hosts)
+
+     # noqa: E501
+
+    :param secret: 
+    :type secret: str
+    :param cursor: Opaque cursor returned as next_cursor by the previous call. Omit to start from the beginning
+    :type cursor: str
+    :param limit: Maximum number of changes to return
+    :type limit: int
+    :param wait: If there are no changes, wait up to this many seconds for one before returning
+    :type wait: int
+    :param logins: Only return keys of these bastion logins
+    :type logins: List[str]
+    :param shard: Only return keys of logins in this hash partition (between 0 and shards - 1)
+    :type shard: int
+    :param shards: Number of hash partitions of logins, a power of 2
+    :type shards: int
+
+    :rtype: SshKeyBastionFeed
+    """
+    return sc.bastionkeys_feed_get(secret, cursor, limit, wait, logins, shard, shards)
+
+
+def bastionkeys_snapshot_get(secret, logins=None, shard=None, shards=None):  # noqa: E501
+    """Get all active bastion keys as of a single point in the change feed, gzip-compressed if accepted, with the feed cursor to continue from (open to Bastion hosts)
+
+     # noqa: E501
+
+    :param secret: 
+    :type secret: str
+    :param logins: Only return keys of these bastion logins
+    :type logins: List[str]
+    :param shard: Only return keys of logins in this hash partition (between 0 and shards - 1)
+    :type shard: int
+    :param shards: Number of hash partitions of logins, a power of 2
+    :type shards: int
+
+    :rtype: SshKeyBastionFeed
+    """
+    return sc.bastionkeys_snapshot_get(secret, logins, shard, shards)
+
+
+def sliverkeys_post(body, secret):  # noqa: E501
+    """Get active sliver keys of many users at once as a map of user UUID to a list of keys (open to services with the sliver keys secret)
+
+     # noqa: E501
+
+    :param body: 
+    :type body: List[str]
+    :param secret: 
+    :type secret: str
+
+    :rtype: Dict[str, List[SshKeyLong]]
+    """
+    return sc.sliverkeys_post(body, secret)
 
 
 def sshkey_keyid_delete(keyid):  # noqa: E501
@@ -36,17 +119,19 @@ def sshkey_keyid_delete(keyid):  # noqa: E501
     return sc.sshkeys_keyid_delete(keyid)
 
 
-def sshkey_keyid_get(keyid):  # noqa: E501
+def sshkey_keyid_get(keyid, fields=None):  # noqa: E501
     """get metadata, including expiration date for this key based on key UUID (open only to self)
 
      # noqa: E501
 
     :param keyid: 
     :type keyid: str
+    :param fields: Attributes to return (comma-separated), all of them if not given
+    :type fields: List[str]
 
     :rtype: SshKeyLong
     """
-    return sc.sshkey_keyid_get(keyid)
+    return sc.sshkey_keyid_get(keyid, fields)
 
 
 def sshkey_keytype_post(keytype, public_openssh, description):  # noqa: E501
@@ -87,7 +172,7 @@ def sshkey_keytype_put(keytype, comment, description):  # noqa: E501
     return sc.sshkeys_keytype_put(keytype, comment, description)
 
 
-def sshkey_uuid_keyid_get(uuid, keyid):  # noqa: E501
+def sshkey_uuid_keyid_get(uuid, keyid, fields=None):  # noqa: E501
     """Get a specific key of a given user (open to any valid user)
 
      # noqa: E501
@@ -96,18 +181,37 @@ def sshkey_uuid_keyid_get(uuid, keyid):  # noqa: E501
     :type uuid: str
     :param keyid: 
     :type keyid: str
+    :param fields: Attributes to return (comma-separated), all of them if not given
+    :type fields: List[str]
 
     :rtype: List[SshKeyLong]
     """
-    return sc.sshkey_uuid_keyid_get(uuid, keyid)
+    return sc.sshkey_uuid_keyid_get(uuid, keyid, fields)
 
 
-def sshkeys_get():  # noqa: E501
+def sshkeys_get(fields=None):  # noqa: E501
     """Get a list of all active/non-expired keys of this user (open to self)
 
      # noqa: E501
 
+    :param fields: Attributes to return (comma-separated), all of them if not given
+    :type fields: List[str]
 
     :rtype: List[SshKeyLong]
     """
-    return sc.sshkeys_get()
+    return sc.sshkeys_get(fields)
+
+
+def sshkeys_post(body):  # noqa: E501
+    """Add multiple user-provided ssh public keys of specified types in one request. Returns per-key results. (open only to self)
+
+     # noqa: E501
+
+    :param body: 
+    :type body: list | bytes
+
+    :rtype: List[SshKeyUploadResult]
+    """
+    if connexion.request.is_json:
+        body = [SshKeyUpload.from_dict(d) for d in connexion.request.get_json()]  # noqa: E501
+    return sc.sshkeys_post(body)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+import os
+import select
+import threading
+import time
+from typing import Callable
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from . import POSTGRES_ENGINE, log
+
+"""
+Postgres LISTEN/NOTIFY support for long-polling bastion agents. A trigger
+on fabric_sshkeys (see migrations) notifies BASTION_KEY_CHANNEL whenever
+a bastion key gets a new change_seq. Each worker process keeps a single
+LISTEN connection, in a background thread, shared by all waiting requests.
+"""
+
+BASTION_KEY_CHANNEL = 'bastion_key_changes'
+# how often the listener wakes up to check its connection is still alive
+LISTENER_KEEPALIVE_SECONDS = 60
+# how long to wait before reconnecting after the listener connection failed
+LISTENER_RECONNECT_SECONDS = 5
+
+
+class KeyChangeListener:
+    """
+    Counts notifications received on a channel and lets request threads block
+    until the count moves. Take generation() before reading the data, then
+    wait() on it so that changes made in between are not missed.
+    Subscribers are called from the listener thread instead, after every
+    notification and keepalive.
+    """
+
+    def __init__(self, channel: str):
+        self._channel = channel
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._subscribers = list()
+        self._thread = None
+        self._pid = None
+
+    def subscribe(self, callback: Callable[[], None]):
+        """
+        Call callback from the listener thread whenever notified, on (re)connect
+        and on every keepalive. Callbacks must not raise and should be quick.
+        """
+        with self._condition:
+            self._subscribers.append(callback)
+
+    def generation(self) -> int:
+        """
+        Current notification count. Starts the listener thread in this process if needed.
+        """
+        with self._condition:
+            # threads do not survive a fork, so check the thread belongs to this process
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._listen, name=f'listener-{self._channel}',
+                                                daemon=True)
+                self._thread.start()
+            return self._generation
+
+    def wait(self, generation: int, timeout: float) -> bool:
+        """
+        Block until a notification arrives after generation was taken, or until timeout.
+        Return True if notified, False on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._generation != generation, timeout)
+
+    def _notify_waiters(self):
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+        self._notify_subscribers()
+
+    def _notify_subscribers(self):
+        with self._condition:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback()
+            except Exception as e:
+                log.error(f'Subscriber of {self._channel} failed due to {e}')
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(POSTGRES_ENGINE)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self._channel}')
+                log.info(f'Listening for notifications on {self._channel} in process {os.getpid()}')
+                # anything could have changed while we weren't listening
+                self._notify_waiters()
+                while True:
+                    if select.select([conn], [], [], LISTENER_KEEPALIVE_SECONDS) == ([], [], []):
+                        # nothing happened, make sure the connection is still there
+                        with conn.cursor() as cursor:
+                            cursor.execute('SELECT 1')
+                        # lets subscribers retry after a failure
+                        self._notify_subscribers()
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self._notify_waiters()
+            except (Exception, psycopg2.DatabaseError) as e:
+                log.error(f'Listener on {self._channel} failed due to {e}, reconnecting')
+            finally:
+                if conn is not None:
+                    conn.close()
+            time.sleep(LISTENER_RECONNECT_SECONDS)
+
+
+bastion_key_listener = KeyChangeListener(BASTION_KEY_CHANNEL)
@@ -34,7 +34,8 @@ from ldap3 import Connection, Server, ALL
 from fss_utils.sshkey import FABRICSSHKey
 
 from swagger_server.database import Session, ldap_params, co_api
-from swagger_server.database.models import FabricPerson, AuthorID, InsertOutcome, insert_unique_person
+from swagger_server.database.models import FabricPerson, AuthorID, InsertOutcome, insert_unique_person, \
+    renumber_keys
 from . import __VERSION__, log
 
 mock_people = [
@@ -43,7 +44,7 @@ mock_people = [
         'eduPersonPrincipalName': 'sysadmin@project-registry.org',
         'mail': 'sysadmin@project-registry.org',
         'uid': 'http://cilogon.org/serverA/users/000001',
-        'settings': '{ "pref1": "val1" }'
+        'settings': {'pref1': 'val1'}
     },
     {
         'cn': 'John Q. Public',
@@ -52,7 +53,7 @@ mock_people = [
         'orcid': '0000-0001-2345-6789',
         'scopus': '1234567890',
         'publons': 'G-1234-5678',
-        'permissions': '{ "perm1": "val1" }'
+        'permissions': {'perm1': 'val1'}
     },
     {
         'cn': 'Eliza Fuller',
@@ -60,8 +61,8 @@ mock_people = [
         'mail': 'efuller@not-project-registry.org',
         'uid': 'http://cilogon.org/serverT/users/12345678',
         'orcid': '1100-0001-2345-6789',
-        'interests': '{ "int1": "val1" }',
-        'settings': '{ "pref1": "val1" }'
+        'interests': {'int1': 'val1'},
+        'settings': {'pref1': 'val1'}
     },
     {
         'cn': 'Kendra Theory',
@@ -268,7 +269,12 @@ def comanage_load_all_people(do_database=True):
                 log.info(f"Updated a pre-existing entry for {dbperson.oidc_claim_sub} ({dbperson.name=})")
             if ret != InsertOutcome.OK and ret != InsertOutcome.DUPLICATE_UPDATED:
                 log.error(f"Unable to add or update entry for {dbperson.oidc_claim_sub} due to {ret}. ")
+            # people whose name, email or eppn changed, their GECOS may have too
+            renamed = [p.uuid for p in session.dirty if isinstance(p, FabricPerson) and session.is_modified(p)]
             session.commit()
+            for owner_uuid in renamed:
+                renumber_keys(session, owner_uuid)
+                session.commit()
         else:
             log.info(f"Skipping adding person {oidc_claim_sub=}, {name=}, {eppn=}, "
                      f"{email=} with GUID {people_uuid} and bastion login {bastion_login} to database - "
@@ -298,6 +304,7 @@ def load_people_data(mode):
         return
 
     with Session() as session:
+        renamed = set()
         for person in people:
             people_uuid = uuid4()
             log.info(f"Adding {person.get('cn')} with GUID {people_uuid} to database")
@@ -328,7 +335,12 @@ def load_people_data(mode):
             ret = insert_unique_person(dbperson, session)
             if ret != InsertOutcome.OK and ret != InsertOutcome.DUPLICATE_UPDATED:
                 log.error(f"Unable to add entry for {dbperson.oidc_claim_sub} due to {ret}. ")
+            # the next query flushes them, so collect people whose GECOS may have changed now
+            renamed.update(p.uuid for p in session.dirty if isinstance(p, FabricPerson) and session.is_modified(p))
         session.commit()
+        for owner_uuid in renamed:
+            renumber_keys(session, owner_uuid)
+            session.commit()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+from sqlalchemy import text, select, bindparam
+
+from swagger_server.database import Session
+from swagger_server.database.models import FabricPerson, DbSshKey, lock_key_changes, login_bucket, get_gecos, \
+    make_authorized_key
+from swagger_server.database.key_changes import BASTION_KEY_CHANNEL
+from . import log
+
+"""
+metadata.create_all() only creates tables that are missing, so columns and
+indexes added to existing tables must also be listed here. Every command
+must be idempotent as they are executed on every startup.
+"""
+MIGRATIONS = (
+    # owner lookups for key admission and bulk sliver key retrieval
+    "CREATE INDEX IF NOT EXISTS ix_fabric_sshkeys_owner_uuid ON fabric_sshkeys (owner_uuid)",
+    # change feed sequence for SSH keys, backfilled in order of the last change
+    "CREATE SEQUENCE IF NOT EXISTS fabric_sshkeys_change_seq",
+    "ALTER TABLE fabric_sshkeys ADD COLUMN IF NOT EXISTS change_seq BIGINT",
+    """
+    UPDATE fabric_sshkeys SET change_seq = numbered.seq
+    FROM (SELECT id, nextval('fabric_sshkeys_change_seq') AS seq
+          FROM (SELECT id FROM fabric_sshkeys WHERE change_seq IS NULL
+                ORDER BY GREATEST(created_on, deactivated_on), id) AS unnumbered) AS numbered
+    WHERE fabric_sshkeys.id = numbered.id
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_fabric_sshkeys_change_seq ON fabric_sshkeys (change_seq)",
+    # wake up long-polling bastion agents (delivered on commit)
+    f"""
+    CREATE OR REPLACE FUNCTION notify_bastion_key_change() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.fabric_key_type = 'bastion' THEN
+            PERFORM pg_notify('{BASTION_KEY_CHANNEL}', NEW.change_seq::text);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS fabric_sshkeys_bastion_notify ON fabric_sshkeys",
+    """
+    CREATE TRIGGER fabric_sshkeys_bastion_notify AFTER INSERT OR UPDATE OF change_seq ON fabric_sshkeys
+    FOR EACH ROW EXECUTE PROCEDURE notify_bastion_key_change()
+    """,
+    # sharded bastion key feeds, login_bucket is backfilled below
+    "CREATE INDEX IF NOT EXISTS ix_fabric_people_bastion_login ON fabric_people (bastion_login)",
+    "ALTER TABLE fabric_people ADD COLUMN IF NOT EXISTS login_bucket INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_fabric_people_login_bucket ON fabric_people (login_bucket)",
+    # precomputed values reported to bastion hosts, backfilled below
+    "ALTER TABLE fabric_people ADD COLUMN IF NOT EXISTS gecos VARCHAR",
+    "ALTER TABLE fabric_sshkeys ADD COLUMN IF NOT EXISTS authorized_key VARCHAR",
+    # preferences used to be stored as JSON strings inside JSONB, unwrap them into objects
+    "UPDATE fabric_people SET settings = (settings #>> '{}')::jsonb WHERE jsonb_typeof(settings) = 'string'",
+    "UPDATE fabric_people SET permissions = (permissions #>> '{}')::jsonb WHERE jsonb_typeof(permissions) = 'string'",
+    "UPDATE fabric_people SET interests = (interests #>> '{}')::jsonb WHERE jsonb_typeof(interests) = 'string'",
+    # row version of people for ETags and If-Match
+    "ALTER TABLE fabric_people ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+    # reverse lookups of people by preferences
+    "CREATE INDEX IF NOT EXISTS ix_fabric_people_interests ON fabric_people USING gin (interests jsonb_path_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_fabric_people_settings ON fabric_people USING gin (settings jsonb_path_ops)",
+)
+# rows read and updated per round trip by the backfills, which run in the migration transaction
+BACKFILL_BATCH_SIZE = 1000
+
+
+def run_migrations():
+    """
+    Bring the schema of an existing database up to date in one transaction
+    """
+    with Session() as session:
+        with session.begin():
+            # nobody should be adding keys while change_seq is being backfilled
+            lock_key_changes(session)
+            for command in MIGRATIONS:
+                session.execute(text(command))
+            _backfill_login_buckets(session)
+            _backfill_gecos(session)
+            _backfill_authorized_keys(session)
+    log.info(f"Applied {len(MIGRATIONS)} database migrations")
+
+
+def _batches(session, statement):
+    """
+    Rows of statement BACKFILL_BATCH_SIZE at a time, read through a server-side
+    cursor so backfills never hold all rows in memory
+    """
+    return session.execute(statement.execution_options(stream_results=True)).partitions(BACKFILL_BATCH_SIZE)
+
+
+def _backfill_login_buckets(session):
+    """
+    Login buckets are a CRC32 Postgres doesn't have, so compute them here
+    """
+    people = FabricPerson.__table__
+    update = people.update().where(people.c.id == bindparam('person_id')).\
+        values(login_bucket=bindparam('bucket'), version=people.c.version + 1)
+    count = 0
+    for batch in _batches(session, select(people.c.id, people.c.bastion_login).
+                          where(people.c.bastion_login != None, people.c.login_bucket == None)):
+        session.execute(update, [{'person_id': row.id, 'bucket': login_bucket(row.bastion_login)}
+                                 for row in batch])
+        count += len(batch)
+    if count > 0:
+        log.info(f"Assigned login buckets to {count} people")
+
+
+def _backfill_gecos(session):
+    """
+    GECOS is kept current on insert and update, fill it in for people stored before that
+    """
+    people = FabricPerson.__table__
+    update = people.update().where(people.c.id == bindparam('person_id')).\
+        values(gecos=bindparam('new_gecos'), version=people.c.version + 1)
+    count = 0
+    for batch in _batches(session, select(people.c.id, people.c.name, people.c.email, people.c.eppn).
+                          where(people.c.gecos == None)):
+        session.execute(update, [{'person_id': row.id, 'new_gecos': get_gecos(row)} for row in batch])
+        count += len(batch)
+    if count > 0:
+        log.info(f"Computed GECOS of {count} people")
+
+
+def _backfill_authorized_keys(session):
+    """
+    authorized_keys lines are computed on insert and update, fill them in for keys stored before that
+    """
+    keys = DbSshKey.__table__
+    update = keys.update().where(keys.c.id == bindparam('key_id')).\
+        values(authorized_key=bindparam('line'))
+    count = 0
+    for batch in _batches(session, select(keys.c.id, keys.c.ssh_key_type, keys.c.public_key, keys.c.comment,
+                                          keys.c.expires_on).
+                          where(keys.c.authorized_key == None)):
+        session.execute(update, [{'key_id': row.id, 'line': make_authorized_key(row)} for row in batch])
+        count += len(batch)
+    if count > 0:
+        log.info(f"Computed authorized_keys lines of {count} keys")
+
+
+if __name__ == '__main__':
+    run_migrations()
@@ -24,10 +24,13 @@
 #
 # Author: Ilya Baldin (ibaldin@renci.org), Michael Stealey (stealey@renci.org)
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, Boolean, Index, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Table, Boolean, Index, DateTime, Sequence, \
+    text, event
+from sqlalchemy.orm import relationship, deferred, object_session
 from sqlalchemy.dialects.postgresql import JSONB
 from enum import Enum, unique
+from typing import Optional
+import zlib
 
 from . import Base, metadata
 
@@ -77,17 +80,80 @@ class FabricPerson(Base):
     name = Column(String)
     email = Column(String)
     eppn = Column(String)
-    bastion_login = Column(String)
+    bastion_login = Column(String, index=True)
+    # hash bucket of bastion_login for sharded bastion key feeds, see login_bucket()
+    login_bucket = Column(Integer, index=True)
+    # kept current from name, email and eppn, see get_gecos()
+    gecos = Column(String)
     # store comanage ID here
     co_person_id = Column(Integer)
-    # preferences
-    settings = Column(JSONB)
-    permissions = Column(JSONB)
-    interests = Column(JSONB)
+    # preferences, loaded together when one of them is first accessed
+    settings = deferred(Column(JSONB), group='preferences')
+    permissions = deferred(Column(JSONB), group='preferences')
+    interests = deferred(Column(JSONB), group='preferences')
+    # bumped on every change, see _bump_version()
+    version = Column(Integer, nullable=False, default=1)
     # alternative IDs (scopus, orcid)
     alt_ids = relationship('AuthorID', backref='owner')
 
 
+# containment (@>) lookups of people by preferences, also created by the migrations
+Index('ix_fabric_people_interests', FabricPerson.__table__.c.interests,
+      postgresql_using='gin', postgresql_ops={'interests': 'jsonb_path_ops'})
+Index('ix_fabric_people_settings', FabricPerson.__table__.c.settings,
+      postgresql_using='gin', postgresql_ops={'settings': 'jsonb_path_ops'})
+
+
+# number of hash buckets bastion logins are spread over, shards are ranges of buckets
+LOGIN_BUCKETS = 4096
+
+
+def login_bucket(bastion_login: str) -> Optional[int]:
+    """
+    Stable hash bucket of a bastion login
+    """
+    if bastion_login is None:
+        return None
+    return zlib.crc32(bastion_login.encode('utf-8')) % LOGIN_BUCKETS
+
+
+@event.listens_for(FabricPerson.bastion_login, 'set')
+def _set_login_bucket(target, value, oldvalue, initiator):
+    target.login_bucket = login_bucket(value)
+
+
+def get_gecos(person: FabricPerson) -> str:
+    """
+    Produce a GECOS-formatted string based on db person info
+    """
+    return ','.join([
+        person.name.strip() if person.name else '',  # Full Name
+        '',  # Building, room number
+        '',  # Office telephone
+        '',  # Home telephone
+        person.email.strip() if person.email else person.eppn.strip() if person.eppn else ''  # external email or other contact info
+    ])
+
+
+@event.listens_for(FabricPerson, 'before_insert')
+@event.listens_for(FabricPerson, 'before_update')
+def _set_gecos(mapper, connection, target):
+    target.gecos = get_gecos(target)
+
+
+@event.listens_for(FabricPerson, 'before_update')
+def _bump_version(mapper, connection, target):
+    # before_update also fires for people without net changes
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = FabricPerson.version + 1
+
+
+# numbers every addition or deactivation of an SSH key for the change feed
+KEY_CHANGE_SEQ = Sequence('fabric_sshkeys_change_seq', metadata=metadata)
+# arbitrary application-wide id of the advisory lock serializing SSH key changes
+KEY_CHANGE_LOCK_ID = 61207
+
+
 class DbSshKey(Base):
     """
     SSH key storage. Keys can be sliver or bastion.
@@ -111,16 +177,54 @@ class DbSshKey(Base):
     active = Column(Boolean)
     deactivation_reason = Column(String)
     deactivated_on = Column(DateTime(timezone=True))
-    owner_uuid = Column(String, ForeignKey('fabric_people.uuid'))
+    owner_uuid = Column(String, ForeignKey('fabric_people.uuid'), index=True)
     # if storing locally
     public_key = Column(String)
     # if storing in COmanage
     comanage_key_id = Column(String)
+    # assigned from KEY_CHANGE_SEQ on insert and bumped on deactivation
+    change_seq = Column(BigInteger, KEY_CHANGE_SEQ, index=True)
+    # line for authorized_keys on bastion hosts, see make_authorized_key()
+    authorized_key = Column(String)
 
     Index('idx_owner_keyid_keytype', 'type', 'owner_uuid', 'key_uuid')
     Index('idx_owner_fingerprint', 'owner_uuid', 'fingerprint')
 
 
+# we want to keep the comment of keys on bastion hosts under 100 characters
+COMMENT_LENGTH = 100
+
+
+def make_bastion_comment(comment: str, expires_on) -> str:
+    """
+    Return a new comment that is a concatenation of the original comment
+    with the expiration date for consumption on bastion hosts.
+    """
+    # we want to keep the comment under 100 character
+    # so we trim the original comment if needed:
+    # the date is 23 characters long: _(2021-11-18_10:17:05)_
+    # we don't ever want this to fail so someone can't construct
+    # a comment so the corresponding key can't be purged
+    ts = expires_on.strftime("_(%Y-%m-%d_%H:%M:%S%z)_")
+    return (comment or '').strip()[0:COMMENT_LENGTH-len(ts)] + ts
+
+
+def make_authorized_key(key: DbSshKey) -> Optional[str]:
+    """
+    Format a key for authorized_keys on bastion hosts, with the expiration
+    date/time in the comment
+    """
+    if key.ssh_key_type is None or key.public_key is None or key.expires_on is None:
+        return None
+    return " ".join([key.ssh_key_type, key.public_key, make_bastion_comment(key.comment, key.expires_on)])
+
+
+@event.listens_for(DbSshKey, 'before_insert')
+@event.listens_for(DbSshKey, 'before_update')
+def _set_authorized_key(mapper, connection, target):
+    target.authorized_key = make_authorized_key(target)
+
+
 class AuthorID(Base):
     __tablename__ = 'author_ids'
 
@@ -190,6 +294,37 @@ def insert_unique_person(person: FabricPerson, session) -> InsertOutcome:
     return InsertOutcome.OK
 
 
+def lock_key_changes(session) -> None:
+    """
+    Take a transaction-level advisory lock before adding or deactivating SSH keys.
+    Writers holding it until commit means change_seq values become visible in
+    the order they were assigned, so feed readers never skip over a change
+    that commits late. The lock is reentrant within a transaction.
+    """
+    session.execute(text('SELECT pg_advisory_xact_lock(:lock_id)'), {'lock_id': KEY_CHANGE_LOCK_ID})
+
+
+def next_key_change_seq():
+    """
+    Expression assigning the next change sequence number when a key is updated
+    (inserts pick it up as a column default). Callers must hold lock_key_changes().
+    """
+    return KEY_CHANGE_SEQ.next_value()
+
+
+def renumber_keys(session, owner_uuid) -> None:
+    """
+    Give every key of a person new change_seq numbers after their bastion login
+    or GECOS changed: key listings, their ETags and the bastion key feed and index
+    carry the owner's login and GECOS but are versioned by key change_seq.
+    The change of the person must be committed first, and as this takes the key
+    change lock callers should use a short transaction of its own.
+    """
+    lock_key_changes(session)
+    session.query(DbSshKey).filter(DbSshKey.owner_uuid == owner_uuid).\
+        update({DbSshKey.change_seq: next_key_change_seq()}, synchronize_session=False)
+
+
 if __name__ == "__main__":
     print("[INFO] Creating tables")
     from swagger_server.database import engine
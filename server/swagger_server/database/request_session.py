@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+from http import HTTPStatus
+
+from flask import g, request
+
+from fss_utils.http_errors import cors_response
+
+from swagger_server.instrumentation.sql import request_sql_stats
+from . import Session, log
+
+"""
+One database session (and transaction) per request, shared by utils and
+controllers. The transaction is committed once after the response is built,
+or rolled back if the request failed. Streaming responses and long polls
+that outlive the request use their own sessions.
+"""
+
+
+def request_session():
+    """
+    Return the session of the current request, creating it on first use.
+    Callers must not commit or close it.
+    """
+    if 'db_session' not in g:
+        g.db_session = Session()
+    return g.db_session
+
+
+def init_request_sessions(app, query_budget: int):
+    """
+    Register request hooks finishing the request session on the Flask app
+    and warning about requests running more than query_budget SQL statements
+    """
+
+    def commit_request_session(response):
+        session = g.get('db_session', None)
+        if session is None:
+            return response
+        if response.status_code >= HTTPStatus.BAD_REQUEST:
+            session.rollback()
+            return response
+        try:
+            session.commit()
+        except Exception as e:
+            log.error(f'Unable to commit changes made by {request.method} {request.path} due to {e}')
+            session.rollback()
+            return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                                 xerror='Unable to store changes due to internal error.')
+        return response
+
+    def close_request_session(exception):
+        session = g.pop('db_session', None)
+        if session is not None:
+            # anything not committed (e.g. after an exception) is rolled back
+            session.close()
+        statements = request_sql_stats().statements
+        if statements > query_budget:
+            log.warning(f'{request.method} {request.path} ran {statements} SQL statements, '
+                        f'over the budget of {query_budget}')
+
+    app.after_request(commit_request_session)
+    app.teardown_request(close_request_session)
@@ -1,12 +1,85 @@
+from datetime import datetime
+from operator import attrgetter
+
 from connexion.apps.flask_app import FlaskJSONEncoder
 import six
 
 from swagger_server.models.base_model_ import Model
+from swagger_server.instrumentation.timing import timed_phase, SERIALIZATION_PHASE
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# values that need no conversion before encoding
+PLAIN_TYPES = (str, int, float, bool, type(None))
+
+# model class -> (json names, getter returning a tuple of attribute values)
+_model_fields = dict()
+
+
+def model_fields(o: Model):
+    """
+    Return json names of the attributes of a model and a getter for their values,
+    built once per model class. Values are read from the private attributes
+    behind the generated properties.
+    """
+    fields = _model_fields.get(type(o), None)
+    if fields is None:
+        names = tuple(o.attribute_map[attr] for attr in o.swagger_types)
+        attrs = tuple('_' + attr for attr in o.swagger_types)
+        if len(attrs) == 0:
+            getter = lambda model: ()
+        elif len(attrs) == 1:
+            single_getter = attrgetter(attrs[0])
+            getter = lambda model: (single_getter(model),)
+        else:
+            getter = attrgetter(*attrs)
+        fields = names, getter
+        _model_fields[type(o)] = fields
+    return fields
+
+
+def to_plain(o, include_nulls: bool = False):
+    """
+    Convert models (also inside lists and dicts) into dicts ready for encoding
+    """
+    if isinstance(o, PLAIN_TYPES):
+        return o
+    if isinstance(o, datetime):
+        # as FlaskJSONEncoder.default() does, naive values are UTC
+        return o.isoformat() if o.tzinfo else o.isoformat() + 'Z'
+    if isinstance(o, Model):
+        names, getter = model_fields(o)
+        return {name: to_plain(value, include_nulls) for name, value in zip(names, getter(o))
+                if value is not None or include_nulls}
+    if isinstance(o, (list, tuple)):
+        return [to_plain(value, include_nulls) for value in o]
+    if isinstance(o, dict):
+        return {key: to_plain(value, include_nulls) for key, value in o.items()}
+    return o
 
 
 class JSONEncoder(FlaskJSONEncoder):
     include_nulls = False
 
+    def encode(self, o):
+        with timed_phase(SERIALIZATION_PHASE):
+            plain = to_plain(o, self.include_nulls)
+            if orjson is not None:
+                option = orjson.OPT_NON_STR_KEYS
+                if self.indent:
+                    option |= orjson.OPT_INDENT_2
+                if self.sort_keys:
+                    option |= orjson.OPT_SORT_KEYS
+                try:
+                    return orjson.dumps(plain, default=self.default, option=option).decode('utf-8')
+                except TypeError:
+                    # e.g. integers beyond 64 bits, let the standard encoder deal with it
+                    pass
+            return super().encode(plain)
+
     def default(self, o):
         if isinstance(o, Model):
             dikt = {}
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+from flask import has_request_context, request
+
+"""
+Instrumentation of requests handled by UIS (SQL statistics etc).
+"""
+
+UNKNOWN_OPERATION = 'unknown'
+
+
+def operation_id() -> str:
+    """
+    operationId (from swagger.yaml) of the operation handling the current request.
+    Connexion names Flask endpoints after the controller function, which is
+    named after the operationId.
+    """
+    if not has_request_context() or request.endpoint is None:
+        return UNKNOWN_OPERATION
+    endpoint = request.endpoint.split('.')[-1]
+    # e.g. swagger_server_controllers_sshkeys_controller_bastionkeys_get
+    return endpoint.split('_controller_', 1)[-1]
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+import functools
+import os
+import time
+
+from flask import g
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, \
+    CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+from swagger_server.database import engine
+from swagger_server.instrumentation import operation_id
+from swagger_server.instrumentation.sql import request_sql_stats
+from swagger_server.instrumentation.timing import add_phase_time, COMANAGE_PHASE
+from swagger_server.instrumentation.tracing import span
+
+"""
+Prometheus metrics of UIS. Under uwsgi every worker is a separate process,
+so metrics are kept in prometheus_client multiprocess mode (files in
+PROMETHEUS_MULTIPROC_DIR, which must be emptied before the server starts)
+and /metrics aggregates the files of all workers. Without
+PROMETHEUS_MULTIPROC_DIR only the metrics of the serving process are
+reported.
+"""
+
+MULTIPROC_DIR_ENV = 'PROMETHEUS_MULTIPROC_DIR'
+
+REQUEST_SECONDS = Histogram('uis_request_seconds', 'Time spent handling requests',
+                            ['operation', 'status'])
+COMANAGE_SECONDS = Histogram('uis_comanage_call_seconds', 'Time spent in COmanage API calls',
+                             ['method'])
+COMANAGE_ERRORS = Counter('uis_comanage_call_errors_total', 'COmanage API calls that raised an error',
+                          ['method', 'error'])
+SQL_STATEMENTS = Counter('uis_sql_statements_total', 'SQL statements run by requests', ['operation'])
+SQL_SECONDS = Counter('uis_sql_seconds_total', 'Time spent in SQL statements by requests', ['operation'])
+POOL_CHECKED_OUT = Gauge('uis_db_pool_checked_out', 'Database connections checked out of the pool',
+                         multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('uis_db_pool_overflow', 'Database connections open beyond pool_size',
+                      multiprocess_mode='livesum')
+POOL_CONNECT_SECONDS = Histogram('uis_db_pool_connect_seconds',
+                                 'Time opening new database connections for the pool',
+                                 buckets=(.001, .005, .01, .05, .1, .5, 1.0, 5.0, 10.0, 30.0))
+# connection record info key of the time opening a connection started
+CONNECT_STARTED = 'uis_connect_started'
+KEYS_EXPIRED = Counter('uis_keys_expired_total', 'SSH keys deactivated because they expired')
+KEYS_GARBAGE_COLLECTED = Counter('uis_keys_garbage_collected_total', 'Deactivated SSH keys deleted')
+CACHE_REQUESTS = Counter('uis_cache_requests_total', 'Lookups of cached or conditional responses',
+                         ['cache', 'result'])
+
+
+def cache_hit(cache: str):
+    CACHE_REQUESTS.labels(cache, 'hit').inc()
+
+
+def cache_miss(cache: str):
+    CACHE_REQUESTS.labels(cache, 'miss').inc()
+
+
+def metrics_text():
+    """
+    Return metrics of all worker processes in Prometheus text format and its content type
+    """
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def init_metrics(app):
+    """
+    Register request hooks timing requests on the Flask app, and remove
+    the live gauges of a uwsgi worker when it exits
+    """
+
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    def observe_request(response):
+        start = g.get('request_start', None)
+        if start is not None:
+            REQUEST_SECONDS.labels(operation_id(), response.status_code).observe(time.perf_counter() - start)
+        return response
+
+    def record_sql_metrics(exception):
+        stats = request_sql_stats()
+        if stats.statements > 0:
+            SQL_STATEMENTS.labels(operation_id()).inc(stats.statements)
+            SQL_SECONDS.labels(operation_id()).inc(stats.seconds)
+
+    app.before_request(start_request_timer)
+    app.after_request(observe_request)
+    app.teardown_request(record_sql_metrics)
+
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        try:
+            import uwsgi
+            uwsgi.atexit = lambda: multiprocess.mark_process_dead(os.getpid())
+        except ImportError:
+            # not running under uwsgi
+            pass
+
+
+def instrument_comanage(co_api):
+    """
+    Time every public method of a ComanageApi instance (also towards the
+    comanage phase of Server-Timing), trace it and count its errors
+    """
+    for name in dir(co_api):
+        method = getattr(co_api, name)
+        if name.startswith('_') or not callable(method):
+            continue
+        setattr(co_api, name, _timed_comanage_call(name, method))
+    return co_api
+
+
+def _timed_comanage_call(name, method):
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with span(f'co_api.{name}'):
+                return method(*args, **kwargs)
+        except Exception as e:
+            COMANAGE_ERRORS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            COMANAGE_SECONDS.labels(name).observe(seconds)
+            add_phase_time(COMANAGE_PHASE, seconds)
+    return timed
+
+
+def _update_pool_gauges():
+    POOL_CHECKED_OUT.set(engine.pool.checkedout())
+    POOL_OVERFLOW.set(max(engine.pool.overflow(), 0))
+
+
+@event.listens_for(engine, 'checkout')
+def _pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    _update_pool_gauges()
+
+
+@event.listens_for(engine, 'checkin')
+def _pool_checkin(dbapi_connection, connection_record):
+    _update_pool_gauges()
+
+
+# engine listeners are carried over to the new pool when engine.dispose() recreates it
+@event.listens_for(engine, 'do_connect')
+def _pool_connect_started(dialect, connection_record, cargs, cparams):
+    connection_record.info[CONNECT_STARTED] = time.perf_counter()
+
+
+@event.listens_for(engine, 'connect')
+def _pool_connected(dbapi_connection, connection_record):
+    start = connection_record.info.pop(CONNECT_STARTED, None)
+    if start is not None:
+        POOL_CONNECT_SECONDS.observe(time.perf_counter() - start)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+import cProfile
+import os
+import random
+import threading
+import time
+
+from flask import g, request
+
+from swagger_server.database import log
+from swagger_server.instrumentation import operation_id
+
+"""
+Opt-in request profiling with cProfile. A sample of requests, and requests
+carrying the profiling header with an administrator token, are profiled and
+their statistics written as .prof files (readable with pstats or snakeviz)
+to a directory per operationId, keeping only the most recent ones.
+"""
+
+PROFILE_HEADER = 'X-UIS-Profile'
+PROFILE_SUFFIX = '.prof'
+
+# the profiler hooks the interpreter, so only one request per process is profiled at a time
+_profile_lock = threading.Lock()
+
+
+def init_profiling(app, profile_dir: str, sample_rate: float, keep: int, is_admin):
+    """
+    Register request hooks profiling requests on the Flask app: a sample_rate
+    fraction of them and those with the profiling header for which
+    is_admin(headers) holds. Up to keep profiles per operationId are kept.
+    """
+    if profile_dir is None:
+        return
+    if keep < 1:
+        log.error(f'Profiles to keep must be at least 1, not {keep}, profiling is disabled')
+        return
+    os.makedirs(profile_dir, exist_ok=True)
+    log.info(f'Profiling {sample_rate * 100:.1f}% of requests and requests with {PROFILE_HEADER} header '
+             f'from administrators into {profile_dir}')
+
+    def start_profile():
+        requested = request.headers.get(PROFILE_HEADER, None) is not None
+        if random.random() >= sample_rate and not (requested and is_admin(request.headers)):
+            return
+        if not _profile_lock.acquire(blocking=False):
+            log.debug(f'Not profiling {request.method} {request.path}, another request is being profiled')
+            return
+        profile = cProfile.Profile()
+        g.profile = profile
+        profile.enable()
+
+    def end_profile(exception):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        profile.disable()
+        _profile_lock.release()
+        try:
+            _save_profile(profile, os.path.join(profile_dir, operation_id()), keep)
+        except OSError as e:
+            log.error(f'Unable to save profile of {request.method} {request.path} due to {e}')
+
+    app.before_request(start_profile)
+    app.teardown_request(end_profile)
+
+
+def _save_profile(profile, operation_dir: str, keep: int):
+    """
+    Write the profile and remove the oldest ones of the same operation beyond keep
+    """
+    os.makedirs(operation_dir, exist_ok=True)
+    now = time.time()
+    file_name = f'{time.strftime("%Y%m%dT%H%M%S", time.gmtime(now))}-{int(now * 1000000) % 1000000:06d}-' \
+                f'{os.getpid()}{PROFILE_SUFFIX}'
+    profile.dump_stats(os.path.join(operation_dir, file_name))
+    # names start with the time they were written
+    profiles = sorted(name for name in os.listdir(operation_dir) if name.endswith(PROFILE_SUFFIX))
+    for name in profiles[:max(len(profiles) - keep, 0)]:
+        try:
+            os.remove(os.path.join(operation_dir, name))
+        except FileNotFoundError:
+            # another worker rotated it already
+            pass
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+from swagger_server.database import engine, log
+from swagger_server.instrumentation import operation_id
+
+"""
+SQL statistics from SQLAlchemy engine events: number of statements and time
+spent in the database for the current request (reported in X-DB-* response
+headers) and aggregated per operationId in this process, and a log of
+statements slower than a threshold.
+"""
+
+DB_QUERIES_HEADER = 'X-DB-Queries'
+DB_TIME_HEADER = 'X-DB-Time-Ms'
+# longest statement text kept for reporting
+STATEMENT_LENGTH = 500
+
+# statements slower than this are logged, see init_sql_instrumentation()
+slow_query_seconds = 0.2
+
+
+@dataclass
+class SqlStats:
+    statements: int = 0
+    seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest_statement: str = None
+
+    def add(self, statement: str, seconds: float):
+        self.statements += 1
+        self.seconds += seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement[0:STATEMENT_LENGTH]
+
+
+@dataclass
+class OperationSqlStats(SqlStats):
+    requests: int = 0
+
+    def merge(self, stats: SqlStats):
+        self.requests += 1
+        self.statements += stats.statements
+        self.seconds += stats.seconds
+        if stats.slowest_seconds > self.slowest_seconds:
+            self.slowest_seconds = stats.slowest_seconds
+            self.slowest_statement = stats.slowest_statement
+
+
+_operations_lock = threading.Lock()
+_operations: Dict[str, OperationSqlStats] = dict()
+
+
+def request_sql_stats() -> SqlStats:
+    """
+    SQL statistics of the current request so far
+    """
+    if 'sql_stats' not in g:
+        g.sql_stats = SqlStats()
+    return g.sql_stats
+
+
+def operation_sql_stats() -> Dict[str, OperationSqlStats]:
+    """
+    Copy of SQL statistics per operationId accumulated by this process
+    """
+    with _operations_lock:
+        return {op: OperationSqlStats(**vars(stats)) for op, stats in _operations.items()}
+
+
+def init_sql_instrumentation(app, slow_query_ms: int):
+    """
+    Register request hooks reporting SQL statistics on the Flask app
+    """
+    global slow_query_seconds
+    slow_query_seconds = slow_query_ms / 1000
+
+    def add_sql_headers(response):
+        stats = request_sql_stats()
+        response.headers[DB_QUERIES_HEADER] = str(stats.statements)
+        response.headers[DB_TIME_HEADER] = f'{stats.seconds * 1000:.1f}'
+        return response
+
+    def record_sql_stats(exception):
+        stats = request_sql_stats()
+        with _operations_lock:
+            _operations.setdefault(operation_id(), OperationSqlStats()).merge(stats)
+
+    app.after_request(add_sql_headers)
+    app.teardown_request(record_sql_stats)
+
+
+def parameter_shape(parameters):
+    """
+    Describe bound parameters by type (and size for collections) without their values
+    """
+    if isinstance(parameters, dict):
+        return {name: parameter_shape(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        # executemany or IN lists
+        if len(parameters) == 0:
+            return f'{type(parameters).__name__}[0]'
+        return f'{type(parameters).__name__}[{len(parameters)}] of {parameter_shape(parameters[0])}'
+    return type(parameters).__name__
+
+
+@event.listens_for(engine, 'before_cursor_execute')
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_start', []).append(time.perf_counter())
+
+
+@event.listens_for(engine, 'after_cursor_execute')
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['statement_start'].pop()
+    if has_request_context():
+        request_sql_stats().add(statement, seconds)
+    if seconds > slow_query_seconds:
+        log.warning(f'Slow SQL statement ({seconds * 1000:.1f} ms) in {operation_id()}: '
+                    f'{statement[0:STATEMENT_LENGTH]} with parameters {parameter_shape(parameters)}')
+
+
+@event.listens_for(engine, 'handle_error')
+def _fail_statement(context):
+    conn = context.connection
+    if conn is not None and conn.info.get('statement_start'):
+        conn.info['statement_start'].pop()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+import functools
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from flask import g, has_request_context, request
+
+from swagger_server.instrumentation.sql import request_sql_stats
+
+"""
+Server-Timing response header breaking a request down into the time spent
+validating JWTs, running SQL statements, calling COmanage and serializing
+the response, so it can be inspected from browser developer tools.
+"""
+
+SERVER_TIMING_HEADER = 'Server-Timing'
+
+JWT_PHASE = 'jwt'
+DB_PHASE = 'db'
+COMANAGE_PHASE = 'comanage'
+SERIALIZATION_PHASE = 'serialization'
+TOTAL_PHASE = 'total'
+
+# values of UIS_SERVER_TIMING
+SERVER_TIMING_OFF = 'off'
+SERVER_TIMING_ON = 'on'
+SERVER_TIMING_ADMIN = 'admin'
+
+
+def request_phase_times() -> Dict[str, float]:
+    """
+    Seconds spent in each phase by the current request so far
+    """
+    if 'phase_times' not in g:
+        g.phase_times = dict()
+    return g.phase_times
+
+
+def add_phase_time(phase: str, seconds: float):
+    if has_request_context():
+        times = request_phase_times()
+        times[phase] = times.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed_phase(phase: str):
+    """
+    Count the time spent in the enclosed block towards a phase of the current request
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase_time(phase, time.perf_counter() - start)
+
+
+def timed_phase_calls(phase: str, function):
+    """
+    Wrap a function so the time spent in its calls counts towards a phase
+    """
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        with timed_phase(phase):
+            return function(*args, **kwargs)
+    return timed
+
+
+def server_timing(total_seconds: float) -> str:
+    """
+    Format the Server-Timing header value of the current request
+    """
+    times = request_phase_times()
+    sql_stats = request_sql_stats()
+    entries = [f'{JWT_PHASE};dur={times.get(JWT_PHASE, 0.0) * 1000:.1f}',
+               f'{DB_PHASE};dur={sql_stats.seconds * 1000:.1f};desc="{sql_stats.statements} queries"',
+               f'{COMANAGE_PHASE};dur={times.get(COMANAGE_PHASE, 0.0) * 1000:.1f}',
+               f'{SERIALIZATION_PHASE};dur={times.get(SERIALIZATION_PHASE, 0.0) * 1000:.1f}',
+               f'{TOTAL_PHASE};dur={total_seconds * 1000:.1f}']
+    return ', '.join(entries)
+
+
+def init_server_timing(app, mode: str, is_admin=None):
+    """
+    Register request hooks adding the Server-Timing header on the Flask app:
+    to every response (mode 'on') or only to responses to requests made with
+    a token of an administrator, as decided by is_admin(headers) (mode 'admin')
+    """
+    if mode == SERVER_TIMING_OFF:
+        return
+
+    def start_server_timing():
+        g.server_timing_start = time.perf_counter()
+
+    def add_server_timing(response):
+        start = g.get('server_timing_start', None)
+        if start is None:
+            return response
+        # format before checking the token so the check does not count
+        header = server_timing(time.perf_counter() - start)
+        if mode == SERVER_TIMING_ADMIN and not is_admin(request.headers):
+            return response
+        response.headers[SERVER_TIMING_HEADER] = header
+        return response
+
+    app.before_request(start_server_timing)
+    app.after_request(add_server_timing)
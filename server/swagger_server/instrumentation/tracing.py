@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+import functools
+import os
+import threading
+from contextlib import nullcontext
+
+from flask import g, request
+from sqlalchemy import event
+
+from swagger_server.database import engine, log
+from swagger_server.instrumentation import operation_id
+from swagger_server.instrumentation.sql import STATEMENT_LENGTH
+
+try:
+    from opentelemetry import context as otel_context, propagate, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+except ImportError:
+    trace = None
+
+"""
+Optional OpenTelemetry tracing (needs opentelemetry-sdk, and
+opentelemetry-exporter-otlp for the otlp exporter). Every request gets a
+root span continuing the trace context (traceparent header) sent by the
+front end, with child spans for JWT validation, COmanage calls, SQL
+statements and SSH key generation/parsing. Tracers are set up lazily in
+each uwsgi worker since exporter threads do not survive the fork.
+"""
+
+SERVICE_NAME = 'uis'
+
+# values of UIS_OTEL_EXPORTER
+EXPORTER_NONE = 'none'
+EXPORTER_CONSOLE = 'console'
+EXPORTER_FILE = 'file'
+EXPORTER_OTLP = 'otlp'
+EXPORTER_MEMORY = 'memory'
+EXPORTERS = (EXPORTER_NONE, EXPORTER_CONSOLE, EXPORTER_FILE, EXPORTER_OTLP, EXPORTER_MEMORY)
+
+_exporter_name = EXPORTER_NONE
+_exporter_file = None
+_tracer = None
+_tracer_pid = None
+_tracer_lock = threading.Lock()
+# spans exported so far with the memory exporter (for tests)
+memory_exporter = None
+
+
+def tracing_enabled() -> bool:
+    return _exporter_name != EXPORTER_NONE
+
+
+def span(name: str, **attributes):
+    """
+    Context manager running the enclosed block in a child span of the
+    current one, or doing nothing if tracing is disabled
+    """
+    tracer = _get_tracer()
+    if tracer is None:
+        return nullcontext()
+    return tracer.start_as_current_span(name, attributes=attributes)
+
+
+def traced_calls(name: str, function):
+    """
+    Wrap a function so each call runs in its own span
+    """
+    @functools.wraps(function)
+    def traced(*args, **kwargs):
+        with span(name):
+            return function(*args, **kwargs)
+    return traced
+
+
+def init_tracing(app, exporter: str, exporter_file: str = None):
+    """
+    Register request hooks creating a root span per request on the Flask app
+    """
+    global _exporter_name, _exporter_file
+    if exporter not in EXPORTERS:
+        log.error(f'Unknown OpenTelemetry exporter {exporter}, tracing is disabled')
+        return
+    if exporter != EXPORTER_NONE and trace is None:
+        log.error('OpenTelemetry packages are not installed, tracing is disabled')
+        return
+    if exporter == EXPORTER_FILE and exporter_file is None:
+        log.error('No file given for the OpenTelemetry file exporter, tracing is disabled')
+        return
+    _exporter_name = exporter
+    _exporter_file = exporter_file
+    if not tracing_enabled():
+        return
+    log.info(f'Tracing requests with OpenTelemetry {exporter} exporter')
+
+    def start_request_span():
+        tracer = _get_tracer()
+        if tracer is None:
+            return
+        parent = propagate.extract(request.headers)
+        request_span = tracer.start_span(f'{request.method} {operation_id()}', context=parent,
+                                         kind=trace.SpanKind.SERVER,
+                                         attributes={'http.method': request.method,
+                                                     'http.target': request.path,
+                                                     'uis.operation': operation_id()})
+        g.otel_span = request_span
+        g.otel_token = otel_context.attach(trace.set_span_in_context(request_span, parent))
+
+    def tag_request_span(response):
+        request_span = g.get('otel_span', None)
+        if request_span is not None:
+            request_span.set_attribute('http.status_code', response.status_code)
+        return response
+
+    def end_request_span(exception):
+        request_span = g.pop('otel_span', None)
+        if request_span is None:
+            return
+        if exception is not None:
+            request_span.record_exception(exception)
+            request_span.set_status(trace.Status(trace.StatusCode.ERROR))
+        request_span.end()
+        otel_context.detach(g.pop('otel_token'))
+
+    app.before_request(start_request_span)
+    app.after_request(tag_request_span)
+    app.teardown_request(end_request_span)
+
+
+def _get_tracer():
+    global _tracer, _tracer_pid, memory_exporter
+    if not tracing_enabled():
+        return None
+    if _tracer_pid == os.getpid():
+        return _tracer
+    with _tracer_lock:
+        if _tracer_pid != os.getpid():
+            provider = TracerProvider(resource=Resource.create({'service.name': SERVICE_NAME}))
+            if _exporter_name == EXPORTER_OTLP:
+                # endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            elif _exporter_name == EXPORTER_MEMORY:
+                memory_exporter = InMemorySpanExporter()
+                provider.add_span_processor(SimpleSpanProcessor(memory_exporter))
+            elif _exporter_name == EXPORTER_FILE:
+                out = open(_exporter_file, 'a')
+                provider.add_span_processor(SimpleSpanProcessor(ConsoleSpanExporter(out=out)))
+            else:
+                provider.add_span_processor(SimpleSpanProcessor(ConsoleSpanExporter()))
+            _tracer = provider.get_tracer(__name__)
+            _tracer_pid = os.getpid()
+    return _tracer
+
+
+@event.listens_for(engine, 'before_cursor_execute')
+def _start_statement_span(conn, cursor, statement, parameters, context, executemany):
+    tracer = _get_tracer()
+    if tracer is None:
+        return
+    statement_span = tracer.start_span('sql', attributes={'db.system': 'postgresql',
+                                                          'db.statement': statement[0:STATEMENT_LENGTH]})
+    conn.info.setdefault('statement_span', []).append(statement_span)
+
+
+@event.listens_for(engine, 'after_cursor_execute')
+def _end_statement_span(conn, cursor, statement, parameters, context, executemany):
+    if conn.info.get('statement_span'):
+        conn.info['statement_span'].pop().end()
+
+
+@event.listens_for(engine, 'handle_error')
+def _fail_statement_span(context):
+    conn = context.connection
+    if conn is not None and conn.info.get('statement_span'):
+        statement_span = conn.info['statement_span'].pop()
+        statement_span.record_exception(context.original_exception)
+        statement_span.set_status(trace.Status(trace.StatusCode.ERROR))
+        statement_span.end()
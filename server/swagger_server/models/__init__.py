@@ -5,13 +5,18 @@ from __future__ import absolute_import
 # import models into model package
 from swagger_server.models.author_id import AuthorId
 from swagger_server.models.author_id_type import AuthorIdType
+from swagger_server.models.memory_allocation import MemoryAllocation
+from swagger_server.models.memory_snapshot import MemorySnapshot
 from swagger_server.models.people_long import PeopleLong
 from swagger_server.models.people_short import PeopleShort
 from swagger_server.models.preference_type import PreferenceType
 from swagger_server.models.preferences import Preferences
 from swagger_server.models.ssh_key_bastion import SshKeyBastion
+from swagger_server.models.ssh_key_bastion_feed import SshKeyBastionFeed
 from swagger_server.models.ssh_key_long import SshKeyLong
 from swagger_server.models.ssh_key_pair import SshKeyPair
 from swagger_server.models.ssh_key_status import SshKeyStatus
 from swagger_server.models.ssh_key_type import SshKeyType
+from swagger_server.models.ssh_key_upload import SshKeyUpload
+from swagger_server.models.ssh_key_upload_result import SshKeyUploadResult
 from swagger_server.models.version import Version
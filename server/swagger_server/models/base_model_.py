@@ -9,6 +9,9 @@ T = typing.TypeVar('T')
 
 
 class Model(object):
+    # no instance dict here so compact subclasses (see compact.py) can do without one
+    __slots__ = ()
+
     # swaggerTypes: The key is attribute name and the
     # value is attribute type.
     swagger_types = {}
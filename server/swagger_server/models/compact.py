@@ -0,0 +1,60 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+
+from swagger_server.models.base_model_ import Model
+from swagger_server.models.people_long import PeopleLong
+from swagger_server.models.people_short import PeopleShort
+from swagger_server.models.preferences import Preferences
+from swagger_server.models.ssh_key_bastion import SshKeyBastion
+from swagger_server.models.ssh_key_long import SshKeyLong
+
+"""
+Compact variants of generated models built in bulk for responses. They
+keep the attributes, properties, constructor signature and JSON form of
+the generated model, but store values in __slots__, share swagger_types
+and attribute_map across instances and assign constructor arguments
+without going through the property setters.
+"""
+
+
+class CompactModel(Model):
+    __slots__ = ()
+
+    def __eq__(self, other):
+        """Returns true if both objects are equal"""
+        return type(self) is type(other) and \
+            all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+
+def compact_model(model_class):
+    """
+    Build the compact variant of a generated model class
+    """
+    template = model_class()
+    attrs = tuple(template.swagger_types)
+    namespace = {
+        '__slots__': tuple('_' + attr for attr in attrs),
+        '__doc__': f'Compact {model_class.__name__} with the same attributes and JSON form',
+        'swagger_types': template.swagger_types,
+        'attribute_map': template.attribute_map,
+    }
+    # the generated properties read and write the same private names
+    for attr in attrs:
+        namespace[attr] = getattr(model_class, attr)
+    # a constructor with the same signature assigning slots directly (as namedtuple does)
+    source = f'def __init__(self, {", ".join(f"{attr}=None" for attr in attrs)}):\n' + \
+             ''.join(f'    self._{attr} = {attr}\n' for attr in attrs)
+    if len(attrs) == 0:
+        source += '    pass\n'
+    scope = dict()
+    exec(source, scope)
+    namespace['__init__'] = scope['__init__']
+    return type(f'Compact{model_class.__name__}', (CompactModel,), namespace)
+
+
+CompactPeopleLong = compact_model(PeopleLong)
+CompactPeopleShort = compact_model(PeopleShort)
+CompactPreferences = compact_model(Preferences)
+CompactSshKeyBastion = compact_model(SshKeyBastion)
+CompactSshKeyLong = compact_model(SshKeyLong)
@@ -0,0 +1,166 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+from datetime import date, datetime  # noqa: F401
+
+from typing import List, Dict  # noqa: F401
+
+from swagger_server.models.base_model_ import Model
+from swagger_server import util
+
+
+class MemoryAllocation(Model):
+    """NOTE: This class is auto generated by the swagger code generator program.
+
+    Do not edit the class manually.
+    """
+    def __init__(self, location: str=None, size: int=None, count: int=None, size_diff: int=None, count_diff: int=None):  # noqa: E501
+        """MemoryAllocation - a model defined in Swagger
+
+        :param location: The location of this MemoryAllocation.  # noqa: E501
+        :type location: str
+        :param size: The size of this MemoryAllocation.  # noqa: E501
+        :type size: int
+        :param count: The count of this MemoryAllocation.  # noqa: E501
+        :type count: int
+        :param size_diff: The size_diff of this MemoryAllocation.  # noqa: E501
+        :type size_diff: int
+        :param count_diff: The count_diff of this MemoryAllocation.  # noqa: E501
+        :type count_diff: int
+        """
+        self.swagger_types = {
+            'location': str,
+            'size': int,
+            'count': int,
+            'size_diff': int,
+            'count_diff': int
+        }
+
+        self.attribute_map = {
+            'location': 'location',
+            'size': 'size',
+            'count': 'count',
+            'size_diff': 'size_diff',
+            'count_diff': 'count_diff'
+        }
+        self._location = location
+        self._size = size
+        self._count = count
+        self._size_diff = size_diff
+        self._count_diff = count_diff
+
+    @classmethod
+    def from_dict(cls, dikt) -> 'MemoryAllocation':
+        """Returns the dict as a model
+
+        :param dikt: A dict.
+        :type: dict
+        :return: The MemoryAllocation of this MemoryAllocation.  # noqa: E501
+        :rtype: MemoryAllocation
+        """
+        return util.deserialize_model(dikt, cls)
+
+    @property
+    def location(self) -> str:
+        """Gets the location of this MemoryAllocation.
+
+
+        :return: The location of this MemoryAllocation.
+        :rtype: str
+        """
+        return self._location
+
+    @location.setter
+    def location(self, location: str):
+        """Sets the location of this MemoryAllocation.
+
+
+        :param location: The location of this MemoryAllocation.
+        :type location: str
+        """
+
+        self._location = location
+
+    @property
+    def size(self) -> int:
+        """Gets the size of this MemoryAllocation.
+
+
+        :return: The size of this MemoryAllocation.
+        :rtype: int
+        """
+        return self._size
+
+    @size.setter
+    def size(self, size: int):
+        """Sets the size of this MemoryAllocation.
+
+
+        :param size: The size of this MemoryAllocation.
+        :type size: int
+        """
+
+        self._size = size
+
+    @property
+    def count(self) -> int:
+        """Gets the count of this MemoryAllocation.
+
+
+        :return: The count of this MemoryAllocation.
+        :rtype: int
+        """
+        return self._count
+
+    @count.setter
+    def count(self, count: int):
+        """Sets the count of this MemoryAllocation.
+
+
+        :param count: The count of this MemoryAllocation.
+        :type count: int
+        """
+
+        self._count = count
+
+    @property
+    def size_diff(self) -> int:
+        """Gets the size_diff of this MemoryAllocation.
+
+
+        :return: The size_diff of this MemoryAllocation.
+        :rtype: int
+        """
+        return self._size_diff
+
+    @size_diff.setter
+    def size_diff(self, size_diff: int):
+        """Sets the size_diff of this MemoryAllocation.
+
+
+        :param size_diff: The size_diff of this MemoryAllocation.
+        :type size_diff: int
+        """
+
+        self._size_diff = size_diff
+
+    @property
+    def count_diff(self) -> int:
+        """Gets the count_diff of this MemoryAllocation.
+
+
+        :return: The count_diff of this MemoryAllocation.
+        :rtype: int
+        """
+        return self._count_diff
+
+    @count_diff.setter
+    def count_diff(self, count_diff: int):
+        """Sets the count_diff of this MemoryAllocation.
+
+
+        :param count_diff: The count_diff of this MemoryAllocation.
+        :type count_diff: int
+        """
+
+        self._count_diff = count_diff
@@ -0,0 +1,193 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+from datetime import date, datetime  # noqa: F401
+
+from typing import List, Dict  # noqa: F401
+
+from swagger_server.models.base_model_ import Model
+from swagger_server.models.memory_allocation import MemoryAllocation  # noqa: F401,E501
+from swagger_server import util
+
+
+class MemorySnapshot(Model):
+    """NOTE: This class is auto generated by the swagger code generator program.
+
+    Do not edit the class manually.
+    """
+    def __init__(self, pid: int=None, tracing: bool=None, traced_memory: int=None, peak_memory: int=None, top: List[MemoryAllocation]=None, diff: List[MemoryAllocation]=None):  # noqa: E501
+        """MemorySnapshot - a model defined in Swagger
+
+        :param pid: The pid of this MemorySnapshot.  # noqa: E501
+        :type pid: int
+        :param tracing: The tracing of this MemorySnapshot.  # noqa: E501
+        :type tracing: bool
+        :param traced_memory: The traced_memory of this MemorySnapshot.  # noqa: E501
+        :type traced_memory: int
+        :param peak_memory: The peak_memory of this MemorySnapshot.  # noqa: E501
+        :type peak_memory: int
+        :param top: The top of this MemorySnapshot.  # noqa: E501
+        :type top: List[MemoryAllocation]
+        :param diff: The diff of this MemorySnapshot.  # noqa: E501
+        :type diff: List[MemoryAllocation]
+        """
+        self.swagger_types = {
+            'pid': int,
+            'tracing': bool,
+            'traced_memory': int,
+            'peak_memory': int,
+            'top': List[MemoryAllocation],
+            'diff': List[MemoryAllocation]
+        }
+
+        self.attribute_map = {
+            'pid': 'pid',
+            'tracing': 'tracing',
+            'traced_memory': 'traced_memory',
+            'peak_memory': 'peak_memory',
+            'top': 'top',
+            'diff': 'diff'
+        }
+        self._pid = pid
+        self._tracing = tracing
+        self._traced_memory = traced_memory
+        self._peak_memory = peak_memory
+        self._top = top
+        self._diff = diff
+
+    @classmethod
+    def from_dict(cls, dikt) -> 'MemorySnapshot':
+        """Returns the dict as a model
+
+        :param dikt: A dict.
+        :type: dict
+        :return: The MemorySnapshot of this MemorySnapshot.  # noqa: E501
+        :rtype: MemorySnapshot
+        """
+        return util.deserialize_model(dikt, cls)
+
+    @property
+    def pid(self) -> int:
+        """Gets the pid of this MemorySnapshot.
+
+
+        :return: The pid of this MemorySnapshot.
+        :rtype: int
+        """
+        return self._pid
+
+    @pid.setter
+    def pid(self, pid: int):
+        """Sets the pid of this MemorySnapshot.
+
+
+        :param pid: The pid of this MemorySnapshot.
+        :type pid: int
+        """
+
+        self._pid = pid
+
+    @property
+    def tracing(self) -> bool:
+        """Gets the tracing of this MemorySnapshot.
+
+
+        :return: The tracing of this MemorySnapshot.
+        :rtype: bool
+        """
+        return self._tracing
+
+    @tracing.setter
+    def tracing(self, tracing: bool):
+        """Sets the tracing of this MemorySnapshot.
+
+
+        :param tracing: The tracing of this MemorySnapshot.
+        :type tracing: bool
+        """
+
+        self._tracing = tracing
+
+    @property
+    def traced_memory(self) -> int:
+        """Gets the traced_memory of this MemorySnapshot.
+
+
+        :return: The traced_memory of this MemorySnapshot.
+        :rtype: int
+        """
+        return self._traced_memory
+
+    @traced_memory.setter
+    def traced_memory(self, traced_memory: int):
+        """Sets the traced_memory of this MemorySnapshot.
+
+
+        :param traced_memory: The traced_memory of this MemorySnapshot.
+        :type traced_memory: int
+        """
+
+        self._traced_memory = traced_memory
+
+    @property
+    def peak_memory(self) -> int:
+        """Gets the peak_memory of this MemorySnapshot.
+
+
+        :return: The peak_memory of this MemorySnapshot.
+        :rtype: int
+        """
+        return self._peak_memory
+
+    @peak_memory.setter
+    def peak_memory(self, peak_memory: int):
+        """Sets the peak_memory of this MemorySnapshot.
+
+
+        :param peak_memory: The peak_memory of this MemorySnapshot.
+        :type peak_memory: int
+        """
+
+        self._peak_memory = peak_memory
+
+    @property
+    def top(self) -> List[MemoryAllocation]:
+        """Gets the top of this MemorySnapshot.
+
+
+        :return: The top of this MemorySnapshot.
+        :rtype: List[MemoryAllocation]
+        """
+        return self._top
+
+    @top.setter
+    def top(self, top: List[MemoryAllocation]):
+        """Sets the top of this MemorySnapshot.
+
+
+        :param top: The top of this MemorySnapshot.
+        :type top: List[MemoryAllocation]
+        """
+
+        self._top = top
+
+    @property
+    def diff(self) -> List[MemoryAllocation]:
+        """Gets the diff of this MemorySnapshot.
+
+
+        :return: The diff of this MemorySnapshot.
+        :rtype: List[MemoryAllocation]
+        """
+        return self._diff
+
+    @diff.setter
+    def diff(self, diff: List[MemoryAllocation]):
+        """Sets the diff of this MemorySnapshot.
+
+
+        :param diff: The diff of this MemorySnapshot.
+        :type diff: List[MemoryAllocation]
+        """
+
+        self._diff = diff
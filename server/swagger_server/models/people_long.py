@@ -7,6 +7,7 @@ from typing import List, Dict  # noqa: F401
 
 from swagger_server.models.base_model_ import Model
 from swagger_server.models.preferences import Preferences  # noqa: F401,E501
+from swagger_server.models.ssh_key_long import SshKeyLong  # noqa: F401,E501
 from swagger_server import util
 
 
@@ -15,7 +16,7 @@ class PeopleLong(Model):
 
     Do not edit the class manually.
     """
-    def __init__(self, uuid: str=None, name: str=None, email: str=None, eppn: str=None, oidc_claim_sub: str=None, bastion_login: str=None, prefs: Preferences=None):  # noqa: E501
+    def __init__(self, uuid: str=None, name: str=None, email: str=None, eppn: str=None, oidc_claim_sub: str=None, bastion_login: str=None, prefs: Preferences=None, sshkeys: List[SshKeyLong]=None):  # noqa: E501
         """PeopleLong - a model defined in Swagger
 
         :param uuid: The uuid of this PeopleLong.  # noqa: E501
@@ -32,6 +33,8 @@ class PeopleLong(Model):
         :type bastion_login: str
         :param prefs: The prefs of this PeopleLong.  # noqa: E501
         :type prefs: Preferences
+        :param sshkeys: The sshkeys of this PeopleLong.  # noqa: E501
+        :type sshkeys: List[SshKeyLong]
         """
         self.swagger_types = {
             'uuid': str,
@@ -40,7 +43,8 @@ class PeopleLong(Model):
             'eppn': str,
             'oidc_claim_sub': str,
             'bastion_login': str,
-            'prefs': Preferences
+            'prefs': Preferences,
+            'sshkeys': List[SshKeyLong]
         }
 
         self.attribute_map = {
@@ -50,7 +54,8 @@ class PeopleLong(Model):
             'eppn': 'eppn',
             'oidc_claim_sub': 'oidc_claim_sub',
             'bastion_login': 'bastion_login',
-            'prefs': 'prefs'
+            'prefs': 'prefs',
+            'sshkeys': 'sshkeys'
         }
         self._uuid = uuid
         self._name = name
@@ -59,6 +64,7 @@ class PeopleLong(Model):
         self._oidc_claim_sub = oidc_claim_sub
         self._bastion_login = bastion_login
         self._prefs = prefs
+        self._sshkeys = sshkeys
 
     @classmethod
     def from_dict(cls, dikt) -> 'PeopleLong':
@@ -217,3 +223,24 @@ class PeopleLong(Model):
         """
 
         self._prefs = prefs
+
+    @property
+    def sshkeys(self) -> List[SshKeyLong]:
+        """Gets the sshkeys of this PeopleLong.
+
+
+        :return: The sshkeys of this PeopleLong.
+        :rtype: List[SshKeyLong]
+        """
+        return self._sshkeys
+
+    @sshkeys.setter
+    def sshkeys(self, sshkeys: List[SshKeyLong]):
+        """Sets the sshkeys of this PeopleLong.
+
+
+        :param sshkeys: The sshkeys of this PeopleLong.
+        :type sshkeys: List[SshKeyLong]
+        """
+
+        self._sshkeys = sshkeys
@@ -0,0 +1,89 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+from datetime import date, datetime  # noqa: F401
+
+from typing import List, Dict  # noqa: F401
+
+from swagger_server.models.base_model_ import Model
+from swagger_server.models.ssh_key_bastion import SshKeyBastion  # noqa: F401,E501
+from swagger_server import util
+
+
+class SshKeyBastionFeed(Model):
+    """NOTE: This class is auto generated by the swagger code generator program.
+
+    Do not edit the class manually.
+    """
+    def __init__(self, keys: List[SshKeyBastion]=None, next_cursor: str=None):  # noqa: E501
+        """SshKeyBastionFeed - a model defined in Swagger
+
+        :param keys: The keys of this SshKeyBastionFeed.  # noqa: E501
+        :type keys: List[SshKeyBastion]
+        :param next_cursor: The next_cursor of this SshKeyBastionFeed.  # noqa: E501
+        :type next_cursor: str
+        """
+        self.swagger_types = {
+            'keys': List[SshKeyBastion],
+            'next_cursor': str
+        }
+
+        self.attribute_map = {
+            'keys': 'keys',
+            'next_cursor': 'next_cursor'
+        }
+        self._keys = keys
+        self._next_cursor = next_cursor
+
+    @classmethod
+    def from_dict(cls, dikt) -> 'SshKeyBastionFeed':
+        """Returns the dict as a model
+
+        :param dikt: A dict.
+        :type: dict
+        :return: The SshKeyBastionFeed of this SshKeyBastionFeed.  # noqa: E501
+        :rtype: SshKeyBastionFeed
+        """
+        return util.deserialize_model(dikt, cls)
+
+    @property
+    def keys(self) -> List[SshKeyBastion]:
+        """Gets the keys of this SshKeyBastionFeed.
+
+
+        :return: The keys of this SshKeyBastionFeed.
+        :rtype: List[SshKeyBastion]
+        """
+        return self._keys
+
+    @keys.setter
+    def keys(self, keys: List[SshKeyBastion]):
+        """Sets the keys of this SshKeyBastionFeed.
+
+
+        :param keys: The keys of this SshKeyBastionFeed.
+        :type keys: List[SshKeyBastion]
+        """
+
+        self._keys = keys
+
+    @property
+    def next_cursor(self) -> str:
+        """Gets the next_cursor of this SshKeyBastionFeed.
+
+
+        :return: The next_cursor of this SshKeyBastionFeed.
+        :rtype: str
+        """
+        return self._next_cursor
+
+    @next_cursor.setter
+    def next_cursor(self, next_cursor: str):
+        """Sets the next_cursor of this SshKeyBastionFeed.
+
+
+        :param next_cursor: The next_cursor of this SshKeyBastionFeed.
+        :type next_cursor: str
+        """
+
+        self._next_cursor = next_cursor
@@ -0,0 +1,121 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+from datetime import date, datetime  # noqa: F401
+
+from typing import List, Dict  # noqa: F401
+
+from swagger_server.models.base_model_ import Model
+from swagger_server.models.ssh_key_type import SshKeyType  # noqa: F401,E501
+from swagger_server import util
+
+
+class SshKeyUpload(Model):
+    """NOTE: This class is auto generated by the swagger code generator program.
+
+    Do not edit the class manually.
+    """
+    def __init__(self, public_openssh: str=None, description: str=None, keytype: SshKeyType=None):  # noqa: E501
+        """SshKeyUpload - a model defined in Swagger
+
+        :param public_openssh: The public_openssh of this SshKeyUpload.  # noqa: E501
+        :type public_openssh: str
+        :param description: The description of this SshKeyUpload.  # noqa: E501
+        :type description: str
+        :param keytype: The keytype of this SshKeyUpload.  # noqa: E501
+        :type keytype: SshKeyType
+        """
+        self.swagger_types = {
+            'public_openssh': str,
+            'description': str,
+            'keytype': SshKeyType
+        }
+
+        self.attribute_map = {
+            'public_openssh': 'public_openssh',
+            'description': 'description',
+            'keytype': 'keytype'
+        }
+        self._public_openssh = public_openssh
+        self._description = description
+        self._keytype = keytype
+
+    @classmethod
+    def from_dict(cls, dikt) -> 'SshKeyUpload':
+        """Returns the dict as a model
+
+        :param dikt: A dict.
+        :type: dict
+        :return: The SshKeyUpload of this SshKeyUpload.  # noqa: E501
+        :rtype: SshKeyUpload
+        """
+        return util.deserialize_model(dikt, cls)
+
+    @property
+    def public_openssh(self) -> str:
+        """Gets the public_openssh of this SshKeyUpload.
+
+
+        :return: The public_openssh of this SshKeyUpload.
+        :rtype: str
+        """
+        return self._public_openssh
+
+    @public_openssh.setter
+    def public_openssh(self, public_openssh: str):
+        """Sets the public_openssh of this SshKeyUpload.
+
+
+        :param public_openssh: The public_openssh of this SshKeyUpload.
+        :type public_openssh: str
+        """
+        if public_openssh is None:
+            raise ValueError("Invalid value for `public_openssh`, must not be `None`")  # noqa: E501
+
+        self._public_openssh = public_openssh
+
+    @property
+    def description(self) -> str:
+        """Gets the description of this SshKeyUpload.
+
+
+        :return: The description of this SshKeyUpload.
+        :rtype: str
+        """
+        return self._description
+
+    @description.setter
+    def description(self, description: str):
+        """Sets the description of this SshKeyUpload.
+
+
+        :param description: The description of this SshKeyUpload.
+        :type description: str
+        """
+        if description is None:
+            raise ValueError("Invalid value for `description`, must not be `None`")  # noqa: E501
+
+        self._description = description
+
+    @property
+    def keytype(self) -> SshKeyType:
+        """Gets the keytype of this SshKeyUpload.
+
+
+        :return: The keytype of this SshKeyUpload.
+        :rtype: SshKeyType
+        """
+        return self._keytype
+
+    @keytype.setter
+    def keytype(self, keytype: SshKeyType):
+        """Sets the keytype of this SshKeyUpload.
+
+
+        :param keytype: The keytype of this SshKeyUpload.
+        :type keytype: SshKeyType
+        """
+        if keytype is None:
+            raise ValueError("Invalid value for `keytype`, must not be `None`")  # noqa: E501
+
+        self._keytype = keytype
@@ -0,0 +1,140 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+from datetime import date, datetime  # noqa: F401
+
+from typing import List, Dict  # noqa: F401
+
+from swagger_server.models.base_model_ import Model
+from swagger_server import util
+
+
+class SshKeyUploadResult(Model):
+    """NOTE: This class is auto generated by the swagger code generator program.
+
+    Do not edit the class manually.
+    """
+    def __init__(self, fingerprint: str=None, key_uuid: str=None, status: int=None, error: str=None):  # noqa: E501
+        """SshKeyUploadResult - a model defined in Swagger
+
+        :param fingerprint: The fingerprint of this SshKeyUploadResult.  # noqa: E501
+        :type fingerprint: str
+        :param key_uuid: The key_uuid of this SshKeyUploadResult.  # noqa: E501
+        :type key_uuid: str
+        :param status: The status of this SshKeyUploadResult.  # noqa: E501
+        :type status: int
+        :param error: The error of this SshKeyUploadResult.  # noqa: E501
+        :type error: str
+        """
+        self.swagger_types = {
+            'fingerprint': str,
+            'key_uuid': str,
+            'status': int,
+            'error': str
+        }
+
+        self.attribute_map = {
+            'fingerprint': 'fingerprint',
+            'key_uuid': 'key_uuid',
+            'status': 'status',
+            'error': 'error'
+        }
+        self._fingerprint = fingerprint
+        self._key_uuid = key_uuid
+        self._status = status
+        self._error = error
+
+    @classmethod
+    def from_dict(cls, dikt) -> 'SshKeyUploadResult':
+        """Returns the dict as a model
+
+        :param dikt: A dict.
+        :type: dict
+        :return: The SshKeyUploadResult of this SshKeyUploadResult.  # noqa: E501
+        :rtype: SshKeyUploadResult
+        """
+        return util.deserialize_model(dikt, cls)
+
+    @property
+    def fingerprint(self) -> str:
+        """Gets the fingerprint of this SshKeyUploadResult.
+
+
+        :return: The fingerprint of this SshKeyUploadResult.
+        :rtype: str
+        """
+        return self._fingerprint
+
+    @fingerprint.setter
+    def fingerprint(self, fingerprint: str):
+        """Sets the fingerprint of this SshKeyUploadResult.
+
+
+        :param fingerprint: The fingerprint of this SshKeyUploadResult.
+        :type fingerprint: str
+        """
+
+        self._fingerprint = fingerprint
+
+    @property
+    def key_uuid(self) -> str:
+        """Gets the key_uuid of this SshKeyUploadResult.
+
+
+        :return: The key_uuid of this SshKeyUploadResult.
+        :rtype: str
+        """
+        return self._key_uuid
+
+    @key_uuid.setter
+    def key_uuid(self, key_uuid: str):
+        """Sets the key_uuid of this SshKeyUploadResult.
+
+
+        :param key_uuid: The key_uuid of this SshKeyUploadResult.
+        :type key_uuid: str
+        """
+
+        self._key_uuid = key_uuid
+
+    @property
+    def status(self) -> int:
+        """Gets the status of this SshKeyUploadResult.
+
+
+        :return: The status of this SshKeyUploadResult.
+        :rtype: int
+        """
+        return self._status
+
+    @status.setter
+    def status(self, status: int):
+        """Sets the status of this SshKeyUploadResult.
+
+
+        :param status: The status of this SshKeyUploadResult.
+        :type status: int
+        """
+
+        self._status = status
+
+    @property
+    def error(self) -> str:
+        """Gets the error of this SshKeyUploadResult.
+
+
+        :return: The error of this SshKeyUploadResult.
+        :rtype: str
+        """
+        return self._error
+
+    @error.setter
+    def error(self, error: str):
+        """Sets the error of this SshKeyUploadResult.
+
+
+        :param error: The error of this SshKeyUploadResult.
+        :type error: str
+        """
+
+        self._error = error
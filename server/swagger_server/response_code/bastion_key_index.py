@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# MIT License
+#
+# Copyright (c) 2020 FABRIC Testbed
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from swagger_server.database import Session
+from swagger_server.database.key_changes import bastion_key_listener
+from swagger_server.database.models import DbSshKey, FabricPerson
+from swagger_server.instrumentation import metrics
+from swagger_server.response_code.utils import log
+
+"""
+Per-process in-memory index of authorized_keys lines by bastion login for
+sshd AuthorizedKeysCommand lookups. It is loaded by the bastion key listener
+thread once it is connected and then brought up to date incrementally (by
+change_seq) from that thread whenever a bastion key change is notified, so a
+lookup touches neither the database nor COmanage.
+"""
+
+# how long the first lookup in a process waits for the index to be loaded
+INDEX_LOAD_WAIT_SECONDS = 5
+# cache label of lookups in metrics
+INDEX_CACHE = 'bastion_key_index'
+INDEX_COLUMNS = (DbSshKey.key_uuid, DbSshKey.expires_on, DbSshKey.authorized_key, DbSshKey.change_seq,
+                 FabricPerson.bastion_login)
+
+
+class BastionKeyIndex:
+    """
+    Active bastion keys by login. Each login maps to an immutable tuple of
+    (key_uuid, expires_on, line) that refreshes replace as a whole, so lookups
+    can read it without locking. Keys that expired but were not deactivated
+    yet are filtered out at lookup time.
+    """
+
+    def __init__(self, key_type: str):
+        self._key_type = key_type
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._keys: Dict[str, Tuple] = dict()
+        # login each indexed key is filed under, to move keys of people whose login changed
+        self._logins: Dict[str, str] = dict()
+        # highest change_seq applied, None until loaded
+        self._seq = None
+        bastion_key_listener.subscribe(self._refresh)
+
+    def lookup(self, login: str) -> Optional[List[str]]:
+        """
+        Return authorized_keys lines of unexpired active keys of this login,
+        None if the index could not be loaded.
+        """
+        # starts the listener thread in this process if needed, which loads the index
+        bastion_key_listener.generation()
+        if not self._loaded.is_set():
+            metrics.cache_miss(INDEX_CACHE)
+            if not self._loaded.wait(INDEX_LOAD_WAIT_SECONDS):
+                return None
+        else:
+            metrics.cache_hit(INDEX_CACHE)
+        now = datetime.now(timezone.utc)
+        return [line for _, expires_on, line in self._keys.get(login, ()) if expires_on > now]
+
+    def _refresh(self):
+        """
+        Load or update the index, called from the listener thread
+        """
+        with self._lock:
+            try:
+                with Session() as session:
+                    with session.begin():
+                        if self._seq is None:
+                            self._load(session)
+                        else:
+                            self._update(session)
+            except Exception as e:
+                # retried on the next notification or keepalive, serve what we have meanwhile
+                log.error(f'Unable to refresh bastion key index due to {e}')
+                return
+        self._loaded.set()
+
+    def _load(self, session):
+        """
+        Load all active keys up to the latest change
+        """
+        latest_seq = session.query(func.max(DbSshKey.change_seq)).\
+            filter(DbSshKey.fabric_key_type == self._key_type).scalar() or 0
+        # keys changed after latest_seq are picked up by the next update
+        query = session.query(*INDEX_COLUMNS).\
+            filter(DbSshKey.change_seq <= latest_seq,
+                   DbSshKey.active == True,
+                   DbSshKey.fabric_key_type == self._key_type,
+                   DbSshKey.owner_uuid == FabricPerson.uuid)
+        keys = dict()
+        logins = dict()
+        for row in query.all():
+            keys[row.bastion_login] = keys.get(row.bastion_login, ()) + \
+                ((row.key_uuid, row.expires_on, row.authorized_key),)
+            logins[row.key_uuid] = row.bastion_login
+        self._keys = keys
+        self._logins = logins
+        self._seq = latest_seq
+        log.info(f'Loaded {len(logins)} bastion keys of {len(keys)} logins up to change {latest_seq}')
+
+    def _update(self, session):
+        """
+        Apply changes made after the last one seen, in order. A key gets a new
+        change_seq when it is added or deactivated and when its owner's login
+        changes, so it is removed from wherever it was filed and re-added under
+        its owner's current login if still active.
+        """
+        query = session.query(*INDEX_COLUMNS, DbSshKey.active).\
+            filter(DbSshKey.change_seq > self._seq,
+                   DbSshKey.fabric_key_type == self._key_type,
+                   DbSshKey.owner_uuid == FabricPerson.uuid).\
+            order_by(DbSshKey.change_seq)
+        query_result = query.all()
+        for row in query_result:
+            login = self._logins.pop(row.key_uuid, None)
+            if login is not None:
+                self._file(login, tuple(k for k in self._keys.get(login, ()) if k[0] != row.key_uuid))
+            if row.active:
+                self._file(row.bastion_login, self._keys.get(row.bastion_login, ()) +
+                           ((row.key_uuid, row.expires_on, row.authorized_key),))
+                self._logins[row.key_uuid] = row.bastion_login
+            self._seq = row.change_seq
+        if len(query_result) > 0:
+            log.debug(f'Applied {len(query_result)} bastion key changes up to change {self._seq}')
+
+    def _file(self, login: str, keys: Tuple):
+        if len(keys) > 0:
+            self._keys[login] = keys
+        else:
+            self._keys.pop(login, None)
@@ -1,7 +1,20 @@
+from flask import Response
+
 from swagger_server.models.version import Version  # noqa: E501
+from swagger_server.instrumentation.metrics import metrics_text
 from swagger_server.database.models import Version as DbVersion
 from swagger_server.response_code.utils import log
-from swagger_server.database import Session
+from swagger_server.database.request_session import request_session
+
+
+def metrics_get():  # noqa: E501
+    """metrics
+    Prometheus metrics of all server processes # noqa: E501
+    :rtype: str
+    """
+
+    body, content_type = metrics_text()
+    return Response(body, content_type=content_type)
 
 
 def version_get():  # noqa: E501
@@ -10,8 +23,8 @@ def version_get():  # noqa: E501
     :rtype: Version
     """
 
-    with Session() as session:
-        log.info(f'Fetching version information')
-        query_result = session.query(DbVersion).one()
-        return Version(query_result.version, query_result.gitsha1)
+    session = request_session()
+    log.info(f'Fetching version information')
+    query_result = session.query(DbVersion).one()
+    return Version(query_result.version, query_result.gitsha1)
 
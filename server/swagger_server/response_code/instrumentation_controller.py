@@ -0,0 +1,143 @@
+import os
+import threading
+import tracemalloc
+from http import HTTPStatus
+from typing import List
+
+from flask import request
+
+from fss_utils.http_errors import cors_response
+
+from swagger_server.models.memory_allocation import MemoryAllocation  # noqa: E501
+from swagger_server.models.memory_snapshot import MemorySnapshot  # noqa: E501
+import swagger_server.response_code.utils as utils
+from swagger_server.response_code.utils import log
+
+"""
+Memory diagnostics of the worker process answering the request (each uwsgi
+worker traces and snapshots separately, the pid in responses tells which
+one answered).
+"""
+
+TRACEMALLOC_MAX_FRAMES = 100
+SNAPSHOT_GROUP_BY = ('lineno', 'filename', 'traceback')
+SNAPSHOT_LIMIT = 20
+
+# previous snapshot of this worker that the next one is compared to
+_snapshot_lock = threading.Lock()
+_last_snapshot = None
+
+
+def instrumentation_tracemalloc_start_post(frames=None):  # noqa: E501
+    """start tracing memory allocations in this worker
+    start tracemalloc # noqa: E501
+    :param frames: number of frames kept per allocation
+    :type frames: int
+    :rtype: MemorySnapshot
+    """
+    global _last_snapshot
+    error = _check_admin('/instrumentation/tracemalloc/start')
+    if error is not None:
+        return error
+    frames = 1 if frames is None else frames
+    if frames < 1 or frames > TRACEMALLOC_MAX_FRAMES:
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Number of frames must be between 1 and {TRACEMALLOC_MAX_FRAMES}')
+    with _snapshot_lock:
+        if tracemalloc.is_tracing():
+            log.info(f'Restarting tracemalloc in worker {os.getpid()} with {frames} frames')
+            tracemalloc.stop()
+        else:
+            log.info(f'Starting tracemalloc in worker {os.getpid()} with {frames} frames')
+        _last_snapshot = None
+        tracemalloc.start(frames)
+    return _memory_status()
+
+
+def instrumentation_tracemalloc_stop_post():  # noqa: E501
+    """stop tracing memory allocations in this worker
+    stop tracemalloc # noqa: E501
+    :rtype: MemorySnapshot
+    """
+    global _last_snapshot
+    error = _check_admin('/instrumentation/tracemalloc/stop')
+    if error is not None:
+        return error
+    with _snapshot_lock:
+        log.info(f'Stopping tracemalloc in worker {os.getpid()}')
+        # stopping frees the traces, so there is nothing to compare the next snapshot to
+        tracemalloc.stop()
+        _last_snapshot = None
+    return _memory_status()
+
+
+def instrumentation_tracemalloc_snapshot_get(limit=None, group_by=None):  # noqa: E501
+    """take a snapshot of memory allocations in this worker
+    top allocation sites and the difference to the previous snapshot # noqa: E501
+    :param limit: number of allocation sites returned
+    :type limit: int
+    :param group_by: group allocations by lineno, filename or traceback
+    :type group_by: str
+    :rtype: MemorySnapshot
+    """
+    global _last_snapshot
+    error = _check_admin('/instrumentation/tracemalloc/snapshot')
+    if error is not None:
+        return error
+    limit = SNAPSHOT_LIMIT if limit is None else limit
+    group_by = SNAPSHOT_GROUP_BY[0] if group_by is None else group_by
+    if group_by not in SNAPSHOT_GROUP_BY:
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Allocations can only be grouped by {", ".join(SNAPSHOT_GROUP_BY)}')
+    with _snapshot_lock:
+        if not tracemalloc.is_tracing():
+            log.warn(f'Snapshot requested in worker {os.getpid()} but tracemalloc is not started')
+            return cors_response(HTTPStatus.CONFLICT,
+                                 xerror=f'Memory allocations are not traced in worker {os.getpid()}')
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>')))
+        previous = _last_snapshot
+        _last_snapshot = snapshot
+    ret = _memory_status()
+    ret.top = _allocations(snapshot.statistics(group_by)[0:limit])
+    if previous is not None:
+        ret.diff = _allocations(snapshot.compare_to(previous, group_by)[0:limit])
+    log.info(f'Took memory snapshot in worker {os.getpid()}, {ret.traced_memory} bytes traced')
+    return ret
+
+
+def _check_admin(path: str):
+    """
+    Return an error response unless the request was made with an administrator token
+    """
+    if not utils.any_authenticated_user(request.headers):
+        return cors_response(HTTPStatus.UNAUTHORIZED,
+                             xerror='User not authenticated')
+    if not utils.is_admin_user(request.headers):
+        log.warn(f'User is not an administrator in {path}')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User is not an administrator')
+    return None
+
+
+def _memory_status() -> MemorySnapshot:
+    traced_memory, peak_memory = tracemalloc.get_traced_memory()
+    return MemorySnapshot(pid=os.getpid(), tracing=tracemalloc.is_tracing(), traced_memory=traced_memory,
+                          peak_memory=peak_memory, top=list(), diff=list())
+
+
+def _allocations(statistics) -> List[MemoryAllocation]:
+    """
+    Convert Statistic or StatisticDiff objects of tracemalloc
+    """
+    ret = list()
+    for stat in statistics:
+        allocation = MemoryAllocation(location='\n'.join(stat.traceback.format()), size=stat.size,
+                                      count=stat.count)
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            allocation.size_diff = stat.size_diff
+            allocation.count_diff = stat.count_diff
+        ret.append(allocation)
+    return ret
@@ -24,6 +24,8 @@
 #
 # Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
 
+import json
+
 from flask import request
 from sqlalchemy import or_, and_
 
@@ -31,13 +33,28 @@ from http import HTTPStatus
 from fss_utils.http_errors import cors_response
 
 from swagger_server.database import Session
-from swagger_server.database.models import FabricPerson
+from swagger_server.database.request_session import request_session
+from swagger_server.database.models import FabricPerson, PreferenceType, renumber_keys
 from swagger_server.models.people_long import PeopleLong  # noqa: E501
 from swagger_server import QUERY_CHARACTER_MIN, QUERY_LIMIT
 import swagger_server.response_code.utils as utils
+from swagger_server.response_code import sshkey_controller
 from swagger_server.response_code.utils import log
 from fss_utils.sshkey import FABRICSSHKey
 
+# related resources /whoami can embed and the PeopleLong attributes holding them
+WHOAMI_INCLUDES = {
+    'preferences': 'prefs',
+    'sshkeys': 'sshkeys',
+}
+# preference types people can be looked up by (GIN indexed) and whether only administrators can do it
+PREFERENCES_SEARCH_ADMIN_ONLY = {
+    PreferenceType.interests.name: False,
+    PreferenceType.settings.name: True,
+}
+# maximum number of people returned by one preferences lookup
+PREFERENCES_SEARCH_LIMIT = 1000
+
 
 def people_get(person_name=None):  # noqa: E501
     """list of people
@@ -58,48 +75,71 @@ def people_get(person_name=None):  # noqa: E501
         return cors_response(HTTPStatus.BAD_REQUEST,
                              xerror='Insufficient number of characters or bad name')
 
-    with Session() as session:
-        status, active_flag = utils.check_user_active(session, request.headers)
-        if status != 200:
-            log.error(f'Problem {status} contacting COmanage for active user check in /people')
-            return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                 xerror=f'Error {status} contacting COmanage')
+    session = request_session()
+    status, active_flag = utils.check_user_active(session, request.headers)
+    if status != 200:
+        log.error(f'Problem {status} contacting COmanage for active user check in /people')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
 
-        if not active_flag:
-            log.warn(f'User is not an active user in /people')
-            return cors_response(HTTPStatus.FORBIDDEN,
-                                 xerror='User is not an active user')
+    if not active_flag:
+        log.warn(f'User is not an active user in /people')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User is not an active user')
 
-        # query by name and email
-        query = session.query(FabricPerson).\
-            filter(or_(FabricPerson.name.ilike("%{}%".format(str(person_name))),
-            FabricPerson.email.ilike("%{}%".format(str(person_name))))).limit(QUERY_LIMIT)
+    # query by name and email
+    query = session.query(FabricPerson).\
+        filter(or_(FabricPerson.name.ilike("%{}%".format(str(person_name))),
+        FabricPerson.email.ilike("%{}%".format(str(person_name))))).limit(QUERY_LIMIT)
 
-        query_result = query.all()
+    query_result = query.all()
 
-        if len(query_result) == 0:
-            log.warn(f'No matching users found for {person_name} in /people')
-            return cors_response(HTTPStatus.NOT_FOUND,
-                                 xerror='No matches for people found.')
+    if len(query_result) == 0:
+        log.warn(f'No matching users found for {person_name} in /people')
+        return cors_response(HTTPStatus.NOT_FOUND,
+                             xerror='No matches for people found.')
 
-        response = []
-        for person in query_result:
-            ps = utils.fill_people_short_from_person(person)
-            response.append(ps)
+    response = []
+    for person in query_result:
+        ps = utils.fill_people_short_from_person(person)
+        response.append(ps)
 
-        return response
+    return utils.negotiated_response(response)
 
 
-def people_whoami_get():  # noqa: E501
+def people_whoami_get(fields=None, include=None):  # noqa: E501
     """
     Self details by OIDC Claim sub contained in token# noqa: E501
     If a person doesn't exist, it gets created.
+    Related resources (preferences, active SSH keys) can be included
+    in the same response.
+    :param fields: attributes to return, all if not given
+    :type fields: List[str]
+    :param include: related resources to include
+    :type include: List[str]
     :rtype: PeopleLong
     """
     if not utils.any_authenticated_user(request.headers):
         return cors_response(HTTPStatus.UNAUTHORIZED,
                              xerror='User not authenticated')
 
+    fields, error = utils.parse_fields(fields, PeopleLong)
+    if error is not None:
+        log.error(f'Bad /whoami request: {error}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=error)
+
+    include = set(include or [])
+    unknown = include - WHOAMI_INCLUDES.keys()
+    if len(unknown) > 0:
+        log.error(f'Bad /whoami request: unknown includes {sorted(unknown)}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Unknown include {", ".join(sorted(unknown))}, '
+                                    f'expected {", ".join(WHOAMI_INCLUDES)}')
+    # included resources are returned even if not listed in fields
+    if fields is not None:
+        fields |= {WHOAMI_INCLUDES[name] for name in include}
+
     # trust the token, get claim sub from it
     # if token is absent, this helps portal figure out if user is not authenticated
     # so don't panic, just return 'Unauthorized'
@@ -109,111 +149,208 @@ def people_whoami_get():  # noqa: E501
         return cors_response(HTTPStatus.FORBIDDEN,
                              xerror="No OIDC Claim Sub found or ID token missing")
 
-    with Session() as session:
-        query = session.query(FabricPerson).filter(FabricPerson.oidc_claim_sub == oidc_claim_sub)
+    session = request_session()
+    # preferences are only loaded if needed after checking the ETag
+    query = session.query(FabricPerson).filter(FabricPerson.oidc_claim_sub == oidc_claim_sub)
 
-        query_result = query.all()
+    query_result = query.all()
 
-        if len(query_result) == 0:
-            # create a new FabricPerson in db, fill in information from the claim sub
-            utils.create_new_fabric_person_from_token(request.headers)
-            # re-query after insertion
-            query = session.query(FabricPerson).filter(FabricPerson.oidc_claim_sub == oidc_claim_sub)
-            query_result = query.all()
-            if len(query_result) != 1:
-                log.error('Unable to insert new user into UIS database in /whoami')
-                return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                     xerror='Insertion in UIS database failed')
-        else:
-            if len(query_result) > 1:
-                log.warn(f'Duplicate ODIC claim found in the database {str(oidc_claim_sub)} in /whoami')
-                return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                     xerror='Duplicate OIDC Claim Found: {0}'.format(str(oidc_claim_sub)))
-
-        person = query_result[0]
-        # check with COmanage they are an active user
-        status, active_flag, co_person_id = utils.comanage_check_active_person(person)
-        if status != 200:
-            log.error(f'Error {status} contacting comanage in /whoami')
+    if len(query_result) == 0:
+        # create a new FabricPerson in db, fill in information from the claim sub
+        utils.create_new_fabric_person_from_token(request.headers)
+        # re-query after insertion
+        query = session.query(FabricPerson).filter(FabricPerson.oidc_claim_sub == oidc_claim_sub)
+        query_result = query.all()
+        if len(query_result) != 1:
+            log.error('Unable to insert new user into UIS database in /whoami')
             return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                 xerror=f'Error {status} contacting COmanage')
-
-        commit_needed = False
-        if co_person_id is not None:
-            # (over)write Id to the database (fresh value or after a purge)
-            person.co_person_id = co_person_id
-            commit_needed = True
-
-        # they may also have bastion_login missing
-        if person.bastion_login is None:
-            person.bastion_login = FABRICSSHKey.bastion_login(person.oidc_claim_sub, person.email)
-            commit_needed = True
-
-        if not active_flag:
-            log.warn(f'User co_person_id={co_person_id} is not an active user in /people/whoami')
-            return cors_response(HTTPStatus.FORBIDDEN,
-                                 xerror='User not an active user')
-
-        # sometimes we don't get a name from the token
-        # so get it from COmanage
-        if person.name is None or len(person.name) == 0:
-            code, name = utils.comanage_get_person_name(co_person_id)
-            if name is not None:
-                setattr(person, 'name', name)
-                commit_needed = True
-
-        if commit_needed:
-            session.commit()
-
-        return utils.fill_people_long_from_person(person)
-
-
-def people_uuid_get(uuid):  # noqa: E501
+                                 xerror='Insertion in UIS database failed')
+    else:
+        if len(query_result) > 1:
+            log.warn(f'Duplicate ODIC claim found in the database {str(oidc_claim_sub)} in /whoami')
+            return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                                 xerror='Duplicate OIDC Claim Found: {0}'.format(str(oidc_claim_sub)))
+
+    person = query_result[0]
+    if 'sshkeys' in include:
+        # commits on its own and takes the key change lock, so before the person is changed or flushed
+        sshkey_controller.update_keys()
+    # keys carry these, see renumber_keys()
+    owner_view = (person.bastion_login, person.gecos)
+    # check with COmanage they are an active user
+    status, active_flag, co_person_id = utils.comanage_check_active_person(person)
+    if status != 200:
+        log.error(f'Error {status} contacting comanage in /whoami')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
+
+    # changes are committed at the end of the request
+    if co_person_id is not None:
+        # (over)write Id to the database (fresh value or after a purge)
+        person.co_person_id = co_person_id
+
+    # they may also have bastion_login missing
+    if person.bastion_login is None:
+        person.bastion_login = FABRICSSHKey.bastion_login(person.oidc_claim_sub, person.email)
+
+    if not active_flag:
+        log.warn(f'User co_person_id={co_person_id} is not an active user in /people/whoami')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User not an active user')
+
+    # sometimes we don't get a name from the token
+    # so get it from COmanage
+    if person.name is None or len(person.name) == 0:
+        code, name = utils.comanage_get_person_name(co_person_id)
+        if name is not None:
+            setattr(person, 'name', name)
+
+    # write the changes made above so they are part of the version
+    session.flush()
+    if (person.bastion_login, person.gecos) != owner_view:
+        # the new login and GECOS must be visible before the keys get renumbered
+        session.commit()
+        with Session() as key_session:
+            with key_session.begin():
+                renumber_keys(key_session, person.uuid)
+    keys_version = sshkey_controller.active_keys_version(session, person.uuid, update=False) \
+        if 'sshkeys' in include else ()
+    etag = utils.make_etag(person.uuid, person.version, sorted(fields or []), sorted(include), *keys_version)
+    if utils.etag_matches(request.headers, etag):
+        return utils.not_modified(etag)
+
+    response = utils.fill_people_long_from_person(person, fields)
+    if 'sshkeys' in include:
+        # same session and authorization as the person, no separate /sshkeys round trip
+        response.sshkeys = sshkey_controller.active_keys(session, person.uuid, update=False)
+    return response, HTTPStatus.OK, {utils.ETAG: etag}
+
+
+def people_uuid_get(uuid, fields=None):  # noqa: E501
     """person details by UUID
     Person details by UUID # noqa: E501
     :param uuid: People identifier as UUID
     :type uuid: str
+    :param fields: attributes to return, all if not given
+    :type fields: List[str]
     :rtype: PeopleLong
     """
     if not utils.any_authenticated_user(request.headers):
         return cors_response(HTTPStatus.UNAUTHORIZED,
                              xerror='User not authenticated')
 
+    fields, error = utils.parse_fields(fields, PeopleLong)
+    if error is not None:
+        log.error(f'Bad /people/uuid request: {error}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=error)
+
     uuid = str(uuid).strip()
     if not utils.validate_uuid_by_oidc_claim(request.headers, uuid):
         log.error(f'OIDC Claim Sub doesnt match uuid {uuid} in /people/uuid')
         return cors_response(HTTPStatus.FORBIDDEN,
                              xerror="OIDC Claim Sub doesnt match UUID")
 
-    with Session() as session:
-        status, active_flag = utils.check_user_active(session, request.headers)
-        if status != 200:
-            log.error(f'Error {status} contacting COmanage in /uuid/oidc_claim_sub')
-            return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                 xerror=f'Error {status} contacting COmanage')
+    session = request_session()
+    status, active_flag = utils.check_user_active(session, request.headers)
+    if status != 200:
+        log.error(f'Error {status} contacting COmanage in /uuid/oidc_claim_sub')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
 
-        if not active_flag:
-            log.warn(f'User is not an active user in /uuid/oidc_claim_sub')
-            return cors_response(HTTPStatus.FORBIDDEN,
-                                 xerror='User not an active user')
+    if not active_flag:
+        log.warn(f'User is not an active user in /uuid/oidc_claim_sub')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User not an active user')
 
-        query = session.query(FabricPerson).filter(FabricPerson.uuid == uuid)
+    # preferences are only loaded if needed after checking the ETag
+    query = session.query(FabricPerson).filter(FabricPerson.uuid == uuid)
 
-        query_result = query.all()
+    query_result = query.all()
 
-        if len(query_result) == 0:
-            log.warn(f'Person UUID {uuid} not found in /people/uuid')
-            return cors_response(HTTPStatus.NOT_FOUND,
-                                 xerror='Person UUID not found: {0}'.format(str(uuid)))
+    if len(query_result) == 0:
+        log.warn(f'Person UUID {uuid} not found in /people/uuid')
+        return cors_response(HTTPStatus.NOT_FOUND,
+                             xerror='Person UUID not found: {0}'.format(str(uuid)))
 
-        if len(query_result) > 1:
-            log.warn(f'Duplicate UUID {uuid} found in /people/uuid')
-            return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                 xerror='Duplicate UUID Found: {0}'.format(str(uuid)))
+    if len(query_result) > 1:
+        log.warn(f'Duplicate UUID {uuid} found in /people/uuid')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror='Duplicate UUID Found: {0}'.format(str(uuid)))
+
+    person = query_result[0]
 
-        person = query_result[0]
+    etag = utils.make_etag(person.uuid, person.version, sorted(fields or []))
+    if utils.etag_matches(request.headers, etag):
+        return utils.not_modified(etag)
 
-        return utils.fill_people_long_from_person(person)
+    return utils.fill_people_long_from_person(person, fields), HTTPStatus.OK, {utils.ETAG: etag}
+
+
+def people_preferences_preftype_get(preftype, contains, offset=None, limit=None):  # noqa: E501
+    """people whose preferences of a type contain a JSON value
+    Reverse lookup over preferences (e.g. who follows a project), interests
+    are open to active users, settings only to administrators # noqa: E501
+    :param preftype: preference type searched
+    :type preftype: str
+    :param contains: JSON object the preferences must contain
+    :type contains: str
+    :param offset: number of matching people to skip
+    :type offset: int
+    :param limit: maximum number of people to return
+    :type limit: int
+    :rtype: List[PeopleShort]
+    """
+    if not utils.any_authenticated_user(request.headers):
+        return cors_response(HTTPStatus.UNAUTHORIZED,
+                             xerror='User not authenticated')
+
+    if preftype not in PREFERENCES_SEARCH_ADMIN_ONLY.keys():
+        log.warn(f'Invalid preference type {str(preftype)} in /people/preferences/preftype')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'People can only be searched by {", ".join(PREFERENCES_SEARCH_ADMIN_ONLY)}')
+
+    offset = 0 if offset is None else offset
+    limit = QUERY_LIMIT if limit is None else limit
+    if offset < 0 or limit < 1 or limit > PREFERENCES_SEARCH_LIMIT:
+        log.error(f'Bad /people/preferences/preftype request - {offset=} {limit=}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Offset must not be negative and limit must be between 1 '
+                                    f'and {PREFERENCES_SEARCH_LIMIT}')
+
+    try:
+        value = json.loads(contains)
+    except (TypeError, ValueError):
+        value = None
+    if not isinstance(value, dict) or len(value) == 0:
+        log.error(f'Bad /people/preferences/preftype request - contains is not a JSON object')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror='Parameter contains must be a non-empty JSON object')
+
+    session = request_session()
+    status, active_flag = utils.check_user_active(session, request.headers)
+    if status != 200:
+        log.error(f'Error {status} contacting COmanage in /people/preferences/preftype')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
+
+    if not active_flag:
+        log.warn(f'User is not an active user in /people/preferences/preftype')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User not an active user')
+
+    if PREFERENCES_SEARCH_ADMIN_ONLY[preftype] and not utils.is_admin_user(request.headers):
+        log.warn(f'User is not an administrator in /people/preferences/{preftype}')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User is not an administrator')
+
+    # @> is answered from the jsonb_path_ops GIN index, preferences themselves are not loaded
+    query = session.query(FabricPerson).filter(getattr(FabricPerson, preftype).contains(value)).\
+        order_by(FabricPerson.id).offset(offset).limit(limit)
+
+    response = [utils.fill_people_short_from_person(person) for person in query.all()]
+
+    return utils.negotiated_response(response)
 
 
 def uuid_oidc_claim_sub_get(oidc_claim_sub):
@@ -226,30 +363,30 @@ def uuid_oidc_claim_sub_get(oidc_claim_sub):
 
     oidc_claim_sub = str(oidc_claim_sub).strip()
 
-    with Session() as session:
-        status, active_flag = utils.check_user_active(session, request.headers)
-        if status != 200:
-            log.error(f'Error {status} contacting COmanage in /uuid/oidc_claim_sub')
-            return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                 xerror=f'Error {status} contacting COmanage')
+    session = request_session()
+    status, active_flag = utils.check_user_active(session, request.headers)
+    if status != 200:
+        log.error(f'Error {status} contacting COmanage in /uuid/oidc_claim_sub')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
 
-        if not active_flag:
-            log.warn(f'User is not an active user in /uuid/oidc_claim_sub')
-            return cors_response(HTTPStatus.FORBIDDEN,
-                                 xerror='User not an active user')
+    if not active_flag:
+        log.warn(f'User is not an active user in /uuid/oidc_claim_sub')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User not an active user')
 
-        query = session.query(FabricPerson).filter(FabricPerson.oidc_claim_sub == oidc_claim_sub)
-        query_result = query.all()
+    query = session.query(FabricPerson).filter(FabricPerson.oidc_claim_sub == oidc_claim_sub)
+    query_result = query.all()
+
+    if len(query_result) == 0:
+        log.warn(f'Person with OIDC Claim sub {str(oidc_claim_sub)} in /uuid/oidc_claim_sub not found in database')
+        return cors_response(HTTPStatus.NOT_FOUND,
+                             xerror='Person with OIDC claim sub not found: {0}'.format(oidc_claim_sub))
+    else:
+        if len(query_result) > 1:
+            log.warn(f'Duplicate OIDC Claim {str(oidc_claim_sub)} found in the database in /uuid/oidc_claim_sub')
+            return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                                 xerror='Duplicate OIDC Claim Found: {0}'.format(oidc_claim_sub))
 
-        if len(query_result) == 0:
-            log.warn(f'Person with OIDC Claim sub {str(oidc_claim_sub)} in /uuid/oidc_claim_sub not found in database')
-            return cors_response(HTTPStatus.NOT_FOUND,
-                                 xerror='Person with OIDC claim sub not found: {0}'.format(oidc_claim_sub))
-        else:
-            if len(query_result) > 1:
-                log.warn(f'Duplicate OIDC Claim {str(oidc_claim_sub)} found in the database in /uuid/oidc_claim_sub')
-                return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                     xerror='Duplicate OIDC Claim Found: {0}'.format(oidc_claim_sub))
-
-        person = query_result[0]
-        return person.uuid
+    person = query_result[0]
+    return person.uuid
@@ -24,14 +24,15 @@
 #
 # Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
 
-import json
 from flask import request
+from sqlalchemy import cast, func, update, Text
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 
 from http import HTTPStatus
 from fss_utils.http_errors import cors_response
 
 from swagger_server import log
-from swagger_server.database import Session
+from swagger_server.database.request_session import request_session
 from swagger_server.models.preferences import Preferences
 from swagger_server.database.models import FabricPerson, PreferenceType
 import swagger_server.response_code.utils as utils
@@ -43,7 +44,7 @@ OKRETURN = "OK"
 
 def preferences_preftype_uuid_get(preftype, uuid):  # noqa: E501
     """
-    Get user preferences as a string from the database
+    Get user preferences of a type from the database
     """
     if not utils.any_authenticated_user(request.headers):
         return cors_response(HTTPStatus.UNAUTHORIZED,
@@ -61,38 +62,44 @@ def preferences_preftype_uuid_get(preftype, uuid):  # noqa: E501
         return cors_response(HTTPStatus.BAD_REQUEST,
                              xerror='Invalid parameter')
 
-    with Session() as session:
-        query = session.query(FabricPerson).filter(FabricPerson.uuid == uuid)
+    session = request_session()
+    query = session.query(FabricPerson).filter(FabricPerson.uuid == uuid)
 
-        query_result = query.all()
+    query_result = query.all()
 
-        if len(query_result) == 0:
-            log.warn(f'Person UUID {uuid} not found in /preferences/preftype/uuid')
-            return cors_response(HTTPStatus.NOT_FOUND,
-                                 xerror='Person UUID not found: {0}'.format(uuid))
+    if len(query_result) == 0:
+        log.warn(f'Person UUID {uuid} not found in /preferences/preftype/uuid')
+        return cors_response(HTTPStatus.NOT_FOUND,
+                             xerror='Person UUID not found: {0}'.format(uuid))
+
+    if len(query_result) > 1:
+        log.warn(f"Duplicate UUID {uuid} detected in /preferences/preftype/uuid")
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror='Duplicate UUID Found: {0}'.format(uuid))
 
-        if len(query_result) > 1:
-            log.warn(f"Duplicate UUID {uuid} detected in /preferences/preftype/uuid")
-            return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                 xerror='Duplicate UUID Found: {0}'.format(uuid))
+    # checked before the preferences are loaded
+    etag = _preferences_etag(uuid, query_result[0].version, preftype)
+    if utils.etag_matches(request.headers, etag):
+        return utils.not_modified(etag)
 
-        if getattr(query_result[0], preftype) is not None:
-            response = json.loads(getattr(query_result[0], preftype))
-        else:
-            log.warn(f'Preferences {preftype} not found for UUID {uuid}')
-            return cors_response(HTTPStatus.NO_CONTENT,
-                                 xerror='Preference {0} for UUID {1} not found'.format(preftype, uuid))
+    if getattr(query_result[0], preftype) is not None:
+        response = utils.dict_from_json_handle_none(getattr(query_result[0], preftype))
+    else:
+        log.warn(f'Preferences {preftype} not found for UUID {uuid}')
+        return cors_response(HTTPStatus.NO_CONTENT,
+                             xerror='Preference {0} for UUID {1} not found'.format(preftype, uuid))
 
-        if not isinstance(response, dict):
-            return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                 xerror='DB return not a JSON dictionary as preference')
+    if not isinstance(response, dict):
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror='DB return not a JSON dictionary as preference')
 
-        return response
+    return response, HTTPStatus.OK, {utils.ETAG: etag}
 
 
 def preferences_preftype_uuid_put(uuid, preftype, preferences=None):  # noqa: E501
     """
-    Set user preferences as a string in the database
+    Set user preferences of a type in the database. With If-Match, only
+    if they were not changed since the client read them.
     """
     if not utils.any_authenticated_user(request.headers):
         return cors_response(HTTPStatus.UNAUTHORIZED,
@@ -110,28 +117,101 @@ def preferences_preftype_uuid_put(uuid, preftype, preferences=None):  # noqa: E5
         return cors_response(HTTPStatus.BAD_REQUEST,
                              xerror='Invalid preference type {0}'.format(str(preftype)))
 
-    with Session() as session:
-        query = session.query(FabricPerson).filter(FabricPerson.uuid == uuid)
+    session = request_session()
+    query = session.query(FabricPerson).filter(FabricPerson.uuid == uuid)
+    if request.headers.get(utils.IF_MATCH) is not None:
+        # nobody else can change them between the check and the update
+        query = query.with_for_update()
+
+    query_result = query.all()
+
+    if len(query_result) == 0:
+        log.warn(f'Person UUID {uuid} not found in /preferences/preftype/uuid')
+        return cors_response(HTTPStatus.NOT_FOUND,
+                             xerror='Person UUID Not Found: {0}'.format(uuid))
+
+    if len(query_result) > 1:
+        log.warn(f'Duplicate UUID {uuid} not found in /preferences/preftype/uuid')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror='Duplicate UUID Found: {0}'.format(uuid))
+
+    person = query_result[0]
+
+    if utils.etag_mismatch(request.headers, _preferences_etag(uuid, person.version, preftype)):
+        log.warn(f'Preferences {preftype} of UUID {uuid} changed since they were read in /preferences/preftype/uuid')
+        return cors_response(HTTPStatus.PRECONDITION_FAILED,
+                             xerror='Preferences were changed since they were read')
+
+    setattr(person, preftype, preferences)
+    # bump the version to return the new ETag
+    session.flush()
+
+    return OKRETURN, HTTPStatus.OK, {utils.ETAG: _preferences_etag(uuid, person.version, preftype)}
 
-        query_result = query.all()
 
-        if len(query_result) == 0:
+def preferences_preftype_uuid_patch(uuid, preftype, body=None):  # noqa: E501
+    """
+    Merge changes into user preferences in the database: top-level keys of
+    the body are added or replaced, keys set to null are removed (a JSON
+    merge patch that does not recurse into nested objects). The merge is
+    done by Postgres in a single UPDATE, returns the merged preferences.
+    With If-Match, only if they were not changed since the client read them.
+    """
+    if not utils.any_authenticated_user(request.headers):
+        return cors_response(HTTPStatus.UNAUTHORIZED,
+                             xerror='User not authenticated')
+
+    uuid = str(uuid).strip()
+    if not utils.validate_uuid_by_oidc_claim(request.headers, uuid):
+        log.error(f'OIDC Claim Sub doesnt match UUID {uuid} in /preferences/preftype/uuid')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='OIDC Claim Sub doesnt match UUID')
+
+    # patch preference by type
+    if preftype not in PreferenceType.__members__.keys():
+        log.warn(f'Inavlid preference type {str(preftype)} in /preferences/preftype/uuid')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror='Invalid preference type {0}'.format(str(preftype)))
+
+    if not isinstance(body, dict):
+        log.warn(f'Preferences patch for UUID {uuid} is not a JSON object in /preferences/preftype/uuid')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror='Preferences patch must be a JSON object')
+
+    column = getattr(FabricPerson, preftype)
+    changes = {key: value for key, value in body.items() if value is not None}
+    removals = [key for key, value in body.items() if value is None]
+    merged = func.coalesce(column, cast(dict(), JSONB)).op('||')(cast(changes, JSONB)).\
+        op('-')(cast(removals, ARRAY(Text)))
+
+    session = request_session()
+    if request.headers.get(utils.IF_MATCH) is not None:
+        # nobody else can change them between the check and the update
+        version = session.query(FabricPerson.version).filter(FabricPerson.uuid == uuid).\
+            with_for_update().scalar()
+        if version is None:
             log.warn(f'Person UUID {uuid} not found in /preferences/preftype/uuid')
             return cors_response(HTTPStatus.NOT_FOUND,
                                  xerror='Person UUID Not Found: {0}'.format(uuid))
+        if utils.etag_mismatch(request.headers, _preferences_etag(uuid, version, preftype)):
+            log.warn(f'Preferences {preftype} of UUID {uuid} changed since they were read in '
+                     f'/preferences/preftype/uuid')
+            return cors_response(HTTPStatus.PRECONDITION_FAILED,
+                                 xerror='Preferences were changed since they were read')
 
-        if len(query_result) > 1:
-            log.warn(f'Duplicate UUID {uuid} not found in /preferences/preftype/uuid')
-            return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                 xerror='Duplicate UUID Found: {0}'.format(uuid))
+    # nothing in this request reads the person afterwards, no need to synchronize the session
+    query = update(FabricPerson).where(FabricPerson.uuid == uuid).\
+        values({column: merged, FabricPerson.version: FabricPerson.version + 1}).\
+        returning(column, FabricPerson.version).execution_options(synchronize_session=False)
+    query_result = session.execute(query).all()
 
-        person = query_result[0]
+    if len(query_result) == 0:
+        log.warn(f'Person UUID {uuid} not found in /preferences/preftype/uuid')
+        return cors_response(HTTPStatus.NOT_FOUND,
+                             xerror='Person UUID Not Found: {0}'.format(uuid))
 
-        setattr(person, preftype, json.dumps(preferences))
-
-        session.commit()
-
-        return OKRETURN
+    preferences, version = query_result[0]
+    return preferences, HTTPStatus.OK, {utils.ETAG: _preferences_etag(uuid, version, preftype)}
 
 
 def preferences_uuid_get(uuid):  # noqa: E501
@@ -148,24 +228,37 @@ def preferences_uuid_get(uuid):  # noqa: E501
         return cors_response(HTTPStatus.FORBIDDEN,
                              xerror='OIDC Claim Sub doesnt match UUID')
 
-    with Session() as session:
-        query = session.query(FabricPerson).filter(FabricPerson.uuid == uuid)
+    session = request_session()
+    query = session.query(FabricPerson).filter(FabricPerson.uuid == uuid)
 
-        query_result = query.all()
+    query_result = query.all()
 
-        if len(query_result) == 0:
-            log.warn(f'Person UUID {uuid} not found in /preferences/uuid')
-            return cors_response(HTTPStatus.NOT_FOUND,
-                                 xerror='Person UUID Not Found: {0}'.format(uuid))
+    if len(query_result) == 0:
+        log.warn(f'Person UUID {uuid} not found in /preferences/uuid')
+        return cors_response(HTTPStatus.NOT_FOUND,
+                             xerror='Person UUID Not Found: {0}'.format(uuid))
+
+    if len(query_result) > 1:
+        log.warn(f'Duplicate UUID {uuid} not found in /preferences/uuid')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror='Duplicate UUID Found: {0}'.format(uuid))
 
-        if len(query_result) > 1:
-            log.warn(f'Duplicate UUID {uuid} not found in /preferences/uuid')
-            return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                 xerror='Duplicate UUID Found: {0}'.format(uuid))
+    person = query_result[0]
 
-        person = query_result[0]
+    # checked before the preferences are loaded
+    etag = _preferences_etag(uuid, person.version)
+    if utils.etag_matches(request.headers, etag):
+        return utils.not_modified(etag)
 
-        response = Preferences(settings=utils.dict_from_json_handle_none(person.settings),
-                               permissions=utils.dict_from_json_handle_none(person.permissions),
-                               interests=utils.dict_from_json_handle_none(person.interests))
-        return response
+    response = Preferences(settings=utils.dict_from_json_handle_none(person.settings),
+                           permissions=utils.dict_from_json_handle_none(person.permissions),
+                           interests=utils.dict_from_json_handle_none(person.interests))
+    return response, HTTPStatus.OK, {utils.ETAG: etag}
+
+
+def _preferences_etag(uuid: str, version: int, preftype: str = None) -> str:
+    """
+    ETag of preferences of a type (all of them if preftype is None), any
+    change to the person changes it
+    """
+    return utils.make_etag('preferences', preftype, uuid, version)
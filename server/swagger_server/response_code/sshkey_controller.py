@@ -24,33 +24,51 @@
 #
 # Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
 import enum
-from typing import List
+from typing import List, Dict, Optional, Set, Tuple
+from contextlib import contextmanager
 from enum import Enum
 from dataclasses import dataclass
 
 import re
+import json
+import time
+import gzip
+import hashlib
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 from datetime import datetime, timedelta, timezone
 from http import HTTPStatus
 
 import requests
-from flask import request
+from flask import request, Response, stream_with_context
 from uuid import uuid4
+from sqlalchemy import func
 
 from fss_utils.http_errors import cors_response
 from fss_utils.sshkey import FABRICSSHKey, FABRICSSHKeyException
 
 from swagger_server import SSH_SLIVER_KEY_TO_COMANAGE, SSH_KEY_ALGORITHM, SSH_BASTION_KEY_VALIDITY_DAYS, \
-    SSH_SLIVER_KEY_VALIDITY_DAYS, SSH_GARBAGE_COLLECT_AFTER_DAYS, SSH_KEY_SECRET, SSH_KEY_QTY_LIMIT, co_api
+    SSH_SLIVER_KEY_VALIDITY_DAYS, SSH_GARBAGE_COLLECT_AFTER_DAYS, SSH_KEY_SECRET, SSH_KEY_QTY_LIMIT, co_api, \
+    BASTION_FEED_LIMIT, BASTION_FEED_MAX_WAIT, SLIVER_KEYS_SECRET
 from swagger_server.database import Session
+from swagger_server.database.request_session import request_session
+from swagger_server.database.key_changes import bastion_key_listener
+from swagger_server.encoder import JSONEncoder, to_plain
+from swagger_server.instrumentation import metrics, tracing
+from swagger_server.response_code.bastion_key_index import BastionKeyIndex
 
 import swagger_server.response_code.utils as utils
-from swagger_server.response_code.utils import log, get_gecos
+from swagger_server.response_code.utils import log
 
-from swagger_server.database.models import DbSshKey, FabricPerson
+from swagger_server.database.models import DbSshKey, FabricPerson, lock_key_changes, next_key_change_seq, \
+    LOGIN_BUCKETS
 
+from swagger_server.models.compact import CompactSshKeyBastion, CompactSshKeyLong
 from swagger_server.models.ssh_key_bastion import SshKeyBastion  # noqa: E501
+from swagger_server.models.ssh_key_bastion_feed import SshKeyBastionFeed  # noqa: E501
 from swagger_server.models.ssh_key_long import SshKeyLong  # noqa: E501
 from swagger_server.models.ssh_key_pair import SshKeyPair  # noqa: E501
+from swagger_server.models.ssh_key_upload import SshKeyUpload  # noqa: E501
+from swagger_server.models.ssh_key_upload_result import SshKeyUploadResult  # noqa: E501
 
 
 class KeyType(Enum):
@@ -96,103 +114,381 @@ class SshKeyShort:
 TZISO = r"^.+\+[\d]{2}:[\d]{2}$"
 TZPYTHON = r"^.+\+[\d]{4}$"
 DESCRIPTION_REGEX = r"^[\w\s\-'\.@_()/]{5,255}$"
-COMMENT_LENGTH = 100
-
-
-def bastionkeys_get(secret, since_date) -> List[SshKeyBastion]:
+# maximum number of users in a single /sliverkeys request
+SLIVER_KEYS_UUID_LIMIT = 1000
+# number of rows fetched from the database at a time when streaming
+STREAM_BATCH_SIZE = 500
+# format version of the opaque /bastionkeys/feed cursor
+CURSOR_VERSION = 'v1'
+# maximum number of bastion logins a bastion agent can ask for
+BASTION_LOGINS_LIMIT = 1000
+# SshKeyLong attributes copied as they are from DbSshKey
+LONG_KEY_PLAIN_ATTRIBUTES = ('key_uuid', 'public_key', 'ssh_key_type', 'comment', 'description', 'fingerprint',
+                             'fabric_key_type')
+# columns needed for each SshKeyLong attribute, see _fill_long_key()
+LONG_KEY_COLUMNS = {
+    'key_uuid': (DbSshKey.key_uuid,),
+    'public_key': (DbSshKey.public_key,),
+    'ssh_key_type': (DbSshKey.ssh_key_type,),
+    'comment': (DbSshKey.comment,),
+    'description': (DbSshKey.description,),
+    'fingerprint': (DbSshKey.fingerprint,),
+    'fabric_key_type': (DbSshKey.fabric_key_type,),
+    'created_on': (DbSshKey.created_on,),
+    'expires_on': (DbSshKey.expires_on,),
+    'deactivated_on': (DbSshKey.active, DbSshKey.deactivated_on),
+    'deactivation_reason': (DbSshKey.active, DbSshKey.deactivation_reason),
+}
+# what bastion hosts need to know about a key, see _fill_bastion_key()
+BASTION_KEY_COLUMNS = (DbSshKey.active, DbSshKey.authorized_key, DbSshKey.change_seq,
+                       FabricPerson.bastion_login, FabricPerson.gecos)
+
+
+def bastionkeys_get(secret, since_date, logins: List[str] = None, shard: int = None,
+                    shards: int = None) -> List[SshKeyBastion]:
     """
     Special endpoint for bastion agent to get a list of
     keys that have been added/deactivated/expired.
     Find bastion keys that were (a) created since _date and
     (b) deactivated since _date.
+    Optionally limited to a list of logins or to one of shards hash partitions of logins.
+    """
+    if secret != SSH_KEY_SECRET:
+        log.error(f'Provided secret {secret} does not match the configured secret for the endpoint')
+        return cors_response(HTTPStatus.UNAUTHORIZED,
+                             xerror='User not authorized')
+
+    partition, error = _login_partition(logins, shard, shards)
+    if error is not None:
+        log.error(f'Invalid partition {logins=} {shard=} {shards=} in bastionkeys_get: {error}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=error)
+    session = request_session()
+    update_keys()
+
+    # first a list of new keys
+    try:
+        since_date = since_date.strip()
+        # with +00:00
+        if re.match(TZISO, since_date) is not None:
+            pdate = datetime.fromisoformat(since_date)
+        # with +0000
+        elif re.match(TZPYTHON, since_date) is not None:
+            pdate = datetime.strptime(since_date, "%Y-%m-%d %H:%M:%S%z")
+        # perhaps no TZ info? add as if UTC
+        else:
+            pdate = datetime.strptime(since_date + "+0000", "%Y-%m-%d %H:%M:%S%z")
+        # convert to UTC
+        pdate = pdate.astimezone(timezone.utc)
+    except ValueError:
+        log.error(f'Unable to convert date {since_date}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Provided date {since_date} is invalid.')
+
+    etag = utils.negotiated_etag(pdate.isoformat(), logins, shard, shards,
+                                 *_keys_version(session, DbSshKey.fabric_key_type == KeyType.bastion.name,
+                                                DbSshKey.owner_uuid == FabricPerson.uuid, *partition))
+    if utils.etag_matches(request.headers, etag):
+        log.debug(f'No bastion key changes since last poll with time {pdate}')
+        return utils.not_modified(etag, negotiated=True)
+
+    log.info(f'Using time {pdate} to search for new or expired keys.')
+    ret = list()
+    query = session.query(*BASTION_KEY_COLUMNS).filter(DbSshKey.active == True,
+                                                       DbSshKey.created_on > pdate,
+                                                       DbSshKey.fabric_key_type == KeyType.bastion.name,
+                                                       DbSshKey.owner_uuid == FabricPerson.uuid,
+                                                       *partition)
+    new_keys = query.all()
+    ret.extend(_fill_bastion_key(row) for row in new_keys)
+
+    query = session.query(*BASTION_KEY_COLUMNS).filter(DbSshKey.active == False,
+                                                       DbSshKey.deactivated_on > pdate,
+                                                       DbSshKey.fabric_key_type == KeyType.bastion.name,
+                                                       DbSshKey.owner_uuid == FabricPerson.uuid,
+                                                       *partition)
+    expired_keys = query.all()
+    ret.extend(_fill_bastion_key(row) for row in expired_keys)
+
+    log.debug(f'Found {len(new_keys)} new and {len(expired_keys)} expired keys since {pdate}')
+    return utils.negotiated_response(ret, HTTPStatus.OK, {utils.ETAG: etag})
+
+
+def bastionkeys_feed_get(secret: str, cursor: str = None, limit: int = None, wait: int = None,
+                         logins: List[str] = None, shard: int = None, shards: int = None) -> SshKeyBastionFeed:
+    """
+    Special endpoint for bastion agent to follow bastion key changes
+    (additions, deactivations and expirations) in the order they happened.
+    Returns changes after the provided opaque cursor along with the cursor
+    to use next time. Each changed key is reported once with its current status.
+    If there are no changes and wait is given, blocks for up to wait seconds
+    until a change is committed (long poll).
+    Optionally limited to a list of logins or to one of shards hash partitions of logins,
+    cursors are then only valid for the same partition.
     """
     if secret != SSH_KEY_SECRET:
         log.error(f'Provided secret {secret} does not match the configured secret for the endpoint')
         return cors_response(HTTPStatus.UNAUTHORIZED,
                              xerror='User not authorized')
+
+    after_seq = _decode_cursor(cursor)
+    if after_seq is None:
+        log.error(f'Unable to decode cursor {cursor}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Provided cursor {cursor} is invalid.')
+
+    partition, error = _login_partition(logins, shard, shards)
+    if error is not None:
+        log.error(f'Invalid partition {logins=} {shard=} {shards=} in bastionkeys_feed_get: {error}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=error)
+
+    if limit is None or limit > BASTION_FEED_LIMIT:
+        limit = BASTION_FEED_LIMIT
+
+    if wait is None or wait < 0:
+        wait = 0
+    wait = min(wait, BASTION_FEED_MAX_WAIT)
+
+    # note the notification count before reading so a change committed
+    # right after the read still wakes us up
+    deadline = time.monotonic() + wait
+    generation = bastion_key_listener.generation() if wait > 0 else None
+
+    feed = _read_bastion_feed(after_seq, limit, partition)
+    if len(feed.keys) == 0 and wait > 0:
+        log.debug(f'No bastion key changes after change {after_seq}, waiting up to {wait} seconds')
+    # changes outside of the partition wake us up too, keep waiting for ours
+    while len(feed.keys) == 0 and wait > 0:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not bastion_key_listener.wait(generation, remaining):
+            break
+        generation = bastion_key_listener.generation()
+        feed = _read_bastion_feed(_decode_cursor(feed.next_cursor), limit, partition)
+
+    return utils.negotiated_response(feed)
+
+
+def _read_bastion_feed(after_seq: int, limit: int, partition: List) -> SshKeyBastionFeed:
+    """
+    Read up to limit bastion key changes after after_seq for the partition
+    of logins.
+    """
+    update_keys()
+
     with Session() as session:
         with session.begin():
-            _update_keys(session)
-
-            # first a list of new keys
-            try:
-                since_date = since_date.strip()
-                # with +00:00
-                if re.match(TZISO, since_date) is not None:
-                    pdate = datetime.fromisoformat(since_date)
-                # with +0000
-                elif re.match(TZPYTHON, since_date) is not None:
-                    pdate = datetime.strptime(since_date, "%Y-%m-%d %H:%M:%S%z")
-                # perhaps no TZ info? add as if UTC
-                else:
-                    pdate = datetime.strptime(since_date + "+0000", "%Y-%m-%d %H:%M:%S%z")
-                # convert to UTC
-                pdate = pdate.astimezone(timezone.utc)
-            except ValueError:
-                log.error(f'Unable to convert date {since_date}')
-                return cors_response(HTTPStatus.BAD_REQUEST,
-                                     xerror=f'Provided date {since_date} is invalid.')
-
-            log.info(f'Using time {pdate} to search for new or expired keys.')
-            ret = list()
-            query = session.query(DbSshKey, FabricPerson).filter(DbSshKey.active == True,
-                                                                 DbSshKey.created_on > pdate,
-                                                                 DbSshKey.fabric_key_type == KeyType.bastion.name,
-                                                                 DbSshKey.owner_uuid == FabricPerson.uuid)
-            query_result = query.all()
-            for qk, qp in query_result:
-                try:
-                    log.debug(f'Found new key created on {qk.created_on} for user {qp.bastion_login}')
-                    k = SshKeyBastion()
-                    k.status = KeyStatus.active.name
-                    # for bastion update the comment to include expiration date/time
-                    k.public_openssh = " ".join([qk.ssh_key_type, qk.public_key,
-                                                 _make_bastion_comment(qk.comment, qk.expires_on)])
-                    k.login = qp.bastion_login
-                    # GECOS is a 5-field comma-separated field that includes things like full name
-                    # various locations, phone numbers and emails. External email is part of the 5th field
-                    k.gecos = get_gecos(qp)
-                    ret.append(k)
-                except Exception:
-                    log.error(f'Unable to report new bastion key starting with {qk.public_key[0:100]} '
-                              f'for user {qp.bastion_login}')
-                    return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                         xerror='Unable to report bastion keys due to internal error.')
-
-            query = session.query(DbSshKey, FabricPerson).filter(DbSshKey.active == False,
-                                                                 DbSshKey.deactivated_on > pdate,
-                                                                 DbSshKey.fabric_key_type == KeyType.bastion.name,
-                                                                 DbSshKey.owner_uuid == FabricPerson.uuid)
+            # read the latest change first and stop there, as BastionKeyIndex._load() does:
+            # each statement sees its own snapshot, so reading it after the keys could skip
+            # a change of this partition committed in between
+            latest_seq = session.query(func.max(DbSshKey.change_seq)).\
+                filter(DbSshKey.fabric_key_type == KeyType.bastion.name).scalar() or 0
+            query = session.query(*BASTION_KEY_COLUMNS).filter(DbSshKey.change_seq > after_seq,
+                                                               DbSshKey.change_seq <= latest_seq,
+                                                               DbSshKey.fabric_key_type == KeyType.bastion.name,
+                                                               DbSshKey.owner_uuid == FabricPerson.uuid,
+                                                               *partition).\
+                order_by(DbSshKey.change_seq).\
+                limit(limit)
             query_result = query.all()
-            for qk, qp in query_result:
-                try:
-                    log.debug(f'Found expired key deactivated on {qk.deactivated_on} for user {qp.bastion_login}')
-                    k = SshKeyBastion()
-                    k.status = KeyStatus.deactivated.name
-                    # for bastion update the comment to include expiration date/time
-                    k.public_openssh = " ".join([qk.ssh_key_type, qk.public_key,
-                                                 _make_bastion_comment(qk.comment, qk.expires_on)])
-                    k.login = qp.bastion_login
-                    k.gecos = get_gecos(qp)
-                    ret.append(k)
-                except Exception:
-                    log.error(f'Unable to report expired bastion key starting with {qk.public_key[0:100]} '
-                              f'for user {qp.bastion_login}')
-                    return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                         xerror='Unable to report bastion keys due to internal error.')
-
-            return ret
-
-
-def sshkeys_get() -> List[SshKeyLong]:  # noqa: E501
-    """
-    Get a list of active keys for a given user
+
+            feed = SshKeyBastionFeed(keys=[_fill_bastion_key(row) for row in query_result],
+                                     next_cursor=_encode_cursor(after_seq))
+            if len(query_result) > 0:
+                feed.next_cursor = _encode_cursor(query_result[-1].change_seq)
+
+            if len(partition) > 0 and len(query_result) < limit:
+                # everything up to the latest change has been seen, skip over
+                # changes of other partitions next time
+                if latest_seq > after_seq:
+                    feed.next_cursor = _encode_cursor(latest_seq)
+
+            log.info(f'Reporting {len(feed.keys)} bastion key changes after change {after_seq}')
+            return feed
+
+
+def bastionkeys_snapshot_get(secret: str, logins: List[str] = None, shard: int = None,
+                             shards: int = None):  # noqa: E501
+    """
+    Special endpoint for bastion agents (re)building their state from scratch.
+    Returns all active bastion keys (optionally of a partition of logins) as of
+    a single point in the change feed, gzip-compressed if the client accepts it,
+    along with the feed cursor to continue from and a SHA-256 of the uncompressed content.
+    """
+    if secret != SSH_KEY_SECRET:
+        log.error(f'Provided secret {secret} does not match the configured secret for the endpoint')
+        return cors_response(HTTPStatus.UNAUTHORIZED,
+                             xerror='User not authorized')
+
+    partition, error = _login_partition(logins, shard, shards)
+    if error is not None:
+        log.error(f'Invalid partition {logins=} {shard=} {shards=} in bastionkeys_snapshot_get: {error}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=error)
+
+    update_keys()
+
+    with Session() as session:
+        with session.begin():
+            # the cursor and the keys must come from the same database snapshot
+            session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+            latest_seq = session.query(func.max(DbSshKey.change_seq)).\
+                filter(DbSshKey.fabric_key_type == KeyType.bastion.name).scalar() or 0
+            now = datetime.now(timezone.utc)
+            query = session.query(*BASTION_KEY_COLUMNS).filter(DbSshKey.active == True,
+                                                               DbSshKey.expires_on > now,
+                                                               DbSshKey.fabric_key_type == KeyType.bastion.name,
+                                                               DbSshKey.owner_uuid == FabricPerson.uuid,
+                                                               *partition).\
+                order_by(DbSshKey.change_seq).\
+                yield_per(STREAM_BATCH_SIZE)
+
+            snapshot = SshKeyBastionFeed(keys=[_fill_bastion_key(row) for row in query],
+                                         next_cursor=_encode_cursor(latest_seq))
+
+    # the hash goes into a header, so the snapshot is built in memory rather than streamed
+    content = json.dumps(snapshot, cls=JSONEncoder).encode('utf-8')
+    log.info(f'Reporting snapshot of {len(snapshot.keys)} bastion keys up to change {latest_seq}')
+    if request.accept_encodings['gzip'] > 0:
+        response = Response(gzip.compress(content), mimetype='application/json')
+        response.headers[utils.CONTENT_ENCODING] = 'gzip'
+    else:
+        response = Response(content, mimetype='application/json')
+    response.headers[utils.VARY] = utils.ACCEPT_ENCODING
+    response.headers['X-Content-SHA256'] = hashlib.sha256(content).hexdigest()
+    response.headers['X-Feed-Cursor'] = snapshot.next_cursor
+    return response
+
+
+def authorizedkeys_login_get(secret: str, login: str):  # noqa: E501
+    """
+    Special endpoint for sshd AuthorizedKeysCommand on bastion hosts.
+    Returns authorized_keys lines of the active bastion keys of this login
+    from the in-memory index, without contacting COmanage or expiring keys.
+    """
+    if secret != SSH_KEY_SECRET:
+        log.error(f'Provided secret {secret} does not match the configured secret for the endpoint')
+        return cors_response(HTTPStatus.UNAUTHORIZED,
+                             xerror='User not authorized')
+
+    lines = bastion_key_index.lookup(login.strip())
+    if lines is None:
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror='Unable to report authorized keys due to internal error.')
+
+    log.debug(f'Reporting {len(lines)} authorized keys for login {login}')
+    return Response(''.join(line + '\n' for line in lines), mimetype='text/plain')
+
+
+def sliverkeys_post(body: List[str], secret: str):  # noqa: E501
+    """
+    Get active sliver keys of many users with one query. Open to services
+    knowing the configured sliver keys secret.
+    The response is streamed as a JSON (or MessagePack, see utils.wants_msgpack())
+    map of owner UUID to a list of their keys, owners without active keys are omitted.
+    """
+    if SLIVER_KEYS_SECRET is None or secret != SLIVER_KEYS_SECRET:
+        log.error('Provided secret does not match the configured secret for /sliverkeys')
+        return cors_response(HTTPStatus.UNAUTHORIZED,
+                             xerror='User not authorized')
+
+    if body is None or len(body) == 0 or len(body) > SLIVER_KEYS_UUID_LIMIT:
+        log.error('Invalid number of UUIDs supplied by the caller, rejecting in sliverkeys_post')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Between 1 and {SLIVER_KEYS_UUID_LIMIT} UUIDs must be provided')
+
+    uuids = set()
+    for _uuid in body:
+        _uuid = str(_uuid).strip()
+        if _bad_uuid(_uuid):
+            log.error(f'Invalid UUID {_uuid} supplied by the caller, rejecting in sliverkeys_post.')
+            return cors_response(HTTPStatus.BAD_REQUEST,
+                                 xerror='Supplied UUID {0} is not valid.'.format(_uuid))
+        uuids.add(_uuid)
+
+    log.info(f'Streaming active sliver keys of {len(uuids)} users')
+    headers = {utils.VARY: utils.ACCEPT}
+    if utils.wants_msgpack():
+        return Response(stream_with_context(_stream_sliver_keys_msgpack(uuids)), headers=headers,
+                        mimetype=utils.MSGPACK_MIMETYPES[0])
+    return Response(stream_with_context(_stream_sliver_keys(uuids)), headers=headers,
+                    mimetype='application/json')
+
+
+def _sliver_keys_criteria(uuids: Set[str]) -> List:
+    """
+    Active sliver keys of these owners. Expired keys that have not been deactivated
+    yet are filtered out by date so there is no need to update keys first.
+    """
+    return [DbSshKey.owner_uuid.in_(uuids),
+            DbSshKey.active == True,
+            DbSshKey.expires_on > datetime.now(timezone.utc),
+            DbSshKey.fabric_key_type == KeyType.sliver.name]
+
+
+def _stream_sliver_keys(uuids: Set[str]):
+    """
+    Generate a JSON map of owner UUID to their active sliver keys chunk by chunk.
+    """
+    with Session() as session:
+        query = session.query(DbSshKey).filter(*_sliver_keys_criteria(uuids)).\
+            order_by(DbSshKey.owner_uuid).\
+            yield_per(STREAM_BATCH_SIZE)
+
+        yield '{'
+        owner_uuid = None
+        for res in query:
+            if res.owner_uuid != owner_uuid:
+                prefix = '], ' if owner_uuid is not None else ''
+                owner_uuid = res.owner_uuid
+                yield prefix + json.dumps(owner_uuid) + ': ['
+            else:
+                yield ', '
+            yield json.dumps(_fill_long_key(res), cls=JSONEncoder)
+        yield ']}' if owner_uuid is not None else '}'
+
+
+def _stream_sliver_keys_msgpack(uuids: Set[str]):
+    """
+    Generate a MessagePack map of owner UUID to their active sliver keys chunk by chunk.
+    MessagePack maps and arrays start with their length, so keys are counted
+    first, in the same database snapshot as they are then read.
+    """
+    packer = utils.msgpack_packer()
+    with Session() as session:
+        with session.begin():
+            session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+            criteria = _sliver_keys_criteria(uuids)
+            counts = dict(session.query(DbSshKey.owner_uuid, func.count(DbSshKey.id)).filter(*criteria).
+                          group_by(DbSshKey.owner_uuid).all())
+            query = session.query(DbSshKey).filter(*criteria).\
+                order_by(DbSshKey.owner_uuid).\
+                yield_per(STREAM_BATCH_SIZE)
+
+            yield packer.pack_map_header(len(counts))
+            owner_uuid = None
+            for res in query:
+                if res.owner_uuid != owner_uuid:
+                    owner_uuid = res.owner_uuid
+                    yield packer.pack(owner_uuid) + packer.pack_array_header(counts[owner_uuid])
+                yield packer.pack(to_plain(_fill_long_key(res)))
+
+
+def sshkeys_get(fields: List[str] = None) -> List[SshKeyLong]:  # noqa: E501
+    """
+    Get a list of active keys for a given user, optionally only some of their attributes.
     Open to self.
     """
     if not utils.any_authenticated_user(request.headers):
         return cors_response(HTTPStatus.UNAUTHORIZED,
                              xerror='User not authenticated')
 
+    fields, error = utils.parse_fields(fields, SshKeyLong)
+    if error is not None:
+        log.error(f'Invalid fields in sshkeys_get: {error}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=error)
+
     _uuid = utils.get_uuid_by_oidc_claim(request.headers)
 
     if _uuid is None:
@@ -200,30 +496,51 @@ def sshkeys_get() -> List[SshKeyLong]:  # noqa: E501
         return cors_response(HTTPStatus.FORBIDDEN,
                              xerror='Unable to find UUID from OIDC Sub claim')
 
-    with Session() as session:
-        with session.begin():
-            status, active_flag = utils.check_user_active(session, request.headers)
-            if status != 200:
-                log.error(f'Error {status} contacting COmanage in sshkeys_get')
-                return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                     xerror=f'Error {status} contacting COmanage')
+    session = request_session()
+    status, active_flag = utils.check_user_active(session, request.headers)
+    if status != 200:
+        log.error(f'Error {status} contacting COmanage in sshkeys_get')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
 
-            if not active_flag:
-                log.warn(f'User is not an active user in sshkeys_get')
-                return cors_response(HTTPStatus.FORBIDDEN,
-                                     xerror='User not an active user')
+    if not active_flag:
+        log.warn('User is not an active user in sshkeys_get')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User not an active user')
 
-            _update_keys(session)
+    update_keys()
 
-            query = session.query(DbSshKey).filter(DbSshKey.owner_uuid == _uuid,
-                                                   DbSshKey.active == True)
-            query_result = query.all()
+    etag = utils.negotiated_etag(sorted(fields or []), *_keys_version(session, DbSshKey.owner_uuid == _uuid,
+                                                                      DbSshKey.active == True))
+    if utils.etag_matches(request.headers, etag):
+        return utils.not_modified(etag, negotiated=True)
+
+    ret = active_keys(session, _uuid, fields, update=False)
+
+    return utils.negotiated_response(ret, HTTPStatus.OK, {utils.ETAG: etag})
+
+
+def active_keys_version(session, _uuid: str, update: bool = True) -> Tuple[int, int]:
+    """
+    Version of the set of active keys of a user (see _keys_version()),
+    expiring and garbage collecting keys first unless update is False
+    """
+    if update:
+        update_keys()
+    return _keys_version(session, DbSshKey.owner_uuid == _uuid, DbSshKey.active == True)
 
-            ret = list()
-            for res in query_result:
-                ret.append(_fill_long_key(res))
 
-            return ret
+def active_keys(session, _uuid: str, fields: Set[str] = None, update: bool = True) -> List[SshKeyLong]:
+    """
+    Active keys of a user with the requested attributes (all if fields is None),
+    expiring and garbage collecting keys first unless update is False.
+    Callers check the user is allowed to see them.
+    """
+    if update:
+        update_keys()
+    query = session.query(*_long_key_columns(fields)).filter(DbSshKey.owner_uuid == _uuid,
+                                                             DbSshKey.active == True)
+    return [_fill_long_key(res, fields) for res in query.all()]
 
 
 def sshkeys_keyid_delete(keyid: str) -> str:  # noqa: E501
@@ -247,32 +564,34 @@ def sshkeys_keyid_delete(keyid: str) -> str:  # noqa: E501
                              xerror='Unable to find UUID from OIDC Sub claim')
 
     comanage_sliver_keys = list()
-    with Session() as session:
-        with session.begin():
-            status, active_flag = utils.check_user_active(session, request.headers)
-            if status != 200:
-                log.error(f'Error {status} contacting COmanage in sshkeys_keyid_delete')
-                return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                     xerror=f'Error {status} contacting COmanage')
-
-            if not active_flag:
-                log.warn(f'User is not an active user in sshkeys_keyid_delete')
-                return cors_response(HTTPStatus.FORBIDDEN,
-                                     xerror='User not an active user')
-            _update_keys(session)
-
-            query = session.query(DbSshKey).filter(DbSshKey.owner_uuid == _uuid,
-                                                   DbSshKey.key_uuid == keyid,
-                                                   DbSshKey.active == True)
-            query_result = query.all()
-            if len(query_result) > 0:
-                for q in query_result:
-                    q.active = False
-                    q.deactivation_reason = f'Deactivated by owner on {datetime.now(timezone.utc)}Z'
-                    q.deactivated_on = datetime.now(timezone.utc)
-                    if SSH_SLIVER_KEY_TO_COMANAGE and q.fabric_key_type == KeyType.sliver.name:
-                        comanage_sliver_keys.append(q.comanage_key_id)
-            # automatically commits session here (with)
+    session = request_session()
+    status, active_flag = utils.check_user_active(session, request.headers)
+    if status != 200:
+        log.error(f'Error {status} contacting COmanage in sshkeys_keyid_delete')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
+
+    if not active_flag:
+        log.warn('User is not an active user in sshkeys_keyid_delete')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User not an active user')
+    update_keys()
+
+    query = session.query(DbSshKey).filter(DbSshKey.owner_uuid == _uuid,
+                                           DbSshKey.key_uuid == keyid,
+                                           DbSshKey.active == True)
+    query_result = query.all()
+    if len(query_result) > 0:
+        lock_key_changes(session)
+        for q in query_result:
+            q.active = False
+            q.change_seq = next_key_change_seq()
+            q.deactivation_reason = f'Deactivated by owner on {datetime.now(timezone.utc)}Z'
+            q.deactivated_on = datetime.now(timezone.utc)
+            if SSH_SLIVER_KEY_TO_COMANAGE and q.fabric_key_type == KeyType.sliver.name:
+                comanage_sliver_keys.append(q.comanage_key_id)
+    # commit early to release the key change lock before talking to COmanage
+    session.commit()
 
     for ck in comanage_sliver_keys:
         try:
@@ -283,14 +602,21 @@ def sshkeys_keyid_delete(keyid: str) -> str:  # noqa: E501
     return "OK"
 
 
-def sshkey_uuid_keyid_get(_uuid: str, keyid: str) -> SshKeyLong:  # noqa: E501
+def sshkey_uuid_keyid_get(_uuid: str, keyid: str, fields: List[str] = None) -> SshKeyLong:  # noqa: E501
     """
-    Get a specified active key for this user. Open to any valid user.
+    Get a specified active key for this user, optionally only some of its attributes.
+    Open to any valid user.
     """
     if not utils.any_authenticated_user(request.headers):
         return cors_response(HTTPStatus.UNAUTHORIZED,
                              xerror='User not authenticated')
 
+    fields, error = utils.parse_fields(fields, SshKeyLong)
+    if error is not None:
+        log.error(f'Invalid fields in sshkey_uuid_keyid_get: {error}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=error)
+
     _uuid = _uuid.strip()
 
     if _bad_uuid(_uuid):
@@ -303,43 +629,49 @@ def sshkey_uuid_keyid_get(_uuid: str, keyid: str) -> SshKeyLong:  # noqa: E501
         return cors_response(HTTPStatus.BAD_REQUEST,
                              xerror='Supplied keyid {0} is not valid.'.format(keyid))
 
-    with Session() as session:
-        with session.begin():
-            status, active_flag = utils.check_user_active(session, request.headers)
-            if status != 200:
-                log.error(f'Error {status} contacting COmanage in sshkeys_uuid_keyid_get')
-                return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                     xerror=f'Error {status} contacting COmanage')
-
-            if not active_flag:
-                log.warn(f'User is not an active user in in sshkeys_uuid_keyid_get')
-                return cors_response(HTTPStatus.FORBIDDEN,
-                                     xerror='User not an active user')
-
-            _update_keys(session)
-
-            query = session.query(DbSshKey).filter(DbSshKey.owner_uuid == _uuid,
-                                                   DbSshKey.active == True,
-                                                   DbSshKey.key_uuid == keyid)
-            query_result = query.all()
+    session = request_session()
+    status, active_flag = utils.check_user_active(session, request.headers)
+    if status != 200:
+        log.error(f'Error {status} contacting COmanage in sshkeys_uuid_keyid_get')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
+
+    if not active_flag:
+        log.warn('User is not an active user in in sshkeys_uuid_keyid_get')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User not an active user')
 
-            if len(query_result) < 1:
-                log.warn(f'Unable to find active key {keyid} for user {_uuid} in sshkeys_uuid_keyid_get, '
-                         f'proceeding')
-                return cors_response(HTTPStatus.NOT_FOUND,
-                                     xerror='Key {0} not found for user {1}'.format(keyid, _uuid))
+    update_keys()
 
-            return _fill_long_key(query_result[0])
+    query = session.query(*_long_key_columns(fields)).filter(DbSshKey.owner_uuid == _uuid,
+                                                             DbSshKey.active == True,
+                                                             DbSshKey.key_uuid == keyid)
+    query_result = query.all()
+
+    if len(query_result) < 1:
+        log.warn(f'Unable to find active key {keyid} for user {_uuid} in sshkeys_uuid_keyid_get, '
+                 f'proceeding')
+        return cors_response(HTTPStatus.NOT_FOUND,
+                             xerror='Key {0} not found for user {1}'.format(keyid, _uuid))
 
+    return _fill_long_key(query_result[0], fields)
 
-def sshkey_keyid_get(keyid: str) -> SshKeyLong:  # noqa: E501
+
+def sshkey_keyid_get(keyid: str, fields: List[str] = None) -> SshKeyLong:  # noqa: E501
     """
-    Get a specified key regardless of status. Open only to self.
+    Get a specified key regardless of status, optionally only some of its attributes.
+    Open only to self.
     """
     if not utils.any_authenticated_user(request.headers):
         return cors_response(HTTPStatus.UNAUTHORIZED,
                              xerror='User not authenticated')
 
+    fields, error = utils.parse_fields(fields, SshKeyLong)
+    if error is not None:
+        log.error(f'Invalid fields in sshkey_keyid_get: {error}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=error)
+
     if _bad_uuid(keyid):
         log.error(f'Invalid keyid {keyid} supplied by the caller, rejecting.')
         return cors_response(HTTPStatus.BAD_REQUEST,
@@ -352,32 +684,37 @@ def sshkey_keyid_get(keyid: str) -> SshKeyLong:  # noqa: E501
         return cors_response(HTTPStatus.FORBIDDEN,
                              xerror='Unable to find UUID from OIDC Sub claim')
 
-    with Session() as session:
-        with session.begin():
-            status, active_flag = utils.check_user_active(session, request.headers)
-            if status != 200:
-                log.error(f'Error {status} contacting COmanage in sshkeys_keyid_get')
-                return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                     xerror=f'Error {status} contacting COmanage')
+    session = request_session()
+    status, active_flag = utils.check_user_active(session, request.headers)
+    if status != 200:
+        log.error(f'Error {status} contacting COmanage in sshkeys_keyid_get')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
+
+    if not active_flag:
+        log.warn('User is not an active user in sshkeys_keyid_get')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User not an active user')
 
-            if not active_flag:
-                log.warn(f'User is not an active user in sshkeys_keyid_get')
-                return cors_response(HTTPStatus.FORBIDDEN,
-                                     xerror='User not an active user')
+    update_keys()
 
-            _update_keys(session)
+    version = _keys_version(session, DbSshKey.owner_uuid == _uuid,
+                            DbSshKey.key_uuid == keyid)
+    etag = utils.make_etag(sorted(fields or []), *version)
+    if version[1] > 0 and utils.etag_matches(request.headers, etag):
+        return utils.not_modified(etag)
 
-            query = session.query(DbSshKey).filter(DbSshKey.owner_uuid == _uuid,
-                                                   DbSshKey.key_uuid == keyid)
-            query_result = query.all()
+    query = session.query(*_long_key_columns(fields)).filter(DbSshKey.owner_uuid == _uuid,
+                                                             DbSshKey.key_uuid == keyid)
+    query_result = query.all()
 
-            if len(query_result) < 1:
-                log.warn(f'Unable to find key {keyid} for user {_uuid} in sshkeys_keyid_get, '
-                         f'proceeding')
-                return cors_response(HTTPStatus.NOT_FOUND,
-                                     xerror='Key {0} not found for user {1}'.format(keyid, _uuid))
+    if len(query_result) < 1:
+        log.warn(f'Unable to find key {keyid} for user {_uuid} in sshkeys_keyid_get, '
+                 f'proceeding')
+        return cors_response(HTTPStatus.NOT_FOUND,
+                             xerror='Key {0} not found for user {1}'.format(keyid, _uuid))
 
-            return _fill_long_key(query_result[0])
+    return _fill_long_key(query_result[0], fields), HTTPStatus.OK, {utils.ETAG: etag}
 
 
 def sshkeys_keytype_post(keytype: str, public_openssh: str, description: str) -> str:  # noqa: E501
@@ -395,57 +732,66 @@ def sshkeys_keytype_post(keytype: str, public_openssh: str, description: str) ->
         return cors_response(HTTPStatus.FORBIDDEN,
                              xerror='Unable to find UUID from OIDC Sub claim')
 
-    with Session() as session:
-        with session.begin():
-            # checks are in this order on purpose so we do the cheapest checks first
-
-            if _check_key_qty(_uuid, keytype, session) >= SSH_KEY_QTY_LIMIT:
-                log.error(f'Too many keys of type {keytype} for user {_uuid}, limit {SSH_KEY_QTY_LIMIT}')
-                return cors_response(HTTPStatus.BAD_REQUEST,
-                                     xerror=f'Too many active keys for this user, limit {SSH_KEY_QTY_LIMIT}')
-
-            status, active_flag = utils.check_user_active(session, request.headers)
-            if status != 200:
-                log.error(f'Error {status} contacting COmanage in sshkeys_keytype_post')
-                return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                     xerror=f'Error {status} contacting COmanage')
-
-            if not active_flag:
-                log.warn(f'User is not an active user in sshkeys_keytype_post')
-                return cors_response(HTTPStatus.FORBIDDEN,
-                                     xerror='User not an active user')
-
-            # instantiate to test its validity
-            try:
-                fssh = FABRICSSHKey(public_openssh)
-            except FABRICSSHKeyException as e:
-                log.error(f'Provided key for {_uuid} is invalid due to {str(e)}')
-                return cors_response(HTTPStatus.BAD_REQUEST,
-                                     xerror=f'Provided key for {_uuid} is invalid due to {str(e)}')
-            except Exception:
-                log.error(f'Unable to parse provided SSH key. Provided key is invalid.')
-                return cors_response(HTTPStatus.BAD_REQUEST,
-                                     xerror=f'Provided key for {_uuid} is invalid.')
-
-            if not _check_unique(_uuid, fssh.get_fingerprint(), session):
-                log.error(f'Provided key for {_uuid} with fingerprint {fssh.get_fingerprint()} is not unique')
-                return cors_response(HTTPStatus.BAD_REQUEST,
-                                     xerror=f'Provided key for {_uuid} with fingerprint '
-                                            f'{fssh.get_fingerprint()} is not unique')
-
-            short_key = SshKeyShort()
-            short_key.ssh_key_type = fssh.name
-            short_key.comment = fssh.comment
-            short_key.public_key = fssh.public_key
-            short_key.fingerprint = fssh.get_fingerprint()
-            matches = re.match(DESCRIPTION_REGEX, description)
-            if matches is None:
-                log.error(f'Provided description for {_uuid} does not match expected REGEX {DESCRIPTION_REGEX}')
-                return cors_response(HTTPStatus.BAD_REQUEST,
-                                     xerror=f'Provided description does not match expected REGEX {DESCRIPTION_REGEX}')
-            short_key.description = description
-
-    _store_ssh_key(_uuid, keytype, short_key)
+    # checks are in this order on purpose so we do the cheapest checks first
+    matches = re.match(DESCRIPTION_REGEX, description)
+    if matches is None:
+        log.error(f'Provided description for {_uuid} does not match expected REGEX {DESCRIPTION_REGEX}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Provided description does not match expected REGEX {DESCRIPTION_REGEX}')
+
+    # instantiate to test its validity
+    try:
+        with tracing.span('FABRICSSHKey.parse'):
+            fssh = FABRICSSHKey(public_openssh)
+    except FABRICSSHKeyException as e:
+        log.error(f'Provided key for {_uuid} is invalid due to {str(e)}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Provided key for {_uuid} is invalid due to {str(e)}')
+    except Exception:
+        log.error('Unable to parse provided SSH key. Provided key is invalid.')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Provided key for {_uuid} is invalid.')
+
+    short_key = SshKeyShort()
+    short_key.ssh_key_type = fssh.name
+    short_key.comment = fssh.comment
+    short_key.public_key = fssh.public_key
+    short_key.fingerprint = fssh.get_fingerprint()
+    short_key.description = description
+
+    session = request_session()
+    status, active_flag = utils.check_user_active(session, request.headers)
+    if status != 200:
+        log.error(f'Error {status} contacting COmanage in sshkeys_keytype_post')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
+
+    if not active_flag:
+        log.warn('User is not an active user in sshkeys_keytype_post')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User not an active user')
+
+    with _key_admission(_uuid) as (admission, person):
+        if person is None:
+            log.error(f'Unable to find person {_uuid} in sshkeys_keytype_post')
+            return cors_response(HTTPStatus.FORBIDDEN,
+                                 xerror='Unable to find UUID from OIDC Sub claim')
+
+        key_qty, existing_fingerprints = _key_admission_state(_uuid, [short_key.fingerprint], admission)
+        if key_qty.get(keytype, 0) >= SSH_KEY_QTY_LIMIT:
+            log.error(f'Too many keys of type {keytype} for user {_uuid}, limit {SSH_KEY_QTY_LIMIT}')
+            return cors_response(HTTPStatus.BAD_REQUEST,
+                                 xerror=f'Too many active keys for this user, limit {SSH_KEY_QTY_LIMIT}')
+
+        if short_key.fingerprint in existing_fingerprints:
+            log.error(f'Provided key for {_uuid} with fingerprint {short_key.fingerprint} is not unique')
+            return cors_response(HTTPStatus.BAD_REQUEST,
+                                 xerror=f'Provided key for {_uuid} with fingerprint '
+                                        f'{short_key.fingerprint} is not unique')
+
+        db_key = _store_ssh_key(person, keytype, short_key, admission)
+
+    _store_key_in_comanage(person, db_key)
 
     return "OK"
 
@@ -465,27 +811,35 @@ def sshkeys_keytype_put(keytype: str, comment: str, description: str) -> SshKeyP
         return cors_response(HTTPStatus.FORBIDDEN,
                              xerror='Unable to find UUID from OIDC Sub claim')
 
-    with Session() as session:
-        with session.begin():
-            if _check_key_qty(_uuid, keytype, session) >= SSH_KEY_QTY_LIMIT:
-                log.error(f'Too many keys of type {keytype} for user {_uuid}, limit {SSH_KEY_QTY_LIMIT}')
-                return cors_response(HTTPStatus.BAD_REQUEST,
-                                     xerror=f'Too many active keys for this user, limit {SSH_KEY_QTY_LIMIT}')
-
-            status, active_flag = utils.check_user_active(session, request.headers)
-            if status != 200:
-                log.error(f'Error {status} contacting COmanage in sshkeys_keytype_put')
-                return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
-                                     xerror=f'Error {status} contacting COmanage')
-
-            if not active_flag:
-                log.warn(f'User is not an active user in sshkeys_keytype_put')
-                return cors_response(HTTPStatus.FORBIDDEN,
-                                     xerror='User not an active user')
+    matches = re.match(DESCRIPTION_REGEX, description)
+    if matches is None:
+        log.error(f'Provided description for {_uuid} does not match expected REGEX {DESCRIPTION_REGEX}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Provided description does not match expected REGEX {DESCRIPTION_REGEX}')
+
+    session = request_session()
+    # don't generate keys that can't be admitted, checked again when storing the key
+    key_qty, _ = _key_admission_state(_uuid, [], session)
+    if key_qty.get(keytype, 0) >= SSH_KEY_QTY_LIMIT:
+        log.error(f'Too many keys of type {keytype} for user {_uuid}, limit {SSH_KEY_QTY_LIMIT}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Too many active keys for this user, limit {SSH_KEY_QTY_LIMIT}')
+
+    status, active_flag = utils.check_user_active(session, request.headers)
+    if status != 200:
+        log.error(f'Error {status} contacting COmanage in sshkeys_keytype_put')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
+
+    if not active_flag:
+        log.warn('User is not an active user in sshkeys_keytype_put')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User not an active user')
 
     log.info(f'Generating key of type {keytype} for {_uuid} with comment {comment}')
     try:
-        fssh = FABRICSSHKey.generate(comment, SSH_KEY_ALGORITHM)
+        with tracing.span('FABRICSSHKey.generate', algorithm=SSH_KEY_ALGORITHM):
+            fssh = FABRICSSHKey.generate(comment, SSH_KEY_ALGORITHM)
     except FABRICSSHKeyException as e:
         log.error(f'Unable to generate a new key for {_uuid} due to {str(e)}')
         return cors_response(HTTPStatus.BAD_REQUEST,
@@ -495,15 +849,24 @@ def sshkeys_keytype_put(keytype: str, comment: str, description: str) -> SshKeyP
     short_key.ssh_key_type = fssh.name
     short_key.public_key = fssh.public_key
     short_key.comment = fssh.comment
-    matches = re.match(DESCRIPTION_REGEX, description)
-    if matches is None:
-        log.error(f'Provided description for {_uuid} does not match expected REGEX {DESCRIPTION_REGEX}')
-        return cors_response(HTTPStatus.BAD_REQUEST,
-                             xerror=f'Provided description does not match expected REGEX {DESCRIPTION_REGEX}')
     short_key.description = description
     short_key.fingerprint = fssh.get_fingerprint()
-    # insert in database
-    _store_ssh_key(_uuid, keytype, short_key)
+
+    with _key_admission(_uuid) as (admission, person):
+        if person is None:
+            log.error(f'Unable to find person {_uuid} in sshkeys_keytype_put')
+            return cors_response(HTTPStatus.FORBIDDEN,
+                                 xerror='Unable to find UUID from OIDC Sub claim')
+
+        key_qty, _ = _key_admission_state(_uuid, [], admission)
+        if key_qty.get(keytype, 0) >= SSH_KEY_QTY_LIMIT:
+            log.error(f'Too many keys of type {keytype} for user {_uuid}, limit {SSH_KEY_QTY_LIMIT}')
+            return cors_response(HTTPStatus.BAD_REQUEST,
+                                 xerror=f'Too many active keys for this user, limit {SSH_KEY_QTY_LIMIT}')
+
+        db_key = _store_ssh_key(person, keytype, short_key, admission)
+
+    _store_key_in_comanage(person, db_key)
 
     ret = fssh.as_keypair()
 
@@ -511,39 +874,166 @@ def sshkeys_keytype_put(keytype: str, comment: str, description: str) -> SshKeyP
     return SshKeyPair(ret[0], ret[1])
 
 
-def _update_keys(session):
+def sshkeys_post(body: List[SshKeyUpload]) -> List[SshKeyUploadResult]:  # noqa: E501
+    """
+    Post multiple public keys at once. Every key is validated first, then
+    quota and uniqueness are checked once and all admitted keys are inserted
+    in one transaction. Returns a result per key in the order they were provided.
+    """
+    if not utils.any_authenticated_user(request.headers):
+        return cors_response(HTTPStatus.UNAUTHORIZED,
+                             xerror='User not authenticated')
+
+    _uuid = utils.get_uuid_by_oidc_claim(request.headers)
+
+    if _uuid is None:
+        log.error(f'OIDC Claim Sub is invalid or unable to find UUID {_uuid} in sshkeys_post')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='Unable to find UUID from OIDC Sub claim')
+
+    # nobody can hold more keys than this anyway
+    bulk_limit = SSH_KEY_QTY_LIMIT * len(KeyType)
+    if body is None or len(body) == 0 or len(body) > bulk_limit:
+        log.error(f'Invalid number of keys provided by {_uuid} in sshkeys_post, limit {bulk_limit}')
+        return cors_response(HTTPStatus.BAD_REQUEST,
+                             xerror=f'Between 1 and {bulk_limit} keys must be provided')
+
+    # validate every key before touching the database. items are independent of each other
+    validated = list(map(_validate_upload, body))
+    results = [result for result, _ in validated]
+
+    fingerprints = [short_key.fingerprint for _, short_key in validated if short_key is not None]
+    if len(fingerprints) == 0:
+        return results
+
+    session = request_session()
+    status, active_flag = utils.check_user_active(session, request.headers)
+    if status != 200:
+        log.error(f'Error {status} contacting COmanage in sshkeys_post')
+        return cors_response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             xerror=f'Error {status} contacting COmanage')
+
+    if not active_flag:
+        log.warn('User is not an active user in sshkeys_post')
+        return cors_response(HTTPStatus.FORBIDDEN,
+                             xerror='User not an active user')
+
+    db_keys = list()
+    with _key_admission(_uuid) as (admission, person):
+        if person is None:
+            log.error(f'Unable to find person {_uuid} in sshkeys_post')
+            return cors_response(HTTPStatus.FORBIDDEN,
+                                 xerror='Unable to find UUID from OIDC Sub claim')
+
+        key_qty, existing_fingerprints = _key_admission_state(_uuid, fingerprints, admission)
+
+        for item, (result, short_key) in zip(body, validated):
+            if short_key is None:
+                continue
+            if short_key.fingerprint in existing_fingerprints:
+                log.error(f'Provided key for {_uuid} with fingerprint {short_key.fingerprint} is not unique')
+                result.status = HTTPStatus.BAD_REQUEST.value
+                result.error = f'Provided key with fingerprint {short_key.fingerprint} is not unique'
+                continue
+            if key_qty.get(item.keytype, 0) >= SSH_KEY_QTY_LIMIT:
+                log.error(f'Too many keys of type {item.keytype} for user {_uuid}, limit {SSH_KEY_QTY_LIMIT}')
+                result.status = HTTPStatus.BAD_REQUEST.value
+                result.error = f'Too many active keys for this user, limit {SSH_KEY_QTY_LIMIT}'
+                continue
+            db_key = _store_ssh_key(person, item.keytype, short_key, admission)
+            key_qty[item.keytype] = key_qty.get(item.keytype, 0) + 1
+            existing_fingerprints.add(short_key.fingerprint)
+            result.key_uuid = db_key.key_uuid
+            result.status = HTTPStatus.OK.value
+            db_keys.append(db_key)
+
+    for db_key in db_keys:
+        _store_key_in_comanage(person, db_key)
+
+    return results
+
+
+def _validate_upload(item: SshKeyUpload) -> Tuple[SshKeyUploadResult, Optional[SshKeyShort]]:
+    """
+    Validate a single key of a bulk upload without touching the database.
+    Returns a tuple: [result to report, short key if valid or None]
+    """
+    result = SshKeyUploadResult()
+    if item.keytype not in KeyType.__members__.keys():
+        result.status = HTTPStatus.BAD_REQUEST.value
+        result.error = f'Invalid key type {item.keytype}'
+        return result, None
+
+    matches = re.match(DESCRIPTION_REGEX, item.description)
+    if matches is None:
+        result.status = HTTPStatus.BAD_REQUEST.value
+        result.error = f'Provided description does not match expected REGEX {DESCRIPTION_REGEX}'
+        return result, None
+
+    try:
+        with tracing.span('FABRICSSHKey.parse'):
+            fssh = FABRICSSHKey(item.public_openssh)
+    except FABRICSSHKeyException as e:
+        result.status = HTTPStatus.BAD_REQUEST.value
+        result.error = f'Provided key is invalid due to {str(e)}'
+        return result, None
+    except Exception:
+        result.status = HTTPStatus.BAD_REQUEST.value
+        result.error = 'Provided key is invalid.'
+        return result, None
+
+    short_key = SshKeyShort()
+    short_key.ssh_key_type = fssh.name
+    short_key.comment = fssh.comment
+    short_key.public_key = fssh.public_key
+    short_key.fingerprint = fssh.get_fingerprint()
+    short_key.description = item.description
+    result.fingerprint = short_key.fingerprint
+    return result, short_key
+
+
+def update_keys():
     """
-    Make an atomic update - expire keys, then garbage collect
+    Make an atomic update - expire keys, then garbage collect. This is committed
+    in a short transaction of its own before the caller carries on, so the key
+    change lock is released right away and the outcome does not depend on
+    whether the request succeeds. Expired sliver keys are removed from COmanage
+    after the commit.
     """
+    with Session() as session:
+        with session.begin():
+            comanage_sliver_keys = _expire_keys(session)
+            _garbage_collect_keys(session)
 
-    #with session.begin_nested():
-    # https://stackoverflow.com/questions/37331646/sqlalchemy-explicit-locking-of-postgresql-table
-    #session.execute('LOCK TABLE fabric_sshkeys IN ACCESS EXCLUSIVE MODE;')
-    #with session.begin_nested():
-    _expire_keys(session)
-    _garbage_collect_keys(session)
-    #session.flush()
+    for ck in comanage_sliver_keys:
+        try:
+            co_api.ssh_keys_delete(ck)
+        except requests.HTTPError as e:
+            log.error(f'Unable to delete expired sliver key {ck} from COmanage due to: {e}')
 
 
-def _expire_keys(session):
+def _expire_keys(session) -> List[str]:
     """
     Scan the keys and deactivate those that are expired.
+    Return COmanage ids of expired sliver keys to remove from COmanage.
     """
     now = datetime.now(timezone.utc)
     query = session.query(DbSshKey).filter(DbSshKey.expires_on < now, DbSshKey.active == True)
     query_result = query.all()
-    log.info(f'Expiring {len(query.all())} keys')
+    log.info(f'Expiring {len(query_result)} keys')
+    metrics.KEYS_EXPIRED.inc(len(query_result))
+    if len(query_result) > 0:
+        lock_key_changes(session)
+    comanage_sliver_keys = list()
     for q in query_result:
+        q.change_seq = next_key_change_seq()
         q.deactivated_on = now
         q.deactivation_reason = f'Key automatically expired on {now}Z'
         q.active = False
         if SSH_SLIVER_KEY_TO_COMANAGE and q.fabric_key_type == KeyType.sliver.name:
             log.info(f'Removing expired sliver key {q.comment}/{q.key_uuid} for user {q.owner_uuid} from COmanage')
-            try:
-                co_api.ssh_keys_delete(q.comanage_key_id)
-            except requests.HTTPError as e:
-                log.error(f'Unable to delete expired sliver key {q.key_uuid}/{q.key_uuid} for user {q.owner_uuid} '
-                          f'from COmanage due to: {e}')
+            comanage_sliver_keys.append(q.comanage_key_id)
+    return comanage_sliver_keys
 
 
 def _garbage_collect_keys(session):
@@ -553,33 +1043,126 @@ def _garbage_collect_keys(session):
     now = datetime.now(timezone.utc)
     gc_delta = timedelta(days=SSH_GARBAGE_COLLECT_AFTER_DAYS)
     check_instant = now - gc_delta
-    session.query(DbSshKey).\
+    deleted = session.query(DbSshKey).\
         filter(DbSshKey.deactivated_on < check_instant,
                DbSshKey.active == False).delete()
+    metrics.KEYS_GARBAGE_COLLECTED.inc(deleted)
 
 
-def _fill_long_key(query_result) -> SshKeyLong:
-
-    skl = SshKeyLong()
-    skl.ssh_key_type = query_result.ssh_key_type
-    skl.description = query_result.description
-    skl.comment = query_result.comment
-    skl.key_uuid = query_result.key_uuid
-    skl.public_key = query_result.public_key
-    skl.created_on = str(query_result.created_on)
-    skl.expires_on = str(query_result.expires_on)
-    skl.fingerprint = query_result.fingerprint
-    skl.fabric_key_type = query_result.fabric_key_type
-    if not query_result.active:
-        skl.deactivated_on = str(query_result.deactivated_on)
-        skl.deactivation_reason = query_result.deactivation_reason
+def _fill_long_key(query_result, fields: Set[str] = None) -> SshKeyLong:
+    """
+    Fill the requested attributes (all if fields is None) of a key from a DbSshKey
+    or a row of _long_key_columns(fields)
+    """
+    def wanted(name):
+        return fields is None or name in fields
+
+    values = {name: getattr(query_result, name) for name in LONG_KEY_PLAIN_ATTRIBUTES if wanted(name)}
+    for name in ('created_on', 'expires_on'):
+        if wanted(name):
+            values[name] = str(getattr(query_result, name))
+    skl = CompactSshKeyLong(**values)
+    if (wanted('deactivated_on') or wanted('deactivation_reason')) and not query_result.active:
+        if wanted('deactivated_on'):
+            skl.deactivated_on = str(query_result.deactivated_on)
+        if wanted('deactivation_reason'):
+            skl.deactivation_reason = query_result.deactivation_reason
     return skl
 
 
-def _store_ssh_key(_uuid: str, keytype: str, key: SshKeyShort) -> None:
+def _long_key_columns(fields: Optional[Set[str]]) -> List:
+    """
+    Columns to query for the requested SshKeyLong attributes (all if fields is None)
+    """
+    columns = dict()
+    for name, name_columns in LONG_KEY_COLUMNS.items():
+        if fields is None or name in fields:
+            for column in name_columns:
+                columns[column.key] = column
+    return list(columns.values())
+
+
+def _login_partition(logins: Optional[List[str]], shard: Optional[int],
+                     shards: Optional[int]) -> Tuple[Optional[List], Optional[str]]:
+    """
+    Criteria selecting keys of a partition of bastion logins, either an explicit
+    list of logins or shard out of shards (a power of 2) contiguous ranges of
+    login hash buckets. Returns the criteria or an error message.
+    """
+    if logins is not None:
+        if shard is not None or shards is not None:
+            return None, 'Provide either logins or shard and shards, not both.'
+        logins = {login.strip() for login in logins if len(login.strip()) > 0}
+        if len(logins) == 0 or len(logins) > BASTION_LOGINS_LIMIT:
+            return None, f'Between 1 and {BASTION_LOGINS_LIMIT} logins must be provided.'
+        return [FabricPerson.bastion_login.in_(logins)], None
+
+    if shard is None and shards is None:
+        return [], None
+
+    if shard is None or shards is None or shards < 1 or shards > LOGIN_BUCKETS or \
+            LOGIN_BUCKETS % shards != 0 or shard < 0 or shard >= shards:
+        return None, f'Shards must be a power of 2 no larger than {LOGIN_BUCKETS} and shard ' \
+                     f'must be between 0 and shards - 1.'
+    width = LOGIN_BUCKETS // shards
+    return [FabricPerson.login_bucket >= shard * width,
+            FabricPerson.login_bucket < (shard + 1) * width], None
+
+
+def _keys_version(session, *criteria) -> Tuple[int, int]:
+    """
+    Cheap version of the set of keys matching the criteria: the highest change
+    sequence number and the number of keys. Adding or deactivating a key raises
+    the former, garbage collection lowers the latter.
+    """
+    max_seq, qty = session.query(func.max(DbSshKey.change_seq),
+                                 func.count(DbSshKey.id)).filter(*criteria).one()
+    return max_seq or 0, qty
+
+
+def _fill_bastion_key(row) -> SshKeyBastion:
     """
-    Select where to store the ssh key - locally or in COmanage.
+    Build what bastion hosts need to know about a key from a row of BASTION_KEY_COLUMNS.
+    Everything is precomputed when the key or its owner is stored.
     """
+    # comment in the key includes expiration date/time
+    # GECOS is a 5-field comma-separated field that includes things like full name
+    # various locations, phone numbers and emails. External email is part of the 5th field
+    k = CompactSshKeyBastion(public_openssh=row.authorized_key, login=row.bastion_login, gecos=row.gecos,
+                             status=KeyStatus.active.name if row.active else KeyStatus.deactivated.name)
+    return k
+
+
+def _encode_cursor(change_seq: int) -> str:
+    """
+    Turn a key change sequence number into an opaque feed cursor
+    """
+    return urlsafe_b64encode(f'{CURSOR_VERSION}:{change_seq}'.encode()).decode()
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """
+    Turn an opaque feed cursor back into a key change sequence number.
+    Missing cursor means the beginning of the feed, None is returned if the cursor is invalid.
+    """
+    if cursor is None or len(cursor.strip()) == 0:
+        return 0
+    try:
+        version, change_seq = urlsafe_b64decode(cursor.strip().encode()).decode().split(':')
+        if version != CURSOR_VERSION:
+            return None
+        return int(change_seq)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _store_ssh_key(person: FabricPerson, keytype: str, key: SshKeyShort, session) -> DbSshKey:
+    """
+    Insert the ssh key in the database. Session is passed in externally and is
+    expected to be the one that did the admission checks, commit is left to the
+    caller. Copies in COmanage are added afterwards, see _store_key_in_comanage().
+    """
+    _uuid = person.uuid
 
     db_key = DbSshKey()
     db_key.owner_uuid = _uuid
@@ -599,71 +1182,100 @@ def _store_ssh_key(_uuid: str, keytype: str, key: SshKeyShort) -> None:
     # bastion or sliver
     db_key.fabric_key_type = keytype
 
-    with Session() as session:
+    # change_seq is assigned on insert
+    lock_key_changes(session)
+    session.add(db_key)
+    return db_key
+
+
+def _store_key_in_comanage(person: FabricPerson, db_key: DbSshKey) -> None:
+    """
+    Store a copy of an admitted sliver key in COmanage if configured to. Runs
+    after the admission transaction committed, so no locks are held during the
+    COmanage calls. The COmanage key id (and co_person_id) are recorded with
+    the request session.
+    """
+    # did we want to store copy of sliver key in COmanage?
+    if not (SSH_SLIVER_KEY_TO_COMANAGE and db_key.fabric_key_type == KeyType.sliver.name):
+        return
+    _uuid = person.uuid
+    session = request_session()
+    log.debug(f'Storing sliver key {db_key.comment} for user {_uuid} in COmanage')
+    co_key_response = None
+    try:
+        co_person_id = person.co_person_id
+        if co_person_id is None:
+            log.info(f'Looking up co_person_id in _store_key_in_comanage for person {person.uuid}')
+            # we already know they are active
+            _, _, co_person_id = utils.comanage_check_active_person(person)
+
+        if co_person_id is not None:
+            if co_person_id != person.co_person_id:
+                # update the person table in database with co_person_id while we're at it
+                db_person = session.query(FabricPerson).filter(FabricPerson.uuid == _uuid).one()
+                db_person.co_person_id = co_person_id
+            log.debug(f'Adding sliver key {db_key.comment} for user {_uuid}/{co_person_id} '
+                      f'to COmanage [ {db_key.public_key=}, {db_key.ssh_key_type=}, {db_key.comment=}')
+            co_key_response = co_api.ssh_keys_add(co_person_id, db_key.public_key, db_key.ssh_key_type,
+                                                  db_key.comment)
+        else:
+            log.warn(f'Unable to add sliver key {db_key.comment} for user '
+                     f'{_uuid} due to missing co_person_id')
+    except requests.HTTPError as e:
+        log.error(f'Unable to add sliver key {db_key.comment} for user {_uuid} to COmanage due to {e}')
+    if co_key_response:
+        if co_key_response.get('Id', None) is None:
+            log.error(f'Unable to add sliver key {db_key.comment} for user '
+                      f'{_uuid} due to unexpected return format of the response: {co_key_response=}')
+        else:
+            session.query(DbSshKey).filter(DbSshKey.key_uuid == db_key.key_uuid).\
+                update({DbSshKey.comanage_key_id: co_key_response['Id']}, synchronize_session=False)
+
+
+@contextmanager
+def _key_admission(_uuid: str):
+    """
+    Short transaction of its own for admitting new keys of a user: yields the
+    session and the key owner (None if unknown) locked FOR UPDATE, so quota and
+    uniqueness checks followed by the insert can't be raced by concurrent
+    requests of the same user. Commits when the block is left, releasing the
+    locks before anything slow (COmanage calls) happens.
+    """
+    # admitted keys and their owner are still read after the commit
+    with Session(expire_on_commit=False) as session:
         with session.begin():
-            # did we want to store copy of sliver key in COmanage?
-            if SSH_SLIVER_KEY_TO_COMANAGE and keytype == KeyType.sliver.name:
-                log.debug(f'Storing sliver key {db_key.comment} for user {_uuid} in COmanage')
-                query = session.query(FabricPerson).filter(FabricPerson.uuid == _uuid)
-                query_result = query.all()
-                if len(query_result) == 0:
-                    log.error(f'Unable to store key {db_key.comment} for user {_uuid} in COmanage'
-                              f' - unable to find them in database')
-                else:
-                    co_key_response = None
-                    try:
-                        person = query_result[0]
-                        co_person_id = person.co_person_id
-                        if co_person_id is None:
-                            log.info(f'Looking up co_person_id in _store_ssh_key for person {person.uuid}')
-                            # we already know they are active
-                            _, _, co_person_id = utils.comanage_check_active_person(person)
-
-                        if co_person_id is not None:
-                            # update the person table in database with co_person_id while we're at it
-                            setattr(person, 'co_person_id', co_person_id)
-                            log.debug(f'Adding sliver key {db_key.comment} for user {_uuid}/{co_person_id} '
-                                      f'to COmanage [ {key.public_key=}, {key.ssh_key_type=}, {key.comment=}')
-                            co_key_response = co_api.ssh_keys_add(query_result[0].co_person_id,
-                                                                  key.public_key, key.ssh_key_type, key.comment)
-                        else:
-                            log.warn(f'Unable to add sliver key {db_key.comment} for user '
-                                     f'{_uuid} due to missing co_person_id')
-                    except requests.HTTPError as e:
-                        log.error(f'Unable to add sliver key {db_key.comment} for user {_uuid} to COmanage due to {e}')
-                    if co_key_response:
-                        if co_key_response.get('Id', None) is None:
-                            log.error(f'Unable to add sliver key {db_key.comment} for user '
-                                      f'{_uuid} due to unexpected return format of the response: {co_key_response=}')
-                        else:
-                            db_key.comanage_key_id = co_key_response['Id']
-
-            session.add(db_key)
-            # commits automatically
-
-
-def _check_key_qty(_uuid: str, keytype: str, session: Session) -> int:
-    """
-    How many active keys of this type are already there for this user?
+            yield session, _lock_key_owner(_uuid, session)
+
+
+def _lock_key_owner(_uuid: str, session) -> Optional[FabricPerson]:
     """
-    query = session.query(DbSshKey).filter(DbSshKey.owner_uuid == _uuid,
-                                           DbSshKey.active == True,
-                                           DbSshKey.fabric_key_type == keytype)
-    query_result = query.all()
-    return len(query_result)
+    Select the key owner FOR UPDATE. The row lock is held until the enclosing
+    transaction ends, which serializes key admission (quota and uniqueness
+    checks followed by the insert) for this user.
+    """
+    return session.query(FabricPerson).filter(FabricPerson.uuid == _uuid).with_for_update().one_or_none()
 
 
-def _check_unique(_uuid: str, fingerprint: str, session: Session) -> bool:
+def _key_admission_state(_uuid: str, fingerprints: List[str], session) -> Tuple[Dict[str, int], Set[str]]:
     """
-    See if a key with this fingerprint is already in the system for this user,
+    In a single query find how many active keys of each type are already there
+    for this user and which of the provided fingerprints they already have,
     regardless of type or status.
+    Returns a tuple: [dict of active key counts by key type, set of existing fingerprints]
     """
-    query = session.query(DbSshKey).filter(DbSshKey.owner_uuid == _uuid,
-                                           DbSshKey.fingerprint == fingerprint)
-    query_result = query.all()
-    if len(query_result) > 0:
-        return False
-    return True
+    query = session.query(DbSshKey.fabric_key_type,
+                          func.count(DbSshKey.id).filter(DbSshKey.active == True),
+                          func.array_agg(DbSshKey.fingerprint).filter(DbSshKey.fingerprint.in_(fingerprints))).\
+        filter(DbSshKey.owner_uuid == _uuid).\
+        group_by(DbSshKey.fabric_key_type)
+
+    key_qty = dict()
+    existing_fingerprints = set()
+    for fabric_key_type, active_qty, matched_fingerprints in query.all():
+        key_qty[fabric_key_type] = active_qty
+        if matched_fingerprints:
+            existing_fingerprints.update(matched_fingerprints)
+    return key_qty, existing_fingerprints
 
 
 def _bad_uuid(_uuid: str) -> bool:
@@ -676,15 +1288,4 @@ def _bad_uuid(_uuid: str) -> bool:
     return False
 
 
-def _make_bastion_comment(comment: str, expires_on) -> str:
-    """
-    Return a new comment that is a concatenation of the original comment
-    with the expiration date for consumption on bastion hosts.
-    """
-    # we want to keep the comment under 100 character
-    # so we trim the original comment if needed:
-    # the date is 23 characters long: _(2021-11-18_10:17:05)_
-    # we don't ever want this to fail so someone can't construct
-    # a comment so the corresponding key can't be purged
-    ts = expires_on.strftime("_(%Y-%m-%d_%H:%M:%S%z)_")
-    return comment.strip()[0:COMMENT_LENGTH-len(ts)] + ts
\ No newline at end of file
+bastion_key_index = BastionKeyIndex(KeyType.bastion.name)
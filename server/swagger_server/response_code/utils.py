@@ -23,24 +23,35 @@
 #
 #
 # Author: Ilya Baldin (ibaldin@renci.org) Michael Stealey (stealey@renci.org)
-from typing import Tuple, List
+from typing import Optional, Tuple, List, Set
 
 import psycopg2
 import uuid
 import json
+import hashlib
 import re
 import jwt
 from datetime import datetime, timezone
+from http import HTTPStatus
 import requests
+from flask import request, Response
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 from fss_utils.jwt_manager import ValidateCode
 from fss_utils.sshkey import FABRICSSHKey
 
-from swagger_server.models import Preferences, PeopleShort
-from swagger_server.models.people_long import PeopleLong
+from swagger_server.models.compact import CompactPeopleLong, CompactPeopleShort, CompactPreferences
 from swagger_server.database import Session
+from swagger_server.database.request_session import request_session
+from swagger_server.instrumentation import metrics
+from swagger_server.instrumentation.timing import timed_phase, SERIALIZATION_PHASE
+from swagger_server.encoder import to_plain
 from swagger_server.database.models import FabricPerson, InsertOutcome, insert_unique_person
-from swagger_server import SKIP_CILOGON_VALIDATION, CO_ACTIVE_USERS_COU, log, co_api
+from swagger_server import SKIP_CILOGON_VALIDATION, CO_ACTIVE_USERS_COU, ADMIN_OIDC_CLAIM_SUBS, log, co_api
 from swagger_server import jwt_validator
 
 
@@ -86,6 +97,18 @@ def run_sql_commands(commands):
 
 
 ID_TOKEN_NAME = 'X-Vouch-Idp-Idtoken'
+ETAG = 'ETag'
+IF_NONE_MATCH = 'If-None-Match'
+IF_MATCH = 'If-Match'
+# cache label of conditional GETs in metrics
+ETAG_CACHE = 'etag'
+VARY = 'Vary'
+ACCEPT = 'Accept'
+ACCEPT_ENCODING = 'Accept-Encoding'
+CONTENT_ENCODING = 'Content-Encoding'
+JSON_MIMETYPE = 'application/json'
+# the first one is used in responses
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
 SUB_CLAIM = 'sub'
 NAME_CLAIM = 'name'
 EMAIL_CLAIM = 'email'
@@ -157,25 +180,22 @@ def validate_uuid_by_oidc_claim(headers, puuid) -> bool:
         log.error('"sub" claim not present in the decoded token')
         return False
 
-    session = Session()
-    try:
-        query = session.query(FabricPerson).filter(FabricPerson.oidc_claim_sub == oidc_claim_sub)
-        query_result = query.all()
+    session = request_session()
+    query = session.query(FabricPerson).filter(FabricPerson.oidc_claim_sub == oidc_claim_sub)
+    query_result = query.all()
 
-        if len(query_result) == 0:
-            log.error(f"Unable to find user matching claim sub {oidc_claim_sub}")
-            return False
+    if len(query_result) == 0:
+        log.error(f"Unable to find user matching claim sub {oidc_claim_sub}")
+        return False
 
-        if len(query_result) > 1:
-            log.error(f"Found multiple users matching claim sub {oidc_claim_sub}")
-            return False
+    if len(query_result) > 1:
+        log.error(f"Found multiple users matching claim sub {oidc_claim_sub}")
+        return False
 
-        person = query_result[0]
+    person = query_result[0]
 
-        log.info(f"Entry for claim sub vs uuid {puuid} match: {person.uuid == puuid}")
-        return person.uuid == puuid
-    finally:
-        session.close()
+    log.info(f"Entry for claim sub vs uuid {puuid} match: {person.uuid == puuid}")
+    return person.uuid == puuid
 
 
 def get_uuid_by_oidc_claim(headers) -> str or None:
@@ -206,24 +226,21 @@ def get_uuid_by_oidc_claim(headers) -> str or None:
         log.error('"sub" claim not present in the decoded token')
         return None
 
-    session = Session()
-    try:
-        query = session.query(FabricPerson).filter(FabricPerson.oidc_claim_sub == oidc_claim_sub)
-        query_result = query.all()
+    session = request_session()
+    query = session.query(FabricPerson).filter(FabricPerson.oidc_claim_sub == oidc_claim_sub)
+    query_result = query.all()
 
-        if len(query_result) == 0:
-            log.error(f"Unable to find user matching claim sub {oidc_claim_sub}")
-            return None
+    if len(query_result) == 0:
+        log.error(f"Unable to find user matching claim sub {oidc_claim_sub}")
+        return None
 
-        if len(query_result) > 1:
-            log.error(f"Found multiple users matching claim sub {oidc_claim_sub}")
-            return None
+    if len(query_result) > 1:
+        log.error(f"Found multiple users matching claim sub {oidc_claim_sub}")
+        return None
 
-        person = query_result[0]
+    person = query_result[0]
 
-        return person.uuid
-    finally:
-        session.close()
+    return person.uuid
 
 
 def validate_oidc_claim(headers, oidc_claim_sub) -> bool:
@@ -292,6 +309,19 @@ def extract_oidc_claim(headers):
     return header_sub
 
 
+def is_admin_user(headers) -> bool:
+    """
+    Check if the identity token in the header belongs to one of the administrators
+    listed in UIS_ADMIN_OIDC_CLAIM_SUBS.
+    :param headers: request headers
+    :return bool:
+    """
+    if len(ADMIN_OIDC_CLAIM_SUBS) == 0:
+        return False
+    oidc_claim_sub = extract_oidc_claim(headers)
+    return oidc_claim_sub is not None and oidc_claim_sub in ADMIN_OIDC_CLAIM_SUBS
+
+
 def create_new_fabric_person_from_token(headers, check_unique=False):
     """
     Extract info from identity token and create a FabricPerson entry for this person,
@@ -304,66 +334,172 @@ def create_new_fabric_person_from_token(headers, check_unique=False):
     # token should be validated by now
     decoded = jwt.decode(id_token, verify=False)
 
-    session = Session()
-    try:
-        dbperson = FabricPerson()
-        dbperson.uuid = uuid.uuid4()
-        log.info(f"Generating new entry for user {decoded.get(SUB_CLAIM)} with UUID {dbperson.uuid}")
-        dbperson.registered_on = datetime.now(timezone.utc)
-        dbperson.oidc_claim_sub = decoded.get(SUB_CLAIM)
-        dbperson.name = decoded.get(NAME_CLAIM)
-        dbperson.email = decoded.get(EMAIL_CLAIM)
-        dbperson.bastion_login = FABRICSSHKey.bastion_login(dbperson.oidc_claim_sub, dbperson.email)
-        if check_unique:
-            ret = insert_unique_person(dbperson, session)
-            if ret == InsertOutcome.DUPLICATE_UPDATED:
-                log.warn(f"Updated existing entry instead of adding a new one for user {decoded.get(SUB_CLAIM)}"
-                         f"with UUID {dbperson.uuid}")
-            if ret == InsertOutcome.OK or ret == InsertOutcome.DUPLICATE_UPDATED:
-                session.commit()
-            else:
-                log.error(f"Unable to insert entry for user {decoded.get(SUB_CLAIM)} "
-                          f"with UUID {dbperson.uuid} due to {ret}")
-                return None
-        else:
-            session.add(dbperson)
-            session.commit()
-        pl = fill_people_long_from_person(dbperson)
-        return pl
-    finally:
-        session.close()
+    session = request_session()
+    dbperson = FabricPerson()
+    dbperson.uuid = uuid.uuid4()
+    log.info(f"Generating new entry for user {decoded.get(SUB_CLAIM)} with UUID {dbperson.uuid}")
+    dbperson.registered_on = datetime.now(timezone.utc)
+    dbperson.oidc_claim_sub = decoded.get(SUB_CLAIM)
+    dbperson.name = decoded.get(NAME_CLAIM)
+    dbperson.email = decoded.get(EMAIL_CLAIM)
+    dbperson.bastion_login = FABRICSSHKey.bastion_login(dbperson.oidc_claim_sub, dbperson.email)
+    if check_unique:
+        ret = insert_unique_person(dbperson, session)
+        if ret == InsertOutcome.DUPLICATE_UPDATED:
+            log.warn(f"Updated existing entry instead of adding a new one for user {decoded.get(SUB_CLAIM)}"
+                     f"with UUID {dbperson.uuid}")
+        if ret != InsertOutcome.OK and ret != InsertOutcome.DUPLICATE_UPDATED:
+            log.error(f"Unable to insert entry for user {decoded.get(SUB_CLAIM)} "
+                      f"with UUID {dbperson.uuid} due to {ret}")
+            return None
+    else:
+        session.add(dbperson)
+    # keep the new person even if the request fails later (e.g. they are not an active user yet)
+    session.commit()
+    pl = fill_people_long_from_person(dbperson)
+    return pl
+
+
+def make_etag(*parts) -> str:
+    """
+    Produce a strong ETag from the parts that make up the version of a resource
+    """
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def negotiated_etag(*parts) -> str:
+    """
+    make_etag() for resources returned by negotiated_response(), which also
+    depend on the format they are requested in
+    """
+    return make_etag(*parts, wants_msgpack())
+
+
+def etag_matches(headers, etag) -> bool:
+    """
+    Check if If-None-Match request header lists this ETag, in which case
+    the client already has the current version
+    """
+    if_none_match = headers.get(IF_NONE_MATCH)
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    # weak comparison is fine for GETs
+    if '*' in tags or etag in tags or 'W/' + etag in tags:
+        metrics.cache_hit(ETAG_CACHE)
+        return True
+    metrics.cache_miss(ETAG_CACHE)
+    return False
+
+
+def etag_mismatch(headers, etag) -> bool:
+    """
+    Check if If-Match request header is given and does not list this ETag, in
+    which case the client would overwrite changes it has not seen
+    """
+    if_match = headers.get(IF_MATCH)
+    if if_match is None:
+        return False
+    tags = [tag.strip() for tag in if_match.split(',')]
+    # strong comparison for changes
+    return '*' not in tags and etag not in tags
+
+
+def not_modified(etag, negotiated: bool = False):
+    """
+    Return a 304 with no body for a resource the client already has,
+    varying by Accept if it is returned by negotiated_response()
+    """
+    headers = {ETAG: etag}
+    if negotiated:
+        headers[VARY] = ACCEPT
+    return '', HTTPStatus.NOT_MODIFIED, headers
+
+
+def wants_msgpack() -> bool:
+    """
+    Check if the client prefers MessagePack to JSON (Accept header), and we can produce it
+    """
+    if msgpack is None:
+        return False
+    best = request.accept_mimetypes.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES, default=JSON_MIMETYPE)
+    return best in MSGPACK_MIMETYPES
+
+
+def msgpack_packer():
+    """
+    Packer for MessagePack responses built chunk by chunk, only when wants_msgpack()
+    """
+    return msgpack.Packer(default=str)
+
+
+def negotiated_response(body, status=HTTPStatus.OK, headers=None):
+    """
+    Return a response with the body encoded in MessagePack if the client asked
+    for it, otherwise leave it to connexion to encode it in JSON. Both have the
+    same structure.
+    """
+    headers = dict() if headers is None else dict(headers)
+    headers[VARY] = ACCEPT
+    if not wants_msgpack():
+        return body, status, headers
+    with timed_phase(SERIALIZATION_PHASE):
+        content = msgpack.packb(to_plain(body), default=str)
+    return Response(content, status=status, headers=headers, mimetype=MSGPACK_MIMETYPES[0])
 
 
 def dict_from_json_handle_none(j):
     """
-    Convert json into object (dict). If none, return empty dict
+    Return preferences stored as JSONB (already decoded by the driver). If none, return empty dict
     """
     if j is None:
         return dict()
-    return json.loads(j)
+    if isinstance(j, str):
+        # stored as a JSON string before migrations ran
+        return json.loads(j)
+    return j
+
 
+# how each PeopleLong attribute is filled from a FabricPerson
+PEOPLE_LONG_VALUES = {
+    'uuid': lambda person: person.uuid,
+    'name': lambda person: person.name,
+    'email': lambda person: person.email,
+    'eppn': lambda person: person.eppn if person.eppn != 'None' else '',
+    'oidc_claim_sub': lambda person: person.oidc_claim_sub,
+    'bastion_login': lambda person: person.bastion_login,
+    'prefs': lambda person: CompactPreferences(settings=dict_from_json_handle_none(person.settings),
+                                               permissions=dict_from_json_handle_none(person.permissions),
+                                               interests=dict_from_json_handle_none(person.interests)),
+}
 
-def fill_people_long_from_person(person):
+
+def parse_fields(fields, model_class) -> Tuple[Optional[Set[str]], Optional[str]]:
+    """
+    Check the attributes requested in a fields parameter against the model.
+    Return the set of requested attributes (None for all of them) and an error if any.
+    """
+    if fields is None or len(fields) == 0:
+        return None, None
+    known = list(model_class().swagger_types)
+    requested = {field.strip() for field in fields if field.strip() != ''}
+    unknown = requested.difference(known)
+    if len(unknown) > 0:
+        return None, f'Unknown fields {", ".join(sorted(unknown))}, valid fields are {", ".join(known)}'
+    return requested, None
+
+
+def fill_people_long_from_person(person, fields: Optional[Set[str]] = None):
     """
     Return a PeopleLong based on FabricPerson
     :param person:
+    :param fields: attributes to fill, all if None
     :return pl: a PeopleLong
     """
-    response = PeopleLong()
-
     # construct response object
-    response.uuid = person.uuid
-    response.name = person.name
-    response.email = person.email
-    response.oidc_claim_sub = person.oidc_claim_sub
-    response.bastion_login = person.bastion_login
-    if person.eppn != 'None':
-        response.eppn = person.eppn
-    else:
-        response.eppn = ''
-    response.prefs = Preferences(settings=dict_from_json_handle_none(person.settings),
-                                 permissions=dict_from_json_handle_none(person.permissions),
-                                 interests=dict_from_json_handle_none(person.interests))
+    response = CompactPeopleLong(**{name: value(person) for name, value in PEOPLE_LONG_VALUES.items()
+                                    if fields is None or name in fields})
     return response
 
 
@@ -373,15 +509,9 @@ def fill_people_short_from_person(person):
     :param person:
     :return ps: a PeopleShort
     """
-    ps = PeopleShort()
-    ps.email = person.email
-    ps.name = person.name
-    ps.uuid = person.uuid
-    ps.oidc_claim_sub = person.oidc_claim_sub
-    if person.eppn != 'None':
-        ps.eppn = person.eppn
-    else:
-        ps.eppn = ''
+    ps = CompactPeopleShort(uuid=person.uuid, name=person.name, email=person.email,
+                            eppn=person.eppn if person.eppn != 'None' else '',
+                            oidc_claim_sub=person.oidc_claim_sub)
     return ps
 
 
@@ -584,16 +714,3 @@ def comanage_get_person_identifier(co_person_id, identifier_type) -> str or None
                 person_id = identifier['Identifier']
                 break
     return person_id
-
-
-def get_gecos(person) -> str:
-    """
-    Produce a GECOS-formatted string based on db person info
-    """
-    return ','.join([
-        person.name.strip(),  # Full Name
-        '',  # Building, room number
-        '',  # Office telephone
-        '',  # Home telephone
-        person.email.strip() if person.email else person.eppn.strip() if person.eppn else ''  # external email or other contact info
-    ])
@@ -12,6 +12,17 @@ from swagger_server.test import BaseTestCase
 class TestDefaultController(BaseTestCase):
     """DefaultController integration test stubs"""
 
+    def test_metrics_get(self):
+        """Test case for metrics_get
+
+        metrics (open)
+        """
+        response = self.client.open(
+            '//metrics',
+            method='GET')
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
     def test_version_get(self):
         """Test case for version_get
 
@@ -0,0 +1,30 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+
+import json
+from datetime import datetime, timezone
+
+from swagger_server.encoder import JSONEncoder
+from swagger_server.models.ssh_key_long import SshKeyLong  # noqa: E501
+from swagger_server.test import BaseTestCase
+
+
+class TestJSONEncoder(BaseTestCase):
+    """JSONEncoder tests"""
+
+    def test_datetimes_match_standard_encoder(self):
+        """Datetimes are encoded the same with orjson as with the standard library encoder
+        """
+        key = SshKeyLong(key_uuid='key_uuid_example',
+                         created_on=datetime(2024, 1, 1, 0, 0, 0),
+                         expires_on=datetime(2024, 1, 2, 3, 4, 5, 678, tzinfo=timezone.utc))
+        encoded = JSONEncoder().encode(key)
+        standard = json.dumps(key, default=JSONEncoder().default)
+        self.assertEqual(json.loads(encoded), json.loads(standard))
+        self.assertEqual(json.loads(encoded)['created_on'], '2024-01-01T00:00:00Z')
+
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
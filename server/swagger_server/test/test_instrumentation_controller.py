@@ -0,0 +1,56 @@
+# coding: utf-8
+
+from __future__ import absolute_import
+
+from flask import json
+from six import BytesIO
+
+from swagger_server.models.memory_snapshot import MemorySnapshot  # noqa: E501
+from swagger_server.test import BaseTestCase
+
+
+class TestInstrumentationController(BaseTestCase):
+    """InstrumentationController integration test stubs"""
+
+    def test_instrumentation_tracemalloc_snapshot_get(self):
+        """Test case for instrumentation_tracemalloc_snapshot_get
+
+        take a snapshot of memory allocations in the worker answering the request (open only to administrators)
+        """
+        query_string = [('limit', 200),
+                        ('group_by', 'lineno')]
+        response = self.client.open(
+            '//instrumentation/tracemalloc/snapshot',
+            method='GET',
+            query_string=query_string)
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+    def test_instrumentation_tracemalloc_start_post(self):
+        """Test case for instrumentation_tracemalloc_start_post
+
+        start tracing memory allocations in the worker answering the request (open only to administrators)
+        """
+        query_string = [('frames', 100)]
+        response = self.client.open(
+            '//instrumentation/tracemalloc/start',
+            method='POST',
+            query_string=query_string)
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+    def test_instrumentation_tracemalloc_stop_post(self):
+        """Test case for instrumentation_tracemalloc_stop_post
+
+        stop tracing memory allocations in the worker answering the request (open only to administrators)
+        """
+        response = self.client.open(
+            '//instrumentation/tracemalloc/stop',
+            method='POST')
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
@@ -2,11 +2,19 @@
 
 from __future__ import absolute_import
 
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
 from flask import json
 from six import BytesIO
 
+from swagger_server.database import Session
+from swagger_server.database.models import FabricPerson, DbSshKey
+from swagger_server.response_code import utils
 from swagger_server.models.people_long import PeopleLong  # noqa: E501
 from swagger_server.models.people_short import PeopleShort  # noqa: E501
+from swagger_server.models.preference_type import PreferenceType  # noqa: E501
 from swagger_server.test import BaseTestCase
 
 
@@ -26,14 +34,31 @@ class TestPeopleController(BaseTestCase):
         self.assert200(response,
                        'Response body is : ' + response.data.decode('utf-8'))
 
+    def test_people_preferences_preftype_get(self):
+        """Test case for people_preferences_preftype_get
+
+        people whose preferences of a type contain a JSON value (interests open to any active user, settings only to administrators)
+        """
+        query_string = [('contains', 'contains_example'),
+                        ('offset', 0),
+                        ('limit', 1000)]
+        response = self.client.open(
+            '//people/preferences/{preftype}'.format(preftype=PreferenceType()),
+            method='GET',
+            query_string=query_string)
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
     def test_people_uuid_get(self):
         """Test case for people_uuid_get
 
         person details by UUID (open only to self)
         """
+        query_string = [('fields', 'fields_example')]
         response = self.client.open(
             '//people/{uuid}'.format(uuid='uuid_example'),
-            method='GET')
+            method='GET',
+            query_string=query_string)
         self.assert200(response,
                        'Response body is : ' + response.data.decode('utf-8'))
 
@@ -42,12 +67,58 @@ class TestPeopleController(BaseTestCase):
 
         Details about self from OIDC Claim sub provided in ID token; Creates new entry; (open only to self)
         """
+        query_string = [('fields', 'fields_example'),
+                        ('include', 'include_example')]
         response = self.client.open(
             '//people/whoami',
-            method='GET')
+            method='GET',
+            query_string=query_string)
         self.assert200(response,
                        'Response body is : ' + response.data.decode('utf-8'))
 
+    def test_people_whoami_get_backfilled_name_expired_key(self):
+        """Test case for people_whoami_get
+
+        include=sshkeys for a person whose name is backfilled from COmanage and who
+        has an expired key: expiring it and renumbering the keys of the renamed
+        person both take the key change lock and must not wait for each other
+        """
+        oidc_claim_sub = f'http://cilogon.org/serverT/users/{uuid.uuid4()}'
+        person_uuid = str(uuid.uuid4())
+        now = datetime.now(timezone.utc)
+        with Session() as session:
+            with session.begin():
+                session.add(FabricPerson(uuid=person_uuid, oidc_claim_sub=oidc_claim_sub, registered_on=now,
+                                         email='whoami@example.org', bastion_login='whoami_0000000001',
+                                         co_person_id=1))
+                session.add(DbSshKey(key_uuid=str(uuid.uuid4()), owner_uuid=person_uuid, comment='expired',
+                                     ssh_key_type='ssh-ed25519', public_key='AAAAC3NzaC1lZDI1NTE5',
+                                     fabric_key_type='bastion', created_on=now - timedelta(days=2),
+                                     expires_on=now - timedelta(days=1), active=True))
+        try:
+            with patch.object(utils, 'any_authenticated_user', return_value=True), \
+                    patch.object(utils, 'extract_oidc_claim', return_value=oidc_claim_sub), \
+                    patch.object(utils, 'comanage_check_active_person', return_value=(200, True, None)), \
+                    patch.object(utils, 'comanage_get_person_name', return_value=(200, 'Backfilled Name')):
+                response = self.client.open(
+                    '//people/whoami',
+                    method='GET',
+                    query_string=[('include', 'sshkeys')])
+            self.assert200(response,
+                           'Response body is : ' + response.data.decode('utf-8'))
+            self.assertEqual(response.json['name'], 'Backfilled Name')
+            self.assertEqual(response.json.get('sshkeys', []), [])
+            with Session() as session:
+                person = session.query(FabricPerson).filter(FabricPerson.uuid == person_uuid).one()
+                self.assertTrue(person.gecos.startswith('Backfilled Name,'))
+                key = session.query(DbSshKey).filter(DbSshKey.owner_uuid == person_uuid).one()
+                self.assertFalse(key.active)
+        finally:
+            with Session() as session:
+                with session.begin():
+                    session.query(DbSshKey).filter(DbSshKey.owner_uuid == person_uuid).delete()
+                    session.query(FabricPerson).filter(FabricPerson.uuid == person_uuid).delete()
+
     def test_uuid_oidc_claim_sub_get(self):
         """Test case for uuid_oidc_claim_sub_get
 
@@ -37,6 +37,20 @@ class TestPreferencesController(BaseTestCase):
         self.assert200(response,
                        'Response body is : ' + response.data.decode('utf-8'))
 
+    def test_preferences_preftype_uuid_patch(self):
+        """Test case for preferences_preftype_uuid_patch
+
+        merge changes into user preferences by type (open only to self)
+        """
+        body = None
+        response = self.client.open(
+            '//preferences/{preftype}/{uuid}'.format(uuid='uuid_example', preftype=PreferenceType()),
+            method='PATCH',
+            data=json.dumps(body),
+            content_type='application/merge-patch+json')
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
     def test_preferences_uuid_get(self):
         """Test case for preferences_uuid_get
 
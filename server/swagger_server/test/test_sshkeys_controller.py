@@ -6,22 +6,41 @@ from flask import json
 from six import BytesIO
 
 from swagger_server.models.ssh_key_bastion import SshKeyBastion  # noqa: E501
+from swagger_server.models.ssh_key_bastion_feed import SshKeyBastionFeed  # noqa: E501
 from swagger_server.models.ssh_key_long import SshKeyLong  # noqa: E501
 from swagger_server.models.ssh_key_pair import SshKeyPair  # noqa: E501
 from swagger_server.models.ssh_key_type import SshKeyType  # noqa: E501
+from swagger_server.models.ssh_key_upload import SshKeyUpload  # noqa: E501
+from swagger_server.models.ssh_key_upload_result import SshKeyUploadResult  # noqa: E501
 from swagger_server.test import BaseTestCase
 
 
 class TestSshkeysController(BaseTestCase):
     """SshkeysController integration test stubs"""
 
+    def test_authorizedkeys_login_get(self):
+        """Test case for authorizedkeys_login_get
+
+        Get authorized_keys lines of active bastion keys of a login for sshd AuthorizedKeysCommand (open to Bastion hosts)
+        """
+        query_string = [('secret', 'secret_example')]
+        response = self.client.open(
+            '//authorizedkeys/{login}'.format(login='login_example'),
+            method='GET',
+            query_string=query_string)
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
     def test_bastionkeys_get(self):
         """Test case for bastionkeys_get
 
         Get a list of bastion keys that were created, deactivated or expired since specified date in UTC (open to Bastion hosts)
         """
         query_string = [('secret', 'secret_example'),
-                        ('since_date', 'since_date_example')]
+                        ('since_date', 'since_date_example'),
+                        ('logins', 'logins_example'),
+                        ('shard', 56),
+                        ('shards', 4096)]
         response = self.client.open(
             '//bastionkeys',
             method='GET',
@@ -29,6 +48,57 @@ class TestSshkeysController(BaseTestCase):
         self.assert200(response,
                        'Response body is : ' + response.data.decode('utf-8'))
 
+    def test_bastionkeys_feed_get(self):
+        """Test case for bastionkeys_feed_get
+
+        Get bastion keys that were created, deactivated or expired after the provided cursor, in the order of changes (open to Bastion hosts)
+        """
+        query_string = [('secret', 'secret_example'),
+                        ('cursor', 'cursor_example'),
+                        ('limit', 2),
+                        ('wait', 0),
+                        ('logins', 'logins_example'),
+                        ('shard', 56),
+                        ('shards', 4096)]
+        response = self.client.open(
+            '//bastionkeys/feed',
+            method='GET',
+            query_string=query_string)
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+    def test_bastionkeys_snapshot_get(self):
+        """Test case for bastionkeys_snapshot_get
+
+        Get all active bastion keys as of a single point in the change feed, gzip-compressed if accepted, with the feed cursor to continue from (open to Bastion hosts)
+        """
+        query_string = [('secret', 'secret_example'),
+                        ('logins', 'logins_example'),
+                        ('shard', 56),
+                        ('shards', 4096)]
+        response = self.client.open(
+            '//bastionkeys/snapshot',
+            method='GET',
+            query_string=query_string)
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+    def test_sliverkeys_post(self):
+        """Test case for sliverkeys_post
+
+        Get active sliver keys of many users at once as a map of user UUID to a list of keys (open to services with the sliver keys secret)
+        """
+        body = ['body_example']
+        query_string = [('secret', 'secret_example')]
+        response = self.client.open(
+            '//sliverkeys',
+            method='POST',
+            data=json.dumps(body),
+            content_type='application/json',
+            query_string=query_string)
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
     def test_sshkey_keyid_delete(self):
         """Test case for sshkey_keyid_delete
 
@@ -45,9 +115,11 @@ class TestSshkeysController(BaseTestCase):
 
         get metadata, including expiration date for this key based on key UUID (open only to self)
         """
+        query_string = [('fields', 'fields_example')]
         response = self.client.open(
             '//sshkey/{keyid}'.format(keyid='keyid_example'),
-            method='GET')
+            method='GET',
+            query_string=query_string)
         self.assert200(response,
                        'Response body is : ' + response.data.decode('utf-8'))
 
@@ -84,9 +156,11 @@ class TestSshkeysController(BaseTestCase):
 
         Get a specific key of a given user (open to any valid user)
         """
+        query_string = [('fields', 'fields_example')]
         response = self.client.open(
             '//sshkey/{uuid}/{keyid}'.format(uuid='uuid_example', keyid='keyid_example'),
-            method='GET')
+            method='GET',
+            query_string=query_string)
         self.assert200(response,
                        'Response body is : ' + response.data.decode('utf-8'))
 
@@ -95,9 +169,25 @@ class TestSshkeysController(BaseTestCase):
 
         Get a list of all active/non-expired keys of this user (open to self)
         """
+        query_string = [('fields', 'fields_example')]
+        response = self.client.open(
+            '//sshkeys',
+            method='GET',
+            query_string=query_string)
+        self.assert200(response,
+                       'Response body is : ' + response.data.decode('utf-8'))
+
+    def test_sshkeys_post(self):
+        """Test case for sshkeys_post
+
+        Add multiple user-provided ssh public keys of specified types in one request. Returns per-key results. (open only to self)
+        """
+        body = [SshKeyUpload()]
         response = self.client.open(
             '//sshkeys',
-            method='GET')
+            method='POST',
+            data=json.dumps(body),
+            content_type='application/json')
         self.assert200(response,
                        'Response body is : ' + response.data.decode('utf-8'))
 